@@ -8,6 +8,8 @@ import os
 import xml.etree.ElementTree as ET
 from datetime import datetime
 
+from entity_ids import entity_id
+
 # Target information
 TARGET_INFO = {
     "address": "17642 BEACH HB CA 92647",
@@ -45,9 +47,10 @@ def add_target(db_path):
         ''')
         
         cursor.execute('''
-            INSERT OR IGNORE INTO entities (name, type, source_tool, confidence)
-            VALUES (?, ?, ?, ?)
-        ''', (TARGET_INFO["address"], TARGET_INFO["type"], TARGET_INFO["source"], TARGET_INFO["confidence"]))
+            INSERT OR IGNORE INTO entities (id, name, type, source_tool, confidence)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (entity_id(TARGET_INFO["type"], TARGET_INFO["address"]), TARGET_INFO["address"], TARGET_INFO["type"],
+              TARGET_INFO["source"], TARGET_INFO["confidence"]))
         print(f"[+] Added target: {TARGET_INFO['address']}")
     except Exception as e:
         print(f"[-] Error storing target: {e}")
@@ -55,22 +58,25 @@ def add_target(db_path):
     conn.commit()
     conn.close()
 
-def find_correlations(db_path):
-    """Find correlations for the target"""
+def find_correlations(db_path, conn=None):
+    """Find correlations for the target, reusing conn when one is given"""
     print("[+] Finding correlations for target")
     
-    conn = sqlite3.connect(db_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
-    # Find entities that might be related to the target
+    # Find entities that might be related to the target. One branch per side the
+    # address is on: an OR across both sides is checked for every pair (see query_audit.py)
     cursor.execute('''
         SELECT e1.id, e1.name, e1.type, e2.id, e2.name, e2.type
         FROM entities e1, entities e2
-        WHERE e1.id < e2.id
-        AND (
-            (e1.type = 'physical_address' AND e2.type != 'physical_address')
-            OR (e2.type = 'physical_address' AND e1.type != 'physical_address')
-        )
+        WHERE e1.type = 'physical_address' AND e2.type != 'physical_address' AND e1.id < e2.id
+        UNION ALL
+        SELECT e1.id, e1.name, e1.type, e2.id, e2.name, e2.type
+        FROM entities e1, entities e2
+        WHERE e2.type = 'physical_address' AND e1.type != 'physical_address' AND e1.id < e2.id
     ''')
     
     correlations = cursor.fetchall()
@@ -87,7 +93,8 @@ def find_correlations(db_path):
             print(f"[-] Error storing correlation: {e}")
     
     conn.commit()
-    conn.close()
+    if own_conn:
+        conn.close()
     
     print(f"[+] Found {len(correlations)} correlations")
 
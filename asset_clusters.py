@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Asset clusters maintained incrementally with a persisted union-find
+
+Every entity carries the id of its cluster root in entities.cluster_id (NULL
+for entities with no relationships), so "which assets belong together" is one
+indexed lookup instead of a graph walk. New relationships are folded in by
+union-by-size over only the touched roots, with path compression in memory and
+a fully compressed forest written back, and per-cluster size and type counts
+are kept in clusters / cluster_types.
+"""
+
+import argparse
+import sqlite3
+import sys
+
+CLUSTER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS clusters (
+        id INTEGER PRIMARY KEY,
+        size INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS cluster_types (
+        cluster_id INTEGER,
+        type TEXT,
+        count INTEGER,
+        PRIMARY KEY (cluster_id, type)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS cluster_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''',
+]
+
+DEFAULT_BATCH_SIZE = 100000
+
+# Edges between different owners' assets, never merged into one cluster
+UNCLUSTERED_TYPES = ('lookalike',)
+
+
+def setup_clusters(conn):
+    """Create cluster tables and the entities.cluster_id column"""
+    for statement in CLUSTER_SCHEMA:
+        conn.execute(statement)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(entities)")]
+    if 'cluster_id' not in columns:
+        conn.execute("ALTER TABLE entities ADD COLUMN cluster_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entities_cluster ON entities (cluster_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clusters_size ON clusters (size)")
+    conn.commit()
+
+
+class DisjointSet:
+    """Union-find over the entities touched by new edges, loaded from the database on demand"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.parent = {}
+        self.stored = {}
+        self.size = {}
+        self.types = {}
+        self.absorbed = set()
+
+    def load(self, entity_id):
+        row = self.conn.execute("SELECT cluster_id, type FROM entities WHERE id = ?", (entity_id,)).fetchone()
+        if row is None:
+            # Edge to a deleted entity, an empty singleton that does not count towards sizes
+            row = (None, None)
+        root = row[0] if row[0] is not None else entity_id
+        # A root seen earlier in this batch keeps its in-memory stats, even once absorbed
+        known = root in self.parent
+        self.stored[entity_id] = row[0]
+        self.parent[entity_id] = root
+
+        if not known:
+            self.parent.setdefault(root, root)
+            if row[0] is None:
+                self.size[root] = 1 if row[1] is not None else 0
+                self.types[root] = {row[1]: 1} if row[1] is not None else {}
+            else:
+                self.size[root] = (self.conn.execute(
+                    "SELECT size FROM clusters WHERE id = ?", (root,)
+                ).fetchone() or (1,))[0]
+                self.types[root] = dict(self.conn.execute(
+                    "SELECT type, count FROM cluster_types WHERE cluster_id = ?", (root,)
+                ))
+
+    def find(self, entity_id):
+        if entity_id not in self.parent:
+            self.load(entity_id)
+        root = entity_id
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[entity_id] != root:
+            self.parent[entity_id], entity_id = root, self.parent[entity_id]
+        return root
+
+    def union(self, a, b):
+        """Merge the clusters of a and b, returns True if they were separate"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        types = self.types[root_a]
+        for entity_type, count in self.types.pop(root_b).items():
+            types[entity_type] = types.get(entity_type, 0) + count
+        self.absorbed.add(root_b)
+        return True
+
+    def flush(self):
+        """Write roots and cluster statistics back, relabelling absorbed clusters"""
+        conn = self.conn
+        # Members of absorbed clusters that were never loaded still point at the old root
+        conn.executemany(
+            "UPDATE entities SET cluster_id = ? WHERE cluster_id = ?",
+            [(self.find(root), root) for root in self.absorbed]
+        )
+        conn.executemany(
+            "UPDATE entities SET cluster_id = ? WHERE id = ?",
+            [(self.find(entity_id), entity_id) for entity_id, stored in self.stored.items()
+             if stored != self.find(entity_id)]
+        )
+
+        conn.executemany("DELETE FROM clusters WHERE id = ?", [(root,) for root in self.absorbed])
+        conn.executemany("DELETE FROM cluster_types WHERE cluster_id = ?",
+                         [(root,) for root in self.absorbed | set(self.size)])
+        conn.executemany("INSERT OR REPLACE INTO clusters (id, size) VALUES (?, ?)", self.size.items())
+        conn.executemany(
+            "INSERT INTO cluster_types (cluster_id, type, count) VALUES (?, ?, ?)",
+            [(root, entity_type, count) for root, types in self.types.items() for entity_type, count in types.items()]
+        )
+
+
+def update_clusters(conn, batch_size=DEFAULT_BATCH_SIZE):
+    """Fold relationships added since the last update into the clusters, returns merges"""
+    setup_clusters(conn)
+    row = conn.execute("SELECT value FROM cluster_state WHERE key = 'last_relationship_id'").fetchone()
+    last_id = row[0] if row else 0
+    merges = 0
+
+    while True:
+        edges = conn.execute(f'''
+            SELECT id, entity1_id, entity2_id FROM relationships
+            WHERE id > ? AND relationship_type NOT IN ({','.join('?' * len(UNCLUSTERED_TYPES))})
+            ORDER BY id LIMIT ?
+        ''', (last_id, *UNCLUSTERED_TYPES, batch_size)).fetchall()
+        if not edges:
+            break
+
+        forest = DisjointSet(conn)
+        for _, entity1_id, entity2_id in edges:
+            merges += forest.union(entity1_id, entity2_id)
+        last_id = edges[-1][0]
+
+        with conn:
+            forest.flush()
+            conn.execute(
+                "INSERT OR REPLACE INTO cluster_state (key, value) VALUES ('last_relationship_id', ?)",
+                (last_id,)
+            )
+
+    return merges
+
+
+def rebuild_clusters(conn):
+    """Recompute every cluster from scratch, needed after relationships are deleted"""
+    setup_clusters(conn)
+    with conn:
+        conn.execute("UPDATE entities SET cluster_id = NULL WHERE cluster_id IS NOT NULL")
+        conn.execute("DELETE FROM clusters")
+        conn.execute("DELETE FROM cluster_types")
+        conn.execute("DELETE FROM cluster_state WHERE key = 'last_relationship_id'")
+    return update_clusters(conn)
+
+
+def check_clusters(conn):
+    """Return a list of mismatches between cluster statistics and entities.cluster_id"""
+    problems = []
+    total, clustered = conn.execute('''
+        SELECT (SELECT COALESCE(SUM(size), 0) FROM clusters),
+               (SELECT COUNT(*) FROM entities WHERE cluster_id IS NOT NULL)
+    ''').fetchone()
+    if total != clustered:
+        problems.append(f"cluster sizes add up to {total}, {clustered} entities are clustered")
+    for cluster_id, size, members in conn.execute('''
+        SELECT c.id, c.size, (SELECT COUNT(*) FROM entities e WHERE e.cluster_id = c.id)
+        FROM clusters c
+    ''').fetchall():
+        if size != members:
+            problems.append(f"cluster {cluster_id} has size {size} but {members} members")
+    orphans = conn.execute(
+        "SELECT COUNT(*) FROM cluster_types WHERE cluster_id NOT IN (SELECT id FROM clusters)"
+    ).fetchone()[0]
+    if orphans:
+        problems.append(f"{orphans} cluster_types rows for clusters that no longer exist")
+    return problems
+
+
+def largest_clusters(conn, limit=20):
+    """Return (cluster_id, size, root name, {type: count}) for the biggest clusters"""
+    clusters = []
+    for cluster_id, size, name in conn.execute('''
+        SELECT c.id, c.size, e.name FROM clusters c
+        LEFT JOIN entities e ON e.id = c.id
+        ORDER BY c.size DESC LIMIT ?
+    ''', (limit,)).fetchall():
+        types = dict(conn.execute("SELECT type, count FROM cluster_types WHERE cluster_id = ?", (cluster_id,)))
+        clusters.append((cluster_id, size, name, types))
+    return clusters
+
+
+def cluster_members(conn, name):
+    """Return the members of the cluster the named entity belongs to"""
+    row = conn.execute("SELECT id, cluster_id FROM entities WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        return []
+    if row[1] is None:
+        return conn.execute("SELECT name, type FROM entities WHERE id = ?", (row[0],)).fetchall()
+    return conn.execute("SELECT name, type FROM entities WHERE cluster_id = ? ORDER BY type, name",
+                        (row[1],)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Asset clusters (connected groups of entities) in the correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Fold new relationships into the clusters
+  %(prog)s results/correlations.db update
+
+  # Everything in the same asset group as a host
+  %(prog)s results/correlations.db show www.example.com
+
+  # Largest clusters with their type breakdown
+  %(prog)s results/correlations.db list -n 10
+
+  # Verify cluster sizes against entities
+  %(prog)s results/correlations.db check
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("update", help="Apply relationships added since the last update")
+    subparsers.add_parser("rebuild", help="Recompute all clusters from the relationships")
+    subparsers.add_parser("check", help="Verify cluster sizes against entities")
+
+    show_parser = subparsers.add_parser("show", help="List the cluster of an entity")
+    show_parser.add_argument("name", help="Entity name")
+
+    list_parser = subparsers.add_parser("list", help="List the largest clusters")
+    list_parser.add_argument("-n", "--limit", type=int, default=20, help="Clusters to show")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(args.database)
+        setup_clusters(conn)
+
+        if args.command == "update":
+            print(f"[+] {update_clusters(conn)} clusters merged")
+        elif args.command == "rebuild":
+            print(f"[+] Clusters rebuilt with {rebuild_clusters(conn)} merges")
+        elif args.command == "check":
+            problems = check_clusters(conn)
+            for problem in problems:
+                print(f"[-] {problem}")
+            if problems:
+                sys.exit(1)
+            print("[+] Cluster statistics match entities")
+        elif args.command == "show":
+            for name, entity_type in cluster_members(conn, args.name):
+                print(f"{name} ({entity_type})")
+        else:
+            for cluster_id, size, name, types in largest_clusters(conn, args.limit):
+                breakdown = ', '.join(f"{count} {entity_type}" for entity_type, count in sorted(types.items()))
+                print(f"{cluster_id}: {size} entities around {name} ({breakdown})")
+
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Scheduled attack-surface monitoring for an asset inventory
+
+Long-running alternative to cron'ing enhanced_multi_tool.sh once per domain.
+Jobs are kept in a priority queue ordered by (next due time, weight); a job is
+never started while the previous run of the same tool on the same target is
+still active, and at most max_heavy_jobs heavy tools run at once. Workers hand
+their records over in chunks through a bounded queue, and the scheduler thread
+writes them through one warm database connection as they arrive.
+"""
+
+import argparse
+import heapq
+import io
+import itertools
+import os
+import queue
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from multi_tool_linker import DEFAULT_CONFIG, MultiToolLinker, load_config, parse_hostname_list
+from rate_limiter import throttled
+from result_storage import open_result_writer
+
+# Tools driven through MultiToolLinker methods
+LINKER_TOOLS = {
+    'theharvester': 'run_theharvester',
+    'recon-ng': 'run_recon_ng',
+    'spiderfoot': 'run_spiderfoot',
+}
+
+# External tools run directly, their stdout is kept under <output>/<tool>/
+EXTERNAL_TOOLS = ['nmap', 'amass', 'subfinder', 'assetfinder', 'dnsrecon', 'fierce']
+
+# External tools whose stdout lists hostnames, one per line (see parse_hostname_list)
+HOSTNAME_LIST_TOOLS = {'amass', 'subfinder', 'assetfinder', 'dnsrecon', 'fierce'}
+
+# Tools whose stdout is not plain text, by result file extension
+RESULT_EXTENSIONS = {'nmap': 'xml'}
+
+# recon-ng always exports to the same CSV path, so only one may run at a time
+EXCLUSIVE_TOOLS = {'recon-ng'}
+
+DEFAULT_HEAVY_TOOLS = ['nmap', 'amass', 'spiderfoot']
+DEFAULT_INTERVAL = 86400
+
+# Records a worker hands to the scheduler at a time
+RECORD_CHUNK_SIZE = 5000
+
+
+def build_command(tool, target, options=""):
+    """Return the command line for an external tool"""
+    extra = options.split() if options else []
+    if tool == 'nmap':
+        # XML on stdout keeps ports, services and OS guesses for ingestion
+        return ['nmap', *extra, '-oX', '-', target]
+    if tool == 'amass':
+        return ['amass', *(extra or ['enum']), '-d', target]
+    if tool == 'subfinder':
+        return ['subfinder', '-d', target, '-silent']
+    if tool == 'assetfinder':
+        return ['assetfinder', target]
+    if tool == 'dnsrecon':
+        return ['dnsrecon', '-d', target, *extra]
+    if tool == 'fierce':
+        return ['fierce', '--domain', target]
+    raise ValueError(f"Unknown tool {tool}")
+
+
+def result_file(output_dir, tool, target):
+    """Path of a tool's raw output for target, before any compression suffix"""
+    return os.path.join(output_dir, tool, f"{tool}_{target}.{RESULT_EXTENSIONS.get(tool, 'txt')}")
+
+
+class AttackSurfaceMonitor:
+    def __init__(self, targets, output_dir="./results", config=None):
+        self.targets = targets
+        self.config = config or {}
+        self.linker = MultiToolLinker(output_dir, self.config)
+
+        monitor_config = self.config.get('monitor', {})
+        self.default_interval = monitor_config.get('default_interval', DEFAULT_INTERVAL)
+        self.intervals = monitor_config.get('intervals', {})
+        self.max_jobs = monitor_config.get('max_jobs', 4)
+        self.max_heavy_jobs = monitor_config.get('max_heavy_jobs', 1)
+        self.heavy_tools = set(monitor_config.get('heavy_tools', DEFAULT_HEAVY_TOOLS))
+        self.retry_seconds = monitor_config.get('retry_seconds', 30)
+        self.stagger_seconds = monitor_config.get('stagger_seconds', 10)
+        self.correlate_interval = monitor_config.get('correlate_interval', 600)
+
+        self.tools = self.enabled_tools()
+        self.jobs = []
+        self.sequence = itertools.count()
+        self.active = set()
+        self.heavy_running = 0
+        # Record chunks and finished jobs; bounded so a fast tool waits for the writer
+        self.completed = queue.Queue(maxsize=self.max_jobs * 2)
+        self.stored = {}
+        self.stopping = False
+        self.once = False
+        self.needs_correlation = False
+        self.last_correlation = 0.0
+
+        # Warm connection used only by the scheduler thread for all writes
+        self.conn = sqlite3.connect(self.linker.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+    def enabled_tools(self):
+        """Return tools that are enabled in config.json and installed"""
+        tools_config = self.config.get('tools', {})
+        tools = []
+        for tool in list(LINKER_TOOLS) + EXTERNAL_TOOLS:
+            if not tools_config.get(tool, {}).get('enabled', True):
+                continue
+            if tool == 'spiderfoot':
+                installed = os.path.exists(self.linker.spiderfoot_path)
+            else:
+                installed = shutil.which('theHarvester' if tool == 'theharvester' else tool) is not None
+            if not installed:
+                print(f"[!] {tool} is not installed, not scheduling it")
+                continue
+            tools.append(tool)
+        return tools
+
+    def interval(self, tool):
+        return self.intervals.get(tool, self.default_interval)
+
+    def schedule(self, due, target, tool):
+        """Queue a job, light tools sort ahead of heavy ones due at the same time"""
+        weight = 1 if tool in self.heavy_tools else 0
+        heapq.heappush(self.jobs, (due, weight, next(self.sequence), target, tool))
+
+    def admit(self, target, tool):
+        """Decide whether a due job can start now: 'run', 'skip' or 'defer'"""
+        if (target, tool) in self.active:
+            return 'skip'
+        if len(self.active) >= self.max_jobs:
+            return 'defer'
+        if tool in self.heavy_tools and self.heavy_running >= self.max_heavy_jobs:
+            return 'defer'
+        if tool in EXCLUSIVE_TOOLS and any(active_tool == tool for _, active_tool in self.active):
+            return 'defer'
+        # Do not tie up a worker waiting for upstream quota
+        if self.linker.rate_limiter.delay(tool) > 0:
+            return 'defer'
+        return 'run'
+
+    def run_tool(self, target, tool):
+        """Run one tool against one target in a worker thread, returns the records handed over"""
+        # Tool runners are generators; drain them here so the work stays on the worker
+        sent = 0
+        records = self.tool_records(target, tool)
+        while True:
+            chunk = list(itertools.islice(records, RECORD_CHUNK_SIZE))
+            if not chunk:
+                return sent
+            self.completed.put(('records', target, tool, chunk))
+            sent += len(chunk)
+
+    def tool_records(self, target, tool):
+        """Yield the entity records of one tool run"""
+        if tool in LINKER_TOOLS:
+            yield from getattr(self.linker, LINKER_TOOLS[tool])(target)
+            return
+
+        tool_config = self.config.get('tools', {}).get(tool, {})
+        cmd = build_command(tool, target, tool_config.get('options', ''))
+        limiter = self.linker.rate_limiter
+        limiter.acquire(tool)
+        try:
+            # stderr would corrupt XML output
+            result = subprocess.run(cmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL if tool in RESULT_EXTENSIONS else subprocess.STDOUT,
+                                    text=True, timeout=tool_config.get('timeout', 600))
+        except subprocess.TimeoutExpired:
+            limiter.report(tool, True)
+            raise
+        # stderr is merged into stdout for everything but XML
+        limiter.report(tool, tool not in RESULT_EXTENSIONS and throttled(result.stdout))
+
+        path = result_file(self.linker.output_dir, tool, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open_result_writer(path, self.linker.compression) as f:
+            f.write(result.stdout)
+
+        if tool in HOSTNAME_LIST_TOOLS:
+            records = parse_hostname_list(io.StringIO(result.stdout), target, tool)
+            yield from self.linker.filter_wildcards(records)
+
+    def start(self, executor, target, tool):
+        self.active.add((target, tool))
+        if tool in self.heavy_tools:
+            self.heavy_running += 1
+        started = time.time()
+        print(f"[i] {datetime.now():%H:%M:%S} {tool} started on {target}")
+
+        executor.submit(self.run_job, target, tool, started)
+
+    def run_job(self, target, tool, started):
+        """Worker entry point, always reports the job back to the scheduler from this thread"""
+        error = None
+        try:
+            self.run_tool(target, tool)
+        except Exception as e:
+            error = e
+        self.completed.put(('done', target, tool, started, error))
+
+    def handle(self, kind, target, tool, *details):
+        """Process one item from a worker: a chunk of records or a finished job"""
+        if kind == 'records':
+            chunk, = details
+            self.stored[(target, tool)] = (self.stored.get((target, tool), 0)
+                                           + self.linker.store_entities(chunk, conn=self.conn, verbose=False))
+            self.needs_correlation = True
+        else:
+            self.finish(target, tool, *details)
+
+    def finish(self, target, tool, started, error):
+        """Report a finished job, whose records are already stored, and schedule its next run"""
+        self.active.discard((target, tool))
+        if tool in self.heavy_tools:
+            self.heavy_running -= 1
+        stored = self.stored.pop((target, tool), 0)
+
+        try:
+            if error is not None:
+                raise error
+            if tool == 'nmap':
+                self.linker.ingest_nmap(result_file(self.linker.output_dir, tool, target), conn=self.conn)
+                self.needs_correlation = True
+            print(f"[+] {datetime.now():%H:%M:%S} {tool} finished on {target}: {stored} entities "
+                  f"in {time.time() - started:.0f}s")
+        except Exception as e:
+            print(f"[-] {tool} failed on {target}: {e}")
+
+        if self.once:
+            return
+        # Cadence is measured from the start, an overrunning job just runs again when it can
+        self.schedule(max(started + self.interval(tool), time.time()), target, tool)
+
+    def correlate(self):
+        """Refresh correlations and confidence after new results came in"""
+        self.linker.find_correlations(conn=self.conn)
+        self.linker.rescore_confidence()
+        self.linker.flush_name_filter()
+        self.needs_correlation = False
+        self.last_correlation = time.time()
+
+    def dispatch(self, executor):
+        """Start every due job that can be admitted, returns seconds until the next one"""
+        now = time.time()
+        deferred = []
+        while self.jobs and self.jobs[0][0] <= now:
+            due, weight, _, target, tool = heapq.heappop(self.jobs)
+            decision = self.admit(target, tool)
+            if decision == 'run':
+                self.start(executor, target, tool)
+            elif decision == 'skip':
+                print(f"[!] {tool} still running on {target}, skipping this slot")
+                self.schedule(now + self.interval(tool), target, tool)
+            else:
+                deferred.append((target, tool))
+
+        # Blocked jobs retry later, lighter jobs behind them were still started
+        for target, tool in deferred:
+            self.schedule(now + self.retry_seconds, target, tool)
+
+        if not self.jobs:
+            return self.retry_seconds
+        return max(0.0, self.jobs[0][0] - now)
+
+    def stop(self, *_):
+        print("\n[!] Stopping monitor after running jobs finish")
+        self.stopping = True
+
+    def run(self, once=False):
+        """Run the scheduler loop until stopped (or one pass with once=True)"""
+        self.once = once
+        now = time.time()
+        for index, (target, tool) in enumerate(itertools.product(self.targets, self.tools)):
+            self.schedule(now + index * self.stagger_seconds, target, tool)
+        print(f"[+] Monitoring {len(self.targets)} targets with {len(self.tools)} tools")
+
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            while not self.stopping:
+                wait = self.dispatch(executor)
+                if once and not self.active and not self.jobs:
+                    break
+                try:
+                    self.handle(*self.completed.get(timeout=min(wait, self.retry_seconds)))
+                    while True:
+                        self.handle(*self.completed.get_nowait())
+                except queue.Empty:
+                    pass
+
+                if self.needs_correlation and time.time() - self.last_correlation >= self.correlate_interval:
+                    self.correlate()
+
+            # Workers block on the bounded queue, keep draining until the running jobs are done
+            while self.active:
+                self.handle(*self.completed.get())
+
+        if self.needs_correlation:
+            self.correlate()
+        self.linker.flush_name_filter()
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scheduled attack-surface monitoring of owned assets",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Monitor two domains with the cadence from config.json
+  %(prog)s example.com example.org -o ./monitor_results
+
+  # Read targets from a file (one per line) and run every tool once
+  %(prog)s -f assets.txt --once
+"""
+    )
+    parser.add_argument("targets", nargs='*', help="Domains to monitor")
+    parser.add_argument("-f", "--targets-file", help="File with one target per line")
+    parser.add_argument("-o", "--output", default="./results", help="Output directory")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    parser.add_argument("--once", action="store_true", help="Run each tool once per target, then exit")
+
+    args = parser.parse_args()
+
+    targets = list(args.targets)
+    if args.targets_file:
+        with open(args.targets_file, 'r') as f:
+            targets.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if not targets:
+        parser.error("no targets given")
+
+    monitor = AttackSurfaceMonitor(targets, args.output, load_config(args.config))
+    signal.signal(signal.SIGINT, monitor.stop)
+    signal.signal(signal.SIGTERM, monitor.stop)
+
+    try:
+        monitor.run(once=args.once)
+    except Exception as e:
+        print(f"[-] Monitor error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
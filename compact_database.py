@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Deduplicate and compact a correlation database
+
+Relationships are keyed canonically by (lower entity id, higher entity id,
+relationship type). Duplicate edges left by older runs are merged into one
+row (highest confidence, combined source tools) before the unique indexes are
+created, then the database is rewritten with VACUUM INTO to reclaim space.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+# Canonical keys: one edge per (lower id, higher id, type), one observation per source
+UNIQUE_INDEXES = {
+    'relationships': '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_relationships_edge
+        ON relationships (entity1_id, entity2_id, relationship_type)
+    ''',
+    'entity_observations': '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_observations_source
+        ON entity_observations (entity_id, source_tool)
+    ''',
+    'relationship_observations': '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_relationship_observations_source
+        ON relationship_observations (relationship_id, source_tool)
+    ''',
+}
+
+
+def table_exists(conn, table):
+    """Check whether a table exists in the database"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def deduplicate_relationships(conn):
+    """Merge duplicate edges under their canonical key, returns rows removed"""
+    cursor = conn.cursor()
+
+    # Order endpoints so (a, b) and (b, a) share a key
+    cursor.execute('''
+        UPDATE relationships
+        SET entity1_id = entity2_id, entity2_id = entity1_id
+        WHERE entity1_id > entity2_id
+    ''')
+
+    cursor.execute("DROP TABLE IF EXISTS temp.edge_merge")
+    cursor.execute('''
+        CREATE TEMP TABLE edge_merge AS
+        SELECT MIN(id) AS keep_id,
+               MAX(confidence) AS confidence,
+               group_concat(DISTINCT source_tool) AS source_tool
+        FROM relationships
+        GROUP BY entity1_id, entity2_id, relationship_type
+        HAVING COUNT(*) > 1
+    ''')
+
+    cursor.execute("DROP TABLE IF EXISTS temp.edge_map")
+    cursor.execute('''
+        CREATE TEMP TABLE edge_map AS
+        SELECT id, keep_id FROM (
+            SELECT id, MIN(id) OVER (
+                PARTITION BY entity1_id, entity2_id, relationship_type
+            ) AS keep_id
+            FROM relationships
+        )
+        WHERE id != keep_id
+    ''')
+
+    cursor.execute('''
+        UPDATE relationships
+        SET confidence = m.confidence, source_tool = m.source_tool
+        FROM edge_merge m
+        WHERE relationships.id = m.keep_id
+    ''')
+
+    if table_exists(conn, 'relationship_observations'):
+        cursor.execute('''
+            UPDATE relationship_observations
+            SET relationship_id = m.keep_id
+            FROM edge_map m
+            WHERE relationship_observations.relationship_id = m.id
+        ''')
+
+    cursor.execute("DELETE FROM relationships WHERE id IN (SELECT id FROM edge_map)")
+    removed = cursor.rowcount
+
+    cursor.execute("DROP TABLE temp.edge_merge")
+    cursor.execute("DROP TABLE temp.edge_map")
+    return removed
+
+
+def deduplicate_observations(conn):
+    """Keep only the latest observation per (row, source tool)"""
+    for table, key_col in (('entity_observations', 'entity_id'),
+                           ('relationship_observations', 'relationship_id')):
+        if table_exists(conn, table):
+            conn.execute(f'''
+                DELETE FROM {table}
+                WHERE rowid NOT IN (
+                    SELECT MAX(rowid) FROM {table} GROUP BY {key_col}, source_tool
+                )
+            ''')
+
+
+def create_unique_indexes(conn):
+    """Create the canonical unique indexes on the tables present"""
+    for table, statement in UNIQUE_INDEXES.items():
+        if table_exists(conn, table):
+            conn.execute(statement)
+
+
+def ensure_unique_indexes(conn):
+    """Create the canonical unique indexes, merging duplicates first if needed"""
+    try:
+        create_unique_indexes(conn)
+    except sqlite3.IntegrityError:
+        print("[!] Duplicate relationships found, merging them under canonical keys")
+        removed = deduplicate_relationships(conn)
+        deduplicate_observations(conn)
+        create_unique_indexes(conn)
+        print(f"[+] Removed {removed} duplicate relationships")
+    conn.commit()
+
+
+def compact_database(db_path, output_path=None):
+    """Deduplicate db_path and rewrite it compactly to output_path (default: in place)"""
+    print(f"[+] Compacting {db_path}")
+    size_before = os.path.getsize(db_path)
+    temp_path = f"{output_path or db_path}.compact-tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    # Snapshot first so the source is never left half-deduplicated
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM INTO ?", (temp_path,))
+    conn.close()
+
+    conn = sqlite3.connect(temp_path)
+    try:
+        removed = deduplicate_relationships(conn)
+        deduplicate_observations(conn)
+        create_unique_indexes(conn)
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(temp_path, output_path or db_path)
+    size_after = os.path.getsize(output_path or db_path)
+
+    print(f"[+] Removed {removed} duplicate relationships")
+    print(f"[+] Size: {size_before} -> {size_after} bytes")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Deduplicate relationships and reclaim space in a correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compact in place (stop writers first)
+  %(prog)s results/correlations.db
+
+  # Write a compacted copy and leave the original untouched
+  %(prog)s results/correlations.db -o results/correlations.compact.db
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("-o", "--output", help="Write the compacted database here instead of replacing the original")
+
+    args = parser.parse_args()
+
+    try:
+        compact_database(args.database, args.output)
+    except Exception as e:
+        print(f"[-] Error compacting database: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Vectorized confidence scoring for the correlation database
+
+Every tool sighting of an entity or relationship is kept as an observation.
+Combined confidence is recomputed from those observations in numpy batches:
+each observation is decayed by its age and the results are merged with a
+noisy-OR (1 - prod(1 - c)) per entity / relationship.
+"""
+
+import argparse
+import sqlite3
+import sys
+
+import numpy as np
+
+# Observation tables and the id column that ties them to their target table
+OBSERVATION_TABLES = {
+    'entities': ('entity_observations', 'entity_id'),
+    'relationships': ('relationship_observations', 'relationship_id'),
+}
+
+DEFAULT_HALF_LIFE_DAYS = 180.0
+DEFAULT_BATCH_SIZE = 500000
+
+# Keep log1p(-c) finite for confidence 1.0 (manual input)
+MAX_CONFIDENCE = 1.0 - 1e-12
+
+
+def ensure_observation_tables(conn):
+    """Create observation tables for databases written by older scripts"""
+    for obs_table, key_col in OBSERVATION_TABLES.values():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {obs_table} (
+                {key_col} INTEGER,
+                source_tool TEXT,
+                confidence REAL,
+                observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def backfill_observations(conn, table):
+    """Seed observations from the stored confidence of rows that have none"""
+    obs_table, key_col = OBSERVATION_TABLES[table]
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    observed_at = "created_at" if "created_at" in columns else "CURRENT_TIMESTAMP"
+
+    cursor = conn.execute(f'''
+        INSERT INTO {obs_table} ({key_col}, source_tool, confidence, observed_at)
+        SELECT t.id, t.source_tool, COALESCE(t.confidence, 0), {observed_at}
+        FROM {table} t
+        WHERE NOT EXISTS (SELECT 1 FROM {obs_table} o WHERE o.{key_col} = t.id)
+    ''')
+    return cursor.rowcount
+
+
+def combine_batch(log_survival, counts, ids, confidences, ages, half_life_days):
+    """Fold one batch of observations into the per-id accumulators"""
+    decayed = confidences * np.exp2(-np.clip(ages, 0, None) / half_life_days)
+    decayed = np.clip(decayed, 0.0, MAX_CONFIDENCE)
+    log_survival += np.bincount(ids, weights=np.log1p(-decayed), minlength=len(log_survival))
+    counts += np.bincount(ids, minlength=len(counts))
+
+
+def score_table(conn, table, half_life_days=DEFAULT_HALF_LIFE_DAYS, batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute combined confidence for every row of table, returns (ids, scores)"""
+    obs_table, key_col = OBSERVATION_TABLES[table]
+
+    # Entity ids are 63-bit hashes, accumulate by position in the sorted id list instead
+    keys = np.array([row[0] for row in conn.execute(
+        f"SELECT DISTINCT {key_col} FROM {obs_table} WHERE {key_col} IS NOT NULL ORDER BY {key_col}"
+    )], dtype=np.int64)
+    if not len(keys):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    log_survival = np.zeros(len(keys))
+    counts = np.zeros(len(keys), dtype=np.int64)
+
+    cursor = conn.execute(f'''
+        SELECT {key_col}, confidence, julianday('now') - julianday(observed_at)
+        FROM {obs_table} WHERE {key_col} IS NOT NULL
+    ''')
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        # Ids stay int64, float64 would round hashed ids
+        positions = np.searchsorted(keys, np.array([row[0] for row in rows], dtype=np.int64))
+        batch = np.array([row[1:] for row in rows], dtype=np.float64)
+        # Unparseable timestamps come back as NULL -> NaN, treat them as fresh
+        ages = np.nan_to_num(batch[:, 1], nan=0.0)
+        combine_batch(log_survival, counts, positions, np.nan_to_num(batch[:, 0]), ages, half_life_days)
+
+    scores = -np.expm1(log_survival)
+    return keys, np.round(scores, 6)
+
+
+def write_scores(conn, table, ids, scores, batch_size=DEFAULT_BATCH_SIZE):
+    """Bulk update confidence values for table"""
+    for start in range(0, len(ids), batch_size):
+        conn.executemany(
+            f"UPDATE {table} SET confidence = ? WHERE id = ?",
+            zip(scores[start:start + batch_size].tolist(), ids[start:start + batch_size].tolist())
+        )
+
+
+def rescore_database(db_path, half_life_days=DEFAULT_HALF_LIFE_DAYS, batch_size=DEFAULT_BATCH_SIZE):
+    """Rescore entities and relationships in db_path, returns rows updated per table"""
+    print("[+] Rescoring entity and relationship confidence")
+    conn = sqlite3.connect(db_path)
+    updated = {}
+
+    try:
+        with conn:
+            ensure_observation_tables(conn)
+            for table in OBSERVATION_TABLES:
+                backfill_observations(conn, table)
+                ids, scores = score_table(conn, table, half_life_days, batch_size)
+                write_scores(conn, table, ids, scores, batch_size)
+                updated[table] = len(ids)
+    finally:
+        conn.close()
+
+    print(f"[+] Rescored {updated['entities']} entities and {updated['relationships']} relationships")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute combined confidence in a correlation database")
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("--half-life", type=float, default=DEFAULT_HALF_LIFE_DAYS,
+                        help="Days after which an observation counts for half its confidence")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Observations loaded per batch")
+
+    args = parser.parse_args()
+
+    try:
+        rescore_database(args.database, args.half_life, args.batch_size)
+    except Exception as e:
+        print(f"[-] Error rescoring database: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ import os
 import json
 from datetime import datetime
 
+from entity_ids import entity_id
+
 # Target information
 ADDRESS = "17642 BEACH HB CA 92647"
 SUSPECTS = [
@@ -71,6 +73,8 @@ def setup_database(db_path):
             UNIQUE(entity1_id, entity2_id, relationship_type)
         )
     ''')
+    # Edges are stored as (lower id, higher id), lookups from the higher end use this
+    cursor.execute("CREATE INDEX idx_relationships_entity2 ON relationships (entity2_id)")
     
     conn.commit()
     return conn
@@ -87,9 +91,10 @@ def add_entities(conn, address, suspects):
     }
     
     cursor.execute('''
-        INSERT OR REPLACE INTO entities (name, type, source_tool, confidence, metadata)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (address, "address", "manual_input", 1.0, json.dumps(address_metadata)))
+        INSERT OR REPLACE INTO entities (id, name, type, source_tool, confidence, metadata)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (entity_id("physical_address", address), address, "physical_address", "manual_input", 1.0,
+          json.dumps(address_metadata)))
     
     # Add suspects
     for suspect in suspects:
@@ -100,9 +105,10 @@ def add_entities(conn, address, suspects):
         }
         
         cursor.execute('''
-            INSERT OR REPLACE INTO entities (name, type, source_tool, confidence, metadata)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (suspect["name"], "suspect", "manual_input", 1.0, json.dumps(suspect_metadata)))
+            INSERT OR REPLACE INTO entities (id, name, type, source_tool, confidence, metadata)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (entity_id("suspect", suspect["name"]), suspect["name"], "suspect", "manual_input", 1.0,
+              json.dumps(suspect_metadata)))
     
     conn.commit()
 
@@ -110,15 +116,12 @@ def create_relationships(conn, address, suspects):
     """Create strong relationships between suspects and address"""
     cursor = conn.cursor()
     
-    # Get address ID
-    cursor.execute('SELECT id FROM entities WHERE name = ?', (address,))
-    address_id = cursor.fetchone()[0]
+    # Ids are hashes of (type, name), no lookups needed
+    address_id = entity_id("physical_address", address)
     
     # Create relationships
     for suspect in suspects:
-        # Get suspect ID
-        cursor.execute('SELECT id FROM entities WHERE name = ?', (suspect["name"],))
-        suspect_id = cursor.fetchone()[0]
+        suspect_id = entity_id("suspect", suspect["name"])
         
         # Create relationship metadata
         relationship_metadata = {
@@ -128,14 +131,14 @@ def create_relationships(conn, address, suspects):
             "last_updated": datetime.now().isoformat()
         }
         
-        # Add relationship
+        # Add relationship under its canonical (lower id, higher id) key
         cursor.execute('''
             INSERT OR REPLACE INTO relationships 
             (entity1_id, entity2_id, relationship_type, source_tool, confidence, metadata)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (
-            suspect_id, 
-            address_id, 
+            min(suspect_id, address_id),
+            max(suspect_id, address_id),
             "address_association",
             "manual_correlation",
             suspect["confidence"],
@@ -171,18 +174,24 @@ def generate_correlation_report(conn, output_dir):
         f.write("Associated Suspects:\n")
         f.write("-" * 30 + "\n\n")
         
-        # Get all suspects and their relationships
+        # Get all suspects and their relationships, the suspect may be either end of the edge
         cursor.execute('''
             SELECT 
                 e.name,
                 e.metadata as entity_metadata,
                 r.confidence,
                 r.metadata as relationship_metadata
-            FROM entities e
-            JOIN relationships r ON e.id = r.entity1_id
-            JOIN entities a ON r.entity2_id = a.id
+            FROM entities a
+            JOIN relationships r ON r.entity2_id = a.id
+            JOIN entities e ON e.id = r.entity1_id
             WHERE a.name = ? AND e.type = 'suspect'
-        ''', (ADDRESS,))
+            UNION ALL
+            SELECT e.name, e.metadata, r.confidence, r.metadata
+            FROM entities a
+            JOIN relationships r ON r.entity1_id = a.id
+            JOIN entities e ON e.id = r.entity2_id
+            WHERE a.name = ? AND e.type = 'suspect'
+        ''', (ADDRESS, ADDRESS))
         
         suspects = cursor.fetchall()
         for suspect in suspects:
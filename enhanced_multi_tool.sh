@@ -12,6 +12,9 @@ YELLOW='\033[1;33m'
 BLUE='\033[0;34m'
 NC='\033[0m' # No Color
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+CONFIG_FILE="${CONFIG_FILE:-$SCRIPT_DIR/config.json}"
+
 # Function to print colored output
 print_status() {
     echo -e "${GREEN}[+]${NC} $1"
@@ -38,7 +41,87 @@ check_tool() {
     return 0
 }
 
-# Function to run multiple tools in parallel
+# Function to read a value from config.json (dotted key, default)
+config_value() {
+    python3 - "$CONFIG_FILE" "$1" "$2" << 'EOF'
+import json, sys
+path, key, default = sys.argv[1:4]
+try:
+    with open(path) as f:
+        value = json.load(f)
+    for part in key.split('.'):
+        value = value[part]
+except (OSError, ValueError, KeyError, TypeError):
+    value = default
+print(value if isinstance(value, str) else json.dumps(value))
+EOF
+}
+
+# Function to choose how raw tool output is stored (output.compress_results)
+setup_compression() {
+    COMPRESS_CMD=""
+    COMPRESS_EXT=""
+    
+    if [ "$(config_value output.compress_results false)" != "true" ]; then
+        return
+    fi
+    
+    if [ "$(config_value output.compression_format zstd)" = "zstd" ] && command -v zstd &> /dev/null; then
+        COMPRESS_CMD="zstd -q -c"
+        COMPRESS_EXT=".zst"
+    else
+        COMPRESS_CMD="gzip -c"
+        COMPRESS_EXT=".gz"
+    fi
+    print_info "Compressing tool output with ${COMPRESS_CMD%% *}"
+}
+
+# Function to write stdin to a result file, compressed when enabled
+write_result() {
+    if [ -n "$COMPRESS_CMD" ]; then
+        $COMPRESS_CMD > "$1$COMPRESS_EXT"
+    else
+        cat > "$1"
+    fi
+}
+
+# Function to find the plain or compressed variant of a result file
+result_path() {
+    local candidate
+    for candidate in "$1" "$1.zst" "$1.gz"; do
+        if [ -f "$candidate" ]; then
+            echo "$candidate"
+            return 0
+        fi
+    done
+    return 1
+}
+
+# Function to stream a result file, decompressing transparently
+read_result() {
+    local path
+    path=$(result_path "$1") || return 0
+    
+    case "$path" in
+        *.zst)
+            if command -v zstd &> /dev/null; then
+                zstd -dcq "$path"
+            else
+                python3 "$SCRIPT_DIR/result_storage.py" cat "$path"
+            fi
+            ;;
+        *.gz) gzip -dc "$path" ;;
+        *) cat "$path" ;;
+    esac
+}
+
+# Function to list every result text file, compressed or not
+find_results() {
+    find "$1" \( -name "*.txt" -o -name "*.txt.gz" -o -name "*.txt.zst" \
+        -o -name "*.xml" -o -name "*.xml.gz" -o -name "*.xml.zst" \) "${@:2}"
+}
+
+# Function to run multiple tools in parallel within the configured CPU/memory budget
 run_parallel_tools() {
     local target="$1"
     local output_dir="$2"
@@ -46,47 +129,11 @@ run_parallel_tools() {
     print_status "Running tools in parallel for faster analysis..."
     
     # Create output directories
-    mkdir -p "$output_dir"/{nmap,dnsrecon,fierce,amass,subfinder,assetfinder,httpx}
-    
-    # Run tools in background
-    {
-        print_info "Running Nmap..."
-        nmap -sS -O -A -T4 "$target" > "$output_dir/nmap/nmap_$target.txt" 2>&1
-        print_status "Nmap completed"
-    } &
+    mkdir -p "$output_dir"/{nmap,dnsrecon,fierce,amass,subfinder,assetfinder}
     
-    {
-        print_info "Running DNSRecon..."
-        dnsrecon -d "$target" -t std,rvl,srv,axfr > "$output_dir/dnsrecon/dnsrecon_$target.txt" 2>&1
-        print_status "DNSRecon completed"
-    } &
-    
-    {
-        print_info "Running Fierce..."
-        fierce --domain "$target" > "$output_dir/fierce/fierce_$target.txt" 2>&1
-        print_status "Fierce completed"
-    } &
-    
-    {
-        print_info "Running Amass..."
-        amass enum -d "$target" -o "$output_dir/amass/amass_$target.txt" 2>&1
-        print_status "Amass completed"
-    } &
-    
-    {
-        print_info "Running Subfinder..."
-        subfinder -d "$target" -o "$output_dir/subfinder/subfinder_$target.txt" 2>&1
-        print_status "Subfinder completed"
-    } &
-    
-    {
-        print_info "Running Assetfinder..."
-        assetfinder "$target" > "$output_dir/assetfinder/assetfinder_$target.txt" 2>&1
-        print_status "Assetfinder completed"
-    } &
-    
-    # Wait for all background jobs to complete
-    wait
+    # The scheduler admits tools by cost (scheduler.costs) and compresses their output
+    python3 "$SCRIPT_DIR/tool_scheduler.py" "$target" -o "$output_dir" -c "$CONFIG_FILE" \
+        -t nmap dnsrecon fierce amass subfinder assetfinder
     
     print_status "All parallel tools completed"
 }
@@ -98,22 +145,18 @@ run_additional_recon() {
     
     print_status "Running additional reconnaissance..."
     
-    # Check for subdomains with httpx
-    if [ -f "$output_dir/subfinder/subfinder_$target.txt" ]; then
-        print_info "Checking subdomain HTTP status..."
-        cat "$output_dir/subfinder/subfinder_$target.txt" | httpx -silent -status-code -title > "$output_dir/httpx/httpx_$target.txt" 2>&1
-    fi
+    # HTTP status and titles are probed by the Python correlator (probe in config.json)
     
     # Run whatweb for web technology detection
     if command -v whatweb &> /dev/null; then
         print_info "Running WhatWeb..."
-        whatweb "$target" > "$output_dir/whatweb_$target.txt" 2>&1
+        whatweb "$target" 2>&1 | write_result "$output_dir/whatweb_$target.txt"
     fi
     
     # Run dirb for directory discovery
     if command -v dirb &> /dev/null; then
         print_info "Running Dirb..."
-        dirb "http://$target" > "$output_dir/dirb_$target.txt" 2>&1
+        dirb "http://$target" 2>&1 | write_result "$output_dir/dirb_$target.txt"
     fi
 }
 
@@ -129,23 +172,25 @@ correlate_data() {
     
     # Extract unique domains/IPs from all sources
     {
-        # From nmap
-        [ -f "$output_dir/nmap/nmap_$target.txt" ] && grep -oE '([0-9]{1,3}\.){3}[0-9]{1,3}' "$output_dir/nmap/nmap_$target.txt" || true
+        # From nmap (XML, the addresses are in addr attributes)
+        read_result "$output_dir/nmap/nmap_$target.xml" | grep -oE 'addr="([0-9]{1,3}\.){3}[0-9]{1,3}"' | cut -d'"' -f2 || true
         
         # From subfinder
-        [ -f "$output_dir/subfinder/subfinder_$target.txt" ] && cat "$output_dir/subfinder/subfinder_$target.txt" || true
+        read_result "$output_dir/subfinder/subfinder_$target.txt"
         
         # From amass
-        [ -f "$output_dir/amass/amass_$target.txt" ] && cat "$output_dir/amass/amass_$target.txt" || true
+        read_result "$output_dir/amass/amass_$target.txt"
         
         # From assetfinder
-        [ -f "$output_dir/assetfinder/assetfinder_$target.txt" ] && cat "$output_dir/assetfinder/assetfinder_$target.txt" || true
+        read_result "$output_dir/assetfinder/assetfinder_$target.txt"
         
     } | sort -u > "$output_dir/correlation/all_domains_ips.txt"
     
     # Extract emails from all sources
     {
-        find "$output_dir" -name "*.txt" -exec grep -hoE '[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}' {} \; 2>/dev/null || true
+        find_results "$output_dir" -print0 | while IFS= read -r -d '' result_file; do
+            read_result "$result_file"
+        done | grep -hoE '[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}' 2>/dev/null || true
     } | sort -u > "$output_dir/correlation/all_emails.txt"
     
     # Create summary report
@@ -164,7 +209,7 @@ Emails found:
 $(cat "$output_dir/correlation/all_emails.txt")
 
 Tool Results:
-$(find "$output_dir" -name "*.txt" -exec basename {} \; | sort)
+$(find_results "$output_dir" -exec basename {} \; | sort)
 EOF
     
     print_status "Correlation completed. Summary saved to $output_dir/correlation/summary.txt"
@@ -220,7 +265,24 @@ run_python_correlator() {
     print_status "Running Python correlation script..."
     
     if [ -f "./multi_tool_linker.py" ]; then
-        python3 ./multi_tool_linker.py "$target" -o "$output_dir/python_correlation"
+        # Hostname lists are ingested so every discovered host is probed and correlated
+        local host_lists=()
+        local tool
+        for tool in amass subfinder assetfinder dnsrecon fierce; do
+            if result_path "$output_dir/$tool/${tool}_$target.txt" > /dev/null; then
+                host_lists+=("$output_dir/$tool/${tool}_$target.txt")
+            fi
+        done
+        
+        # nmap XML carries ports, services and OS guesses into the database
+        local nmap_xml=()
+        if result_path "$output_dir/nmap/nmap_$target.xml" > /dev/null; then
+            nmap_xml=("$output_dir/nmap/nmap_$target.xml")
+        fi
+        
+        python3 ./multi_tool_linker.py "$target" -o "$output_dir/python_correlation" -c "$CONFIG_FILE" \
+            ${host_lists[@]:+--host-lists "${host_lists[@]}"} \
+            ${nmap_xml[@]:+--nmap-xml "${nmap_xml[@]}"}
     else
         print_warning "Python correlation script not found. Skipping..."
     fi
@@ -241,7 +303,7 @@ main() {
     print_info "Output directory: $output_dir"
     
     # Check required tools
-    local required_tools=("nmap" "dnsrecon" "fierce" "amass" "subfinder" "assetfinder" "httpx")
+    local required_tools=("nmap" "dnsrecon" "fierce" "amass" "subfinder" "assetfinder")
     local missing_tools=()
     
     for tool in "${required_tools[@]}"; do
@@ -257,6 +319,7 @@ main() {
     
     # Create output directory
     mkdir -p "$output_dir"
+    setup_compression
     
     # Run analysis phases
     run_parallel_tools "$target" "$output_dir"
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Pre-dedup filters for entity names
+
+The entity writer asks a name filter whether a name was stored before it goes
+to SQLite, so names that every tool reports again skip the INSERT OR IGNORE
+and its unique-index probe. Small databases use an exact set of the stored
+names; large ones use a Bloom filter kept next to correlations.db
+(correlations.db.bloom), which stays a few bits per name when the name index no
+longer fits in the page cache. A false positive only costs the insert that was
+skipped, the writer notices the missing row and stores it anyway.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import sys
+
+BLOOM_MAGIC = b'MTLB'
+BLOOM_HEADER = struct.Struct('<4sQIQQ')
+
+DEFAULT_EXACT_LIMIT = 1000000
+DEFAULT_BLOOM_CAPACITY = 10000000
+DEFAULT_ERROR_RATE = 0.001
+
+
+class ExactFilter:
+    """Set of every stored name"""
+
+    def __init__(self, names=()):
+        self.names = set(names)
+        self.checks = 0
+        self.hits = 0
+
+    def check_and_add(self, name):
+        """Return True if name was seen before, remembering it either way"""
+        self.checks += 1
+        if name in self.names:
+            self.hits += 1
+            return True
+        self.names.add(name)
+        return False
+
+    def __len__(self):
+        return len(self.names)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE, bits=None, hashes=None, count=0, data=None):
+        self.capacity = capacity
+        self.size = bits or max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = data if data is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+        self.checks = 0
+        self.hits = 0
+        # Set once a name is added, save_name_filter skips clean filters
+        self.dirty = False
+
+    def positions(self, name):
+        digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def check_and_add(self, name):
+        """Return True if name may have been seen before, remembering it either way"""
+        self.checks += 1
+        bits = self.bits
+        present = True
+        for position in self.positions(name):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        if present:
+            self.hits += 1
+        else:
+            self.count += 1
+            self.dirty = True
+        return present
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        """Write the filter atomically next to the database"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.size, self.hashes, self.count, self.capacity))
+            f.write(self.bits)
+        os.replace(temp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, size, hashes, count, capacity = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+            if magic != BLOOM_MAGIC:
+                raise ValueError(f"{path} is not a Bloom filter file")
+            data = bytearray(f.read())
+        if len(data) != (size + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return cls(capacity, bits=size, hashes=hashes, count=count, data=data)
+
+
+def bloom_path(db_path):
+    return db_path + '.bloom'
+
+
+def build_bloom_filter(conn, capacity, error_rate=DEFAULT_ERROR_RATE):
+    """Build a Bloom filter over every entity name in the database"""
+    bloom = BloomFilter(capacity, error_rate)
+    for (name,) in conn.execute("SELECT name FROM entities"):
+        bloom.check_and_add(name)
+    bloom.checks = bloom.hits = 0
+    return bloom
+
+
+def load_name_filter(conn, db_path, config=None):
+    """Return the name filter for db_path, sized from the current entity count"""
+    dedup_config = config or {}
+    exact_limit = dedup_config.get('exact_limit', DEFAULT_EXACT_LIMIT)
+    error_rate = dedup_config.get('bloom_error_rate', DEFAULT_ERROR_RATE)
+    count = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    if count < exact_limit:
+        return ExactFilter(name for (name,) in conn.execute("SELECT name FROM entities"))
+
+    # Names missing from a stale filter are just inserted, so only an overfull one is rebuilt
+    path = bloom_path(db_path)
+    try:
+        bloom = BloomFilter.load(path)
+        if count <= len(bloom) < bloom.capacity:
+            return bloom
+    except (OSError, ValueError, struct.error):
+        pass
+
+    # Leave room to grow before the false positive rate degrades
+    capacity = max(dedup_config.get('bloom_capacity', DEFAULT_BLOOM_CAPACITY), 2 * count)
+    print(f"[+] Building Bloom filter over {count} entity names")
+    bloom = build_bloom_filter(conn, capacity, error_rate)
+    bloom.save(path)
+    return bloom
+
+
+def save_name_filter(name_filter, db_path):
+    """Persist a Bloom name filter if names were added, exact filters are rebuilt from the database"""
+    if isinstance(name_filter, BloomFilter) and name_filter.dirty:
+        name_filter.save(bloom_path(db_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect or rebuild the entity name Bloom filter",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Rebuild correlations.db.bloom after bulk deletes
+  %(prog)s results/correlations.db --rebuild
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the Bloom filter from the database")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_BLOOM_CAPACITY, help="Names the filter is sized for")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE, help="Target false positive rate")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(args.database)
+        count = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+        path = bloom_path(args.database)
+
+        if args.rebuild:
+            bloom = build_bloom_filter(conn, max(args.capacity, 2 * count), args.error_rate)
+            bloom.save(path)
+            print(f"[+] Bloom filter over {count} names saved to {path}")
+        elif os.path.exists(path):
+            bloom = BloomFilter.load(path)
+            print(f"{path}: {bloom.size} bits, {bloom.hashes} hashes, {len(bloom)} of {bloom.capacity} names "
+                  f"({count} entities in database)")
+        else:
+            print(f"[i] No Bloom filter for {args.database}, {count} entities use the exact filter")
+        conn.close()
+    except (sqlite3.OperationalError, ValueError, struct.error) as e:
+        print(f"[-] Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
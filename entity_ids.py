@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Deterministic 64-bit entity ids
+
+An entity's id is a keyed hash of its canonical (type, name) key instead of
+an autoincrement rowid, so any worker can compute the id of an entity, and
+write edges to it, without reading the database, and results produced on
+different machines merge without remapping. Tool-specific spellings of a type
+(host/domain/internet name, ip/ip address, ...) hash as one type family,
+because the same name is reported as a domain by one tool and a host by the
+next.
+
+Ids are kept positive (63 bits) so they sort and compare like rowids. An
+insert whose id is already held by a different name is a collision: it is
+recorded in entity_id_exceptions and the entity is stored under the next
+salted hash. A name already stored under another id (a different type family,
+or a salted id) is also listed there, so writers that computed ids can remap
+the few that differ.
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+
+from asset_clusters import rebuild_clusters
+from entity_search import check_search_index, rebuild_search_index
+
+ID_MASK = (1 << 63) - 1
+ID_PERSON = b'mtl-entity-id'
+MAX_SALTS = 16
+
+# Type spellings that name the same kind of entity hash alike
+ID_TYPE_FAMILIES = {
+    'domain': 'dns',
+    'host': 'dns',
+    'subdomain': 'dns',
+    'internet name': 'dns',
+    'internet_name': 'dns',
+    'ip': 'ip',
+    'ip address': 'ip',
+    'ip_address': 'ip',
+    'ipv6 address': 'ip',
+    'ipv6_address': 'ip',
+    'email': 'email',
+    'email address': 'email',
+    'emailaddr': 'email',
+}
+
+ID_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS entity_id_exceptions (
+        name TEXT PRIMARY KEY,
+        type TEXT,
+        key_id INTEGER,
+        entity_id INTEGER,
+        reason TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS entity_id_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''',
+]
+
+# Tables holding entity ids, renumbered by migrate_entity_ids
+ENTITY_ID_COLUMNS = [
+    ('relationships', 'entity1_id'),
+    ('relationships', 'entity2_id'),
+    ('entity_observations', 'entity_id'),
+    ('entity_attributes', 'entity_id'),
+    ('run_entities', 'entity_id'),
+    ('ip_addresses', 'entity_id'),
+    ('ip_addresses', 'netblock_id'),
+]
+
+
+def id_type(entity_type):
+    """Type family used in the id key"""
+    entity_type = (entity_type or '').strip().lower()
+    return ID_TYPE_FAMILIES.get(entity_type, entity_type)
+
+
+def entity_id(entity_type, name, salt=0):
+    """Stable 63-bit id of the (type, name) key, salt > 0 only after collisions"""
+    key = f"{id_type(entity_type)}\x1f{name}"
+    if salt:
+        key += f"\x1f{salt}"
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8, person=ID_PERSON).digest()
+    # 0 is never a valid rowid
+    return int.from_bytes(digest, 'big') & ID_MASK or 1
+
+
+def setup_entity_ids(conn):
+    """Create the id bookkeeping tables"""
+    for statement in ID_SCHEMA:
+        conn.execute(statement)
+
+
+def record_exception(cursor, name, entity_type, key_id, stored_id, reason):
+    cursor.execute('''
+        INSERT OR REPLACE INTO entity_id_exceptions (name, type, key_id, entity_id, reason)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (name, entity_type, key_id, stored_id, reason))
+
+
+def insert_entity(cursor, name, entity_type, source_tool, confidence):
+    """INSERT OR IGNORE an entity under its deterministic id, returns the id it is stored under"""
+    key_id = entity_id(entity_type, name)
+    for salt in range(MAX_SALTS):
+        candidate = entity_id(entity_type, name, salt) if salt else key_id
+        cursor.execute('''
+            INSERT OR IGNORE INTO entities (id, name, type, source_tool, confidence)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (candidate, name, entity_type, source_tool, confidence))
+        if cursor.rowcount:
+            if salt:
+                print(f"[!] Entity id collision for {name}, stored under salt {salt}")
+                record_exception(cursor, name, entity_type, key_id, candidate, 'collision')
+            return candidate
+
+        # Ignored: either the name is already stored, or the id belongs to another name
+        row = cursor.execute("SELECT id FROM entities WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            if row[0] != key_id:
+                record_exception(cursor, name, entity_type, key_id, row[0], 'type')
+            return row[0]
+    raise sqlite3.IntegrityError(f"no free entity id for {name} after {MAX_SALTS} salts")
+
+
+def resolve_ids(cursor, records):
+    """Map record names to ids by hashing, consulting the exception table only for its entries"""
+    ids = {record.name: entity_id(record.type, record.name) for record in records}
+    if cursor.execute("SELECT 1 FROM entity_id_exceptions LIMIT 1").fetchone() is None:
+        return ids
+    names = list(ids)
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        cursor.execute(
+            f"SELECT name, entity_id FROM entity_id_exceptions WHERE name IN ({','.join('?' * len(chunk))})",
+            chunk
+        )
+        ids.update(cursor.fetchall())
+    return ids
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def migrate_entity_ids(conn):
+    """Renumber entities still carrying rowids to their deterministic ids, returns rows changed"""
+    setup_entity_ids(conn)
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS temp.entity_id_map")
+    cursor.execute("CREATE TEMP TABLE entity_id_map (old_id INTEGER PRIMARY KEY, new_id INTEGER UNIQUE)")
+
+    # Oldest rows claim unsalted ids first, the same order as the original inserts;
+    # the UNIQUE new_id column detects collisions without holding every id in memory
+    for old_id, name, entity_type in conn.execute("SELECT id, name, type FROM entities ORDER BY id"):
+        key_id = entity_id(entity_type, name)
+        for salt in range(MAX_SALTS):
+            new_id = entity_id(entity_type, name, salt) if salt else key_id
+            try:
+                cursor.execute("INSERT INTO entity_id_map (old_id, new_id) VALUES (?, ?)", (old_id, new_id))
+                break
+            except sqlite3.IntegrityError:
+                continue
+        else:
+            raise sqlite3.IntegrityError(f"no free entity id for {name} after {MAX_SALTS} salts")
+        if salt:
+            record_exception(cursor, name, entity_type, key_id, new_id, 'collision')
+
+    # Rows already under their hashed id stay where they are
+    cursor.execute("DELETE FROM temp.entity_id_map WHERE old_id = new_id")
+    changed = cursor.execute("SELECT COUNT(*) FROM temp.entity_id_map").fetchone()[0]
+    if not changed:
+        cursor.execute("DROP TABLE temp.entity_id_map")
+        return 0
+
+    # Negate first so no intermediate value clashes with an id not yet moved
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    columns = [('entities', 'id')] + [(table, column) for table, column in ENTITY_ID_COLUMNS
+                                      if table in tables and column in table_columns(conn, table)]
+    for table, column in columns:
+        cursor.execute(f'''
+            UPDATE {table} SET {column} = -{column}
+            WHERE {column} IN (SELECT old_id FROM temp.entity_id_map)
+        ''')
+    for table, column in columns:
+        cursor.execute(f'''
+            UPDATE {table} SET {column} = m.new_id
+            FROM temp.entity_id_map m
+            WHERE {table}.{column} = -m.old_id
+        ''')
+
+    # Relationships are keyed by (lower id, higher id)
+    if 'relationships' in tables:
+        cursor.execute('''
+            UPDATE relationships
+            SET entity1_id = entity2_id, entity2_id = entity1_id
+            WHERE entity1_id > entity2_id
+        ''')
+    # The trigram index is keyed by entity id and its triggers only follow name changes
+    rebuild_search_index(conn)
+    cursor.execute("DROP TABLE temp.entity_id_map")
+    return changed
+
+
+def ensure_entity_ids(conn):
+    """Migrate a database created with rowid entity ids once, recording that it was done"""
+    setup_entity_ids(conn)
+    if conn.execute("SELECT value FROM entity_id_state WHERE key = 'deterministic'").fetchone():
+        return
+    count = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+    if count:
+        print(f"[!] Renumbering {count} entities to deterministic ids")
+    with conn:
+        changed = migrate_entity_ids(conn)
+        conn.execute("INSERT OR REPLACE INTO entity_id_state (key, value) VALUES ('deterministic', 1)")
+    if changed:
+        # Cluster ids are entity ids too, recompute them from the renumbered edges
+        rebuild_clusters(conn)
+        print(f"[+] Renumbered {changed} entities")
+
+
+def check_entity_ids(conn):
+    """Return (entities checked, [(id, name, type, expected id)]) for rows not under their key id"""
+    setup_entity_ids(conn)
+    exceptions = dict(conn.execute("SELECT name, entity_id FROM entity_id_exceptions"))
+    checked = 0
+    mismatched = []
+    for stored_id, name, entity_type in conn.execute("SELECT id, name, type FROM entities"):
+        checked += 1
+        expected = exceptions.get(name, entity_id(entity_type, name))
+        if stored_id != expected:
+            mismatched.append((stored_id, name, entity_type, expected))
+    return checked, mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Deterministic entity ids in a correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Id a worker would compute for an entity
+  %(prog)s id host www.example.com
+
+  # Verify every entity is stored under its hashed id
+  %(prog)s check results/correlations.db
+
+  # Renumber a database created before deterministic ids
+  %(prog)s migrate results/correlations.db
+"""
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    id_parser = subparsers.add_parser("id", help="Print the id of a (type, name) key")
+    id_parser.add_argument("type", help="Entity type")
+    id_parser.add_argument("name", help="Entity name")
+
+    for command, help_text in (("check", "List entities not stored under their hashed id"),
+                               ("migrate", "Renumber rowid entities to hashed ids")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("database", help="Path to correlations.db")
+
+    args = parser.parse_args()
+
+    if args.command == "id":
+        print(entity_id(args.type, args.name))
+        return
+
+    try:
+        conn = sqlite3.connect(args.database)
+        if args.command == "check":
+            checked, mismatched = check_entity_ids(conn)
+            for stored_id, name, entity_type, expected in mismatched:
+                print(f"{name} ({entity_type}): stored as {stored_id}, expected {expected}")
+            print(f"[+] {checked} entities checked, {len(mismatched)} not under their hashed id")
+            search_ok = check_search_index(conn)
+            if not search_ok:
+                print("[-] Search index does not match entities, recreate it with entity_search.py drop-index and index")
+            if mismatched or not search_ok:
+                sys.exit(1)
+        else:
+            # Run the migration again even if it was recorded as done
+            setup_entity_ids(conn)
+            conn.execute("DELETE FROM entity_id_state WHERE key = 'deterministic'")
+            ensure_entity_ids(conn)
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
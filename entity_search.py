@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Substring and glob search over entity names
+
+Keeps an optional FTS5 trigram shadow index (entities_fts) over entities.name,
+kept in sync with the entities table by triggers. LIKE and GLOB patterns of
+three or more characters are answered from the index instead of a full scan.
+"""
+
+import argparse
+import sqlite3
+import sys
+
+SEARCH_INDEX_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS entities_fts USING fts5(
+        name,
+        content='entities',
+        content_rowid='id',
+        tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS entities_fts_insert AFTER INSERT ON entities BEGIN
+        INSERT INTO entities_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS entities_fts_delete AFTER DELETE ON entities BEGIN
+        INSERT INTO entities_fts (entities_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS entities_fts_update AFTER UPDATE OF name ON entities BEGIN
+        INSERT INTO entities_fts (entities_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO entities_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    ''',
+]
+
+# Trigram index can only narrow patterns with at least one 3-character run
+MIN_INDEXED_LENGTH = 3
+
+
+def has_search_index(conn):
+    """Check whether the trigram index exists in this database"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entities_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def create_search_index(conn):
+    """Create the trigram index and its triggers, populating it from entities"""
+    exists = has_search_index(conn)
+    for statement in SEARCH_INDEX_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        conn.execute("INSERT INTO entities_fts (entities_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def rebuild_search_index(conn):
+    """Repopulate the trigram index from entities, after ids were renumbered in place"""
+    if has_search_index(conn):
+        conn.execute("INSERT INTO entities_fts (entities_fts) VALUES ('rebuild')")
+
+
+def check_search_index(conn):
+    """Return True when the trigram index is missing or matches entities"""
+    if not has_search_index(conn):
+        return True
+    try:
+        conn.execute("INSERT INTO entities_fts (entities_fts, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError:
+        return False
+    return True
+
+
+def drop_search_index(conn):
+    """Remove the trigram index and its triggers"""
+    for trigger in ("entities_fts_insert", "entities_fts_delete", "entities_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS entities_fts")
+    conn.commit()
+
+
+def literal_runs(pattern, glob=False):
+    """Return the longest run of literal characters in a LIKE/GLOB pattern"""
+    wildcards = "*?[]" if glob else "%_"
+    longest = current = 0
+    for char in pattern:
+        current = 0 if char in wildcards else current + 1
+        longest = max(longest, current)
+    return longest
+
+
+def search_entities(conn, pattern, glob=False, types=None, sources=None, limit=100, after=None):
+    """Find entities whose name matches pattern, in name order after the name given as after
+
+    Plain text is treated as a substring. With glob=True the pattern uses
+    GLOB syntax (case-sensitive), otherwise LIKE syntax (case-insensitive).
+    Names are unique, so the last name of a page is a complete keyset cursor.
+    """
+    if not glob and '%' not in pattern and '_' not in pattern:
+        pattern = f"%{pattern}%"
+    operator = "GLOB" if glob else "LIKE"
+
+    if has_search_index(conn) and literal_runs(pattern, glob) >= MIN_INDEXED_LENGTH:
+        query = f'''
+            SELECT e.id, e.name, e.type, e.source_tool, e.confidence
+            FROM entities_fts f
+            JOIN entities e ON e.id = f.rowid
+            WHERE f.name {operator} ?
+        '''
+    else:
+        query = f'''
+            SELECT e.id, e.name, e.type, e.source_tool, e.confidence
+            FROM entities e
+            WHERE e.name {operator} ?
+        '''
+    params = [pattern]
+
+    if types:
+        query += f" AND e.type IN ({','.join('?' * len(types))})"
+        params.extend(types)
+    if sources:
+        query += f" AND e.source_tool IN ({','.join('?' * len(sources))})"
+        params.extend(sources)
+    if after is not None:
+        query += " AND e.name > ?"
+        params.append(after)
+
+    query += " ORDER BY e.name LIMIT ?"
+    params.append(limit)
+
+    return conn.execute(query, params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search entity names in a correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build the trigram index once
+  %(prog)s results/correlations.db index
+
+  # Substring search
+  %(prog)s results/correlations.db search mail
+
+  # Glob search restricted to hosts found by recon-ng
+  %(prog)s results/correlations.db search '*.dev.example.com' --glob -t host --source recon-ng
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("index", help="Create the trigram search index")
+    subparsers.add_parser("drop-index", help="Remove the trigram search index")
+
+    search_parser = subparsers.add_parser("search", help="Search entity names")
+    search_parser.add_argument("pattern", help="Substring, LIKE or GLOB pattern")
+    search_parser.add_argument("-g", "--glob", action="store_true", help="Treat pattern as a GLOB")
+    search_parser.add_argument("-t", "--type", nargs='+', dest="types", help="Only these entity types")
+    search_parser.add_argument("--source", nargs='+', dest="sources", help="Only these source tools")
+    search_parser.add_argument("-n", "--limit", type=int, default=100, help="Maximum results")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(args.database)
+        if args.command == "index":
+            create_search_index(conn)
+            print(f"[+] Trigram search index ready in {args.database}")
+        elif args.command == "drop-index":
+            drop_search_index(conn)
+            print("[+] Trigram search index removed")
+        else:
+            if not has_search_index(conn):
+                print("[!] No trigram index, falling back to a full scan (run the index command first)")
+            for entity in search_entities(conn, args.pattern, args.glob, args.types, args.sources, args.limit):
+                print(f"{entity[1]} ({entity[2]}) - {entity[3]} [{entity[4]}]")
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Canonical entity types and ingest-time validation
+
+Every entity type has a small integer code in the entity_types table, and
+entities.type_code is a virtual column computed from entities.type, so it
+costs no row space, stays right for every writer and is indexed for
+type-filtered scans. Tool-native type names (SpiderFoot's "Internet Name",
+"IP Address", ...) are mapped onto the dictionary when parsed; records with a
+type outside it, or a malformed domain, email or IP, are dropped before they
+reach SQLite.
+"""
+
+import argparse
+import ipaddress
+import re
+import sqlite3
+import sys
+
+# Codes are persisted in indexes, only ever append
+ENTITY_TYPES = {
+    'domain': 1,
+    'host': 2,
+    'email': 3,
+    'ip': 4,
+    'service': 5,
+    'os': 6,
+    'suspect': 7,
+    'physical_address': 8,
+    'netblock': 9,
+    'asn': 10,
+    'url': 11,
+    'person': 12,
+    'company': 13,
+    'phone': 14,
+}
+
+# Spellings any tool may use for a canonical type
+TYPE_ALIASES = {
+    'subdomain': 'host',
+    'hostname': 'host',
+    'ip_address': 'ip',
+    'ipv4': 'ip',
+    'ipv6': 'ip',
+    'emailaddr': 'email',
+    'address': 'physical_address',
+}
+
+# Native type names per tool, lowercased
+TOOL_TYPES = {
+    'spiderfoot': {
+        'internet name': 'host',
+        'affiliate - internet name': 'host',
+        'co-hosted site': 'host',
+        'domain name': 'domain',
+        'similar domain': 'domain',
+        'ip address': 'ip',
+        'ipv6 address': 'ip',
+        'affiliate - ip address': 'ip',
+        'email address': 'email',
+        'affiliate - email address': 'email',
+        'netblock membership': 'netblock',
+        'netblock ownership': 'netblock',
+        'bgp as membership': 'asn',
+        'bgp as ownership': 'asn',
+        'linked url - internal': 'url',
+        'linked url - external': 'url',
+        'human name': 'person',
+        'company name': 'company',
+        'phone number': 'phone',
+        'physical address': 'physical_address',
+        'operating system': 'os',
+    },
+}
+
+HOSTNAME_PATTERN = re.compile(
+    r'^(?=.{1,253}$)(?:(?!-)[a-z0-9_-]{1,63}(?<!-)\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$'
+)
+EMAIL_PATTERN = re.compile(r'^[a-z0-9!#$%&\'*+/=?^_`{|}~.-]{1,64}@(.+)$')
+
+ENTITY_TYPES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS entity_types (
+        code INTEGER PRIMARY KEY,
+        name TEXT UNIQUE
+    )
+'''
+
+
+def normalize_hostname(name):
+    name = name.strip().lower().rstrip('.')
+    return name if HOSTNAME_PATTERN.match(name) else None
+
+
+def normalize_email(name):
+    name = name.strip().lower()
+    match = EMAIL_PATTERN.match(name)
+    if match is None or normalize_hostname(match.group(1)) is None:
+        return None
+    return name
+
+
+def normalize_ip(name):
+    try:
+        return str(ipaddress.ip_address(name.strip()))
+    except ValueError:
+        return None
+
+
+# Types whose names have a checkable syntax
+VALIDATORS = {
+    'domain': normalize_hostname,
+    'host': normalize_hostname,
+    'email': normalize_email,
+    'ip': normalize_ip,
+}
+
+
+def canonical_type(entity_type, tool=None):
+    """Dictionary name for a tool's native type, or None if it has none"""
+    entity_type = (entity_type or '').strip().lower()
+    entity_type = TOOL_TYPES.get(tool, {}).get(entity_type, entity_type)
+    entity_type = TYPE_ALIASES.get(entity_type, entity_type)
+    return entity_type if entity_type in ENTITY_TYPES else None
+
+
+def canonical_record(record):
+    """Record with canonical type and normalized name, or None if it should be dropped"""
+    entity_type = canonical_type(record.type)
+    if entity_type is None or not record.name:
+        return None
+    validator = VALIDATORS.get(entity_type)
+    name = validator(record.name) if validator else record.name.strip()
+    if not name:
+        return None
+    if name == record.name and entity_type == record.type:
+        return record
+    return record._replace(name=name, type=sys.intern(entity_type))
+
+
+def type_codes(*names):
+    return tuple(ENTITY_TYPES[name] for name in names)
+
+
+def type_code_expression():
+    """CASE expression mapping entities.type to its code"""
+    cases = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in ENTITY_TYPES.items())
+    return f"CASE type {cases} END"
+
+
+def setup_entity_types(conn):
+    """Create the type dictionary and the indexed entities.type_code column"""
+    conn.execute(ENTITY_TYPES_SCHEMA)
+    conn.executemany("INSERT OR REPLACE INTO entity_types (code, name) VALUES (?, ?)",
+                     [(code, name) for name, code in ENTITY_TYPES.items()])
+    columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(entities)")]
+    if 'type_code' not in columns:
+        # VIRTUAL: computed on read, only the index stores it
+        conn.execute(f"ALTER TABLE entities ADD COLUMN type_code INTEGER "
+                     f"GENERATED ALWAYS AS ({type_code_expression()}) VIRTUAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entities_type_code ON entities (type_code)")
+    conn.commit()
+
+
+def type_counts(conn):
+    """Return (type, code, count) for every stored type, code None for types outside the dictionary"""
+    return conn.execute('''
+        SELECT e.type, t.code, COUNT(*) FROM entities e
+        LEFT JOIN entity_types t ON t.name = e.type
+        GROUP BY e.type ORDER BY COUNT(*) DESC
+    ''').fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Entity type dictionary of a correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Stored types with their codes, flagging ones outside the dictionary
+  %(prog)s results/correlations.db
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(args.database)
+        setup_entity_types(conn)
+        for entity_type, code, count in type_counts(conn):
+            label = code if code is not None else 'not in dictionary'
+            print(f"{entity_type}: {count} ({label})")
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Asynchronous HTTP probing of host entities
+
+Replaces piping subfinder output through the external httpx binary. Hosts and
+domains are read straight from correlations.db, probed over HTTPS then HTTP
+with bounded concurrency, a per-host timeout and keep-alive connections reused
+per origin, and the status code, page title and redirect target are written
+back as entity attributes in batches.
+"""
+
+import argparse
+import asyncio
+import gc
+import html
+import re
+import sqlite3
+import ssl
+import sys
+import warnings
+from urllib.parse import urljoin, urlsplit
+
+ENTITY_ATTRIBUTES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS entity_attributes (
+        entity_id INTEGER,
+        name TEXT,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (entity_id, name)
+    ) WITHOUT ROWID
+'''
+
+DEFAULT_CONCURRENCY = 50
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_REDIRECTS = 3
+DEFAULT_REFRESH_SECONDS = 86400
+DEFAULT_BATCH_SIZE = 500
+
+PROBE_TYPES = ('host', 'domain')
+MAX_BODY = 64 * 1024
+MAX_HEADERS = 100
+MAX_IDLE_PER_ORIGIN = 4
+USER_AGENT = "Mozilla/5.0 (compatible; multi-tool-linker)"
+
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+CHARSET_PATTERN = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+ATTRIBUTE_NAMES = ('http_url', 'http_status', 'http_title', 'http_redirect')
+
+
+class ProbeError(Exception):
+    pass
+
+
+def setup_entity_attributes(conn):
+    """Create the per-entity attribute table"""
+    conn.execute(ENTITY_ATTRIBUTES_SCHEMA)
+    conn.commit()
+
+
+class OriginPool:
+    """Idle keep-alive connections keyed by (scheme, host, port)"""
+
+    def __init__(self):
+        self.idle = {}
+        # Probing inventories means plenty of self-signed certificates
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    async def acquire(self, origin, fresh=False):
+        """Return (reader, writer, reused)"""
+        connections = None if fresh else self.idle.get(origin)
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = origin
+        if scheme == 'https':
+            reader, writer = await asyncio.open_connection(host, port, ssl=self.ssl_context, server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return reader, writer, False
+
+    def release(self, origin, reader, writer):
+        connections = self.idle.setdefault(origin, [])
+        if len(connections) < MAX_IDLE_PER_ORIGIN:
+            connections.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+async def read_body(reader, headers):
+    """Read up to MAX_BODY bytes, returns (body, fully_read)"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # Trailer section ends with an empty line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return body, True
+            if len(body) + size > MAX_BODY:
+                body += await reader.readexactly(MAX_BODY - len(body))
+                return body, False
+            body += await reader.readexactly(size)
+            await reader.readline()
+
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        body = await reader.readexactly(min(length, MAX_BODY))
+        return body, length <= MAX_BODY
+
+    # No framing: the body runs to the end of the connection
+    body = await reader.read(MAX_BODY)
+    return body, False
+
+
+async def fetch(pool, url):
+    """GET url over a pooled connection, returns (status, headers, body)"""
+    parts = urlsplit(url)
+    scheme = parts.scheme
+    port = parts.port or (443 if scheme == 'https' else 80)
+    origin = (scheme, parts.hostname, port)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    request = (f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+               f"Accept: text/html,*/*;q=0.8\r\nConnection: keep-alive\r\n\r\n").encode('latin-1')
+
+    for attempt in range(2):
+        reader, writer, reused = await pool.acquire(origin, fresh=attempt > 0)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("connection closed")
+        except (ConnectionError, OSError):
+            writer.close()
+            # An idle connection the server already dropped gets one fresh retry
+            if reused:
+                continue
+            raise
+        except asyncio.CancelledError:
+            # Timed out mid-request, the connection is in no pool to be closed later
+            writer.close()
+            raise
+        break
+
+    keep_alive = False
+    try:
+        version, status = status_line.split(None, 2)[:2]
+        status = int(status)
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304) or 100 <= status < 200:
+            body, complete = b'', True
+        else:
+            body, complete = await read_body(reader, headers)
+        keep_alive = complete and version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    except (ValueError, asyncio.IncompleteReadError) as e:
+        raise ProbeError(f"malformed response from {url}: {e}")
+    finally:
+        # Also reached on cancellation, every connection is either pooled or closed
+        if keep_alive:
+            pool.release(origin, reader, writer)
+        else:
+            writer.close()
+    return status, headers, body
+
+
+def extract_title(headers, body):
+    match = TITLE_PATTERN.search(body)
+    if not match:
+        return None
+    charset = CHARSET_PATTERN.search(headers.get('content-type', ''))
+    try:
+        title = match.group(1).decode(charset.group(1) if charset else 'utf-8', errors='replace')
+    except LookupError:
+        title = match.group(1).decode('utf-8', errors='replace')
+    return ' '.join(html.unescape(title).split())[:200] or None
+
+
+async def probe_url(pool, url, max_redirects=DEFAULT_MAX_REDIRECTS):
+    """GET url and follow its redirects, returns an attribute dict"""
+    status, headers, body = await fetch(pool, url)
+
+    result = {'http_url': url, 'http_status': status, 'http_title': None, 'http_redirect': None}
+    current = url
+    # Follow redirects for the final title, reusing connections on the same origin
+    for _ in range(max_redirects):
+        if not (300 <= status < 400 and headers.get('location')):
+            break
+        current = urljoin(current, headers['location'])
+        result['http_redirect'] = current
+        if urlsplit(current).scheme not in ('http', 'https'):
+            body = b''
+            break
+        try:
+            status, headers, body = await fetch(pool, current)
+        except (OSError, ProbeError, asyncio.IncompleteReadError, UnicodeError, ValueError):
+            body = b''
+            break
+
+    result['http_title'] = extract_title(headers, body)
+    return result
+
+
+async def probe_host(pool, host, max_redirects=DEFAULT_MAX_REDIRECTS, timeout=DEFAULT_TIMEOUT):
+    """Probe https:// then http:// on host, returns an attribute dict or None"""
+    for scheme in ('https', 'http'):
+        # Each scheme gets its own timeout, a hanging TLS port still falls back to HTTP
+        try:
+            return await asyncio.wait_for(probe_url(pool, f"{scheme}://{host}/", max_redirects), timeout)
+        except (OSError, ProbeError, asyncio.IncompleteReadError, UnicodeError, ValueError, asyncio.TimeoutError):
+            continue
+    return None
+
+
+async def probe_all(hosts, on_result, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                    max_redirects=DEFAULT_MAX_REDIRECTS):
+    """Probe (entity_id, host) pairs, calling on_result(entity_id, result) as each finishes"""
+    pool = OriginPool()
+    work = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            item = await work.get()
+            if item is None:
+                return
+            entity_id, host = item
+            on_result(entity_id, await probe_host(pool, host, max_redirects, timeout))
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for item in hosts:
+            await work.put(item)
+        for _ in workers:
+            await work.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        pool.close()
+
+
+async def run_probe_check(timeout):
+    """Probe two local test servers, returns a list of problems"""
+    problems = []
+    open_connections = {'answering': 0, 'stalling': 0}
+
+    def test_server(name, answer):
+        async def handle(reader, writer):
+            open_connections[name] += 1
+            try:
+                first = await reader.read(1)
+                if first == b'\x16':
+                    # TLS hello: the answering server hangs, the stalling one refuses it
+                    if answer:
+                        await reader.read()
+                elif first and not answer:
+                    # Plain HTTP request that never gets a response
+                    await reader.read()
+                elif first:
+                    while True:
+                        request = first + await reader.readuntil(b'\r\n\r\n')
+                        first = b''
+                        if request.startswith(b'GET / '):
+                            response = b"HTTP/1.1 301 Moved\r\nLocation: /home\r\nContent-Length: 0\r\n\r\n"
+                        else:
+                            page = b"<html><title>Home</title></html>"
+                            response = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(page), page)
+                        writer.write(response)
+                        await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+                open_connections[name] -= 1
+        return asyncio.start_server(handle, '127.0.0.1', 0)
+
+    answering = await test_server('answering', True)
+    stalling = await test_server('stalling', False)
+    hosts = [(name, f"127.0.0.1:{server.sockets[0].getsockname()[1]}")
+             for name, server in (('answering', answering), ('stalling', stalling))]
+    results = {}
+    await probe_all(hosts, results.__setitem__, concurrency=2, timeout=timeout)
+
+    expected = {'http_url': f"http://{hosts[0][1]}/", 'http_status': 301, 'http_title': 'Home',
+                'http_redirect': f"http://{hosts[0][1]}/home"}
+    if results.get('answering') != expected:
+        problems.append(f"server hanging on TLS: expected the HTTP fallback {expected}, got {results.get('answering')}")
+    if results.get('stalling') is not None:
+        problems.append(f"server never answering: expected no result, got {results['stalling']}")
+
+    # Closed client connections end their server handlers
+    await asyncio.sleep(0.2)
+    for name, count in open_connections.items():
+        if count:
+            problems.append(f"{count} connections to the {name} server left open")
+    for server in (answering, stalling):
+        server.close()
+    return problems
+
+
+def check_probe(timeout=0.5):
+    """Check timeouts, HTTP fallback and connection cleanup against local servers"""
+    # Writers dropped without close() are only closed by the garbage collector, which warns
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ResourceWarning)
+        problems = asyncio.run(run_probe_check(timeout))
+        gc.collect()
+    problems.extend(f"connection never closed: {warning.message}" for warning in caught
+                    if issubclass(warning.category, ResourceWarning))
+    return problems
+
+
+def hosts_to_probe(conn, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+    """Host and domain entities not probed within refresh_seconds"""
+    return conn.execute(f'''
+        SELECT e.id, e.name FROM entities e
+        WHERE e.type IN ({','.join('?' * len(PROBE_TYPES))})
+        AND NOT EXISTS (
+            SELECT 1 FROM entity_attributes a
+            WHERE a.entity_id = e.id AND a.name = 'http_status'
+            AND a.updated_at >= datetime('now', ?)
+        )
+    ''', (*PROBE_TYPES, f"-{int(refresh_seconds)} seconds"))
+
+
+def store_probe_results(conn, results):
+    """Replace the http_* attributes of probed entities in one transaction"""
+    rows = []
+    for entity_id, result in results:
+        # Unreachable hosts keep an empty status so they are not probed again until refresh
+        result = result or {'http_status': None}
+        rows.extend((entity_id, name, result[name]) for name in ATTRIBUTE_NAMES if name in result)
+
+    with conn:
+        conn.executemany(
+            f"DELETE FROM entity_attributes WHERE entity_id = ? AND name IN ({','.join('?' * len(ATTRIBUTE_NAMES))})",
+            [(entity_id, *ATTRIBUTE_NAMES) for entity_id, _ in results]
+        )
+        conn.executemany('''
+            INSERT INTO entity_attributes (entity_id, name, value) VALUES (?, ?, ?)
+        ''', rows)
+
+
+def probe_database(db_path, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                   max_redirects=DEFAULT_MAX_REDIRECTS, refresh_seconds=DEFAULT_REFRESH_SECONDS,
+                   batch_size=DEFAULT_BATCH_SIZE):
+    """Probe due hosts in db_path, returns (probed, responding)"""
+    conn = sqlite3.connect(db_path)
+    setup_entity_attributes(conn)
+    hosts = hosts_to_probe(conn, refresh_seconds).fetchall()
+    print(f"[+] Probing {len(hosts)} hosts over HTTP(S)")
+
+    pending = []
+    counts = [0, 0]
+
+    def on_result(entity_id, result):
+        pending.append((entity_id, result))
+        counts[0] += 1
+        counts[1] += result is not None
+        if len(pending) >= batch_size:
+            store_probe_results(conn, pending)
+            pending.clear()
+
+    asyncio.run(probe_all(hosts, on_result, concurrency, timeout, max_redirects))
+    if pending:
+        store_probe_results(conn, pending)
+    conn.close()
+
+    print(f"[+] {counts[1]} of {counts[0]} hosts answered over HTTP(S)")
+    return counts[0], counts[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Probe host entities over HTTP(S) and store status, title and redirect",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Probe every host in a correlation database that is due
+  %(prog)s results/correlations.db
+
+  # Re-probe everything with more concurrency
+  %(prog)s results/correlations.db --refresh 0 -j 200
+
+  # Check timeouts and connection cleanup against local test servers
+  %(prog)s --check
+"""
+    )
+    parser.add_argument("database", nargs='?', help="Path to correlations.db")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Hosts probed at the same time")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds allowed per host and scheme")
+    parser.add_argument("--max-redirects", type=int, default=DEFAULT_MAX_REDIRECTS, help="Redirects followed")
+    parser.add_argument("--refresh", type=int, default=DEFAULT_REFRESH_SECONDS,
+                        help="Skip hosts probed within this many seconds")
+    parser.add_argument("--check", action="store_true", help="Probe local test servers instead of a database")
+
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_probe()
+        for problem in problems:
+            print(f"[-] {problem}")
+        if problems:
+            sys.exit(1)
+        print("[+] Probe timeouts, HTTP fallback and connection cleanup work against local servers")
+        return
+    if args.database is None:
+        parser.error("the database argument is required")
+
+    try:
+        probe_database(args.database, args.concurrency, args.timeout, args.max_redirects, args.refresh)
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Lookalike domain detection with MinHash/LSH
+
+Typo and lookalike domains (swapped or doubled letters, homoglyphs, added
+hyphens, another TLD) are found among the discovered domains and hosts in
+three steps. Every registrable domain's label is reduced to a skeleton:
+punycode decoded, confusable characters (Cyrillic a, 0/o, rn/m, ...) folded and
+hyphens dropped. Character bigram MinHash signatures of the skeletons are
+banded into an LSH index, so only labels sharing a whole band become candidate
+pairs instead of all n^2. Candidates are then verified with an edit distance
+(adjacent swaps cost one) that gives up past max_distance, and the survivors
+are stored as `lookalike` relationships scored by their similarity.
+
+Buckets holding more than max_bucket labels are skipped: they are made of
+very common short bigram runs and hold no useful pairs.
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+import unicodedata
+
+import numpy as np
+
+from entity_types import type_codes
+from partitioned_correlation import domain_part, registrable_domain
+
+LOOKALIKE_SOURCE = 'lookalike_detector'
+
+DEFAULT_NUM_PERM = 64
+DEFAULT_BANDS = 16
+DEFAULT_MAX_DISTANCE = 2
+DEFAULT_MIN_SIMILARITY = 0.75
+DEFAULT_MIN_LENGTH = 5
+DEFAULT_MAX_BUCKET = 20
+DEFAULT_MIN_JACCARD = 0.35
+CHUNK = 200000
+
+# Non-Latin and accented characters that render like ASCII letters
+CONFUSABLES = {
+    'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x', 'і': 'i', 'ј': 'j',
+    'ѕ': 's', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'һ': 'h', 'ӏ': 'l', 'к': 'k', 'м': 'm', 'т': 't',
+    'в': 'b', 'н': 'h', 'ο': 'o', 'α': 'a', 'ν': 'v', 'ι': 'i', 'κ': 'k', 'τ': 't', 'ρ': 'p',
+    'ı': 'i', 'ł': 'l', 'ø': 'o', 'ß': 'ss',
+}
+
+# ASCII sequences read as another letter
+ASCII_LOOKALIKES = [('rn', 'm'), ('vv', 'w'), ('0', 'o'), ('1', 'l'), ('3', 'e'), ('5', 's'), ('i', 'l')]
+
+HASH_SHIFT = 32
+
+
+def skeleton(label):
+    """Label with punycode decoded, confusables folded and hyphens dropped"""
+    if label.startswith('xn--'):
+        try:
+            label = label.encode('ascii').decode('idna')
+        except UnicodeError:
+            pass
+    label = ''.join(CONFUSABLES.get(char, char) for char in label.lower())
+    # é -> e, and so on
+    label = ''.join(char for char in unicodedata.normalize('NFKD', label) if not unicodedata.combining(char))
+    for sequence, replacement in ASCII_LOOKALIKES:
+        label = label.replace(sequence, replacement)
+    return label.replace('-', '')
+
+
+def bounded_distance(a, b, limit):
+    """Edit distance with adjacent swaps costing one, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    over = limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        # Only cells within limit of the diagonal can stay under the limit
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i
+        row_min = i if low == 1 else over
+        for j in range(low, high + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return over
+        before, previous = previous, current
+    return min(previous[len(b)], over)
+
+
+def shingle_codes(text):
+    """Character bigrams of ^text$ as integers"""
+    padded = f"^{text}$"
+    return [ord(padded[i]) << 21 | ord(padded[i + 1]) for i in range(len(padded) - 1)]
+
+
+def minhash_signatures(texts, num_perm=DEFAULT_NUM_PERM, seed=1):
+    """(len(texts), num_perm) uint32 MinHash signatures of the bigram sets"""
+    codes = [shingle_codes(text) for text in texts]
+    lengths = np.fromiter((len(c) for c in codes), dtype=np.int64, count=len(codes))
+    shingles = np.fromiter((code for c in codes for code in c), dtype=np.uint64, count=int(lengths.sum()))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Multiply-shift hashing, one odd multiplier per permutation
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    increments = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    with np.errstate(over='ignore'):
+        for k in range(num_perm):
+            hashes = (shingles * multipliers[k] + increments[k]) >> np.uint64(HASH_SHIFT)
+            signatures[:, k] = np.minimum.reduceat(hashes, offsets)
+    return signatures
+
+
+def group_pairs(order, starts, sizes):
+    """All (i, j) index pairs within each group of the sorted order"""
+    pairs = []
+    for size in np.unique(sizes):
+        group_starts = starts[sizes == size]
+        members = order[group_starts[:, None] + np.arange(size)]
+        left, right = np.triu_indices(size, 1)
+        pairs.append(np.stack((members[:, left].ravel(), members[:, right].ravel()), axis=1))
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+
+def lsh_candidates(signatures, bands=DEFAULT_BANDS, max_bucket=DEFAULT_MAX_BUCKET):
+    """Index pairs (i < j) whose signatures agree on at least one whole band"""
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    mixers = np.random.default_rng(0).integers(1, 2 ** 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    keys = []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        with np.errstate(over='ignore'):
+            key = (block * mixers).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(key, kind='stable')
+        sorted_keys = key[order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], boundaries))
+        sizes = np.diff(np.concatenate((starts, [count])))
+        keep = (sizes > 1) & (sizes <= max_bucket)
+        pairs = group_pairs(order, starts[keep], sizes[keep])
+        keys.append(np.minimum(pairs[:, 0], pairs[:, 1]) * count + np.maximum(pairs[:, 0], pairs[:, 1]))
+    unique = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+    return np.stack((unique // count, unique % count), axis=1)
+
+
+def lookalike_similarity(label1, label2, skeleton1, skeleton2, max_distance=DEFAULT_MAX_DISTANCE):
+    """Similarity of two labels from their skeletons' edit distance, None past max_distance"""
+    distance = bounded_distance(skeleton1, skeleton2, max_distance)
+    if distance > max_distance:
+        return None
+    # Same skeleton, different spelling: homoglyphs and hyphens, or only the TLD differs
+    if distance == 0:
+        distance = 0.5 if label1 != label2 else 0.25
+    return round(1.0 - distance / max(len(skeleton1), len(skeleton2)), 3)
+
+
+def find_lookalikes(names, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS, max_distance=DEFAULT_MAX_DISTANCE,
+                    min_similarity=DEFAULT_MIN_SIMILARITY, min_length=DEFAULT_MIN_LENGTH,
+                    max_bucket=DEFAULT_MAX_BUCKET, min_jaccard=DEFAULT_MIN_JACCARD, brands=None, timings=None):
+    """Return (i, j, similarity) for lookalike pairs among registrable domain names"""
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    labels = [name.split('.', 1)[0] for name in names]
+    skeletons = [skeleton(label) for label in labels]
+    eligible = [i for i, text in enumerate(skeletons) if len(text) >= min_length]
+    timings['skeletons'] = time.perf_counter() - started
+    if len(eligible) < 2:
+        return []
+
+    started = time.perf_counter()
+    signatures = minhash_signatures([skeletons[i] for i in eligible], num_perm)
+    timings['minhash'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    candidates = lsh_candidates(signatures, bands, max_bucket)
+    timings['candidates'] = len(candidates)
+    timings['lsh'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    lengths = np.fromiter((len(skeletons[i]) for i in eligible), dtype=np.int64, count=len(eligible))
+    brand_labels = {skeleton(brand.split('.', 1)[0]) for brand in brands or []}
+    is_brand = np.fromiter((skeletons[i] in brand_labels for i in eligible), dtype=bool, count=len(eligible))
+    lookalikes = []
+    for start in range(0, len(candidates), CHUNK):
+        chunk = candidates[start:start + CHUNK]
+        # Cheap vectorized rejections first: signature agreement estimates the Jaccard
+        # similarity, and no pair whose lengths differ too much can pass the edit distance
+        agreement = (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(axis=1)
+        longest = np.maximum(lengths[chunk[:, 0]], lengths[chunk[:, 1]])
+        length_gap = np.abs(lengths[chunk[:, 0]] - lengths[chunk[:, 1]])
+        keep = ((agreement >= min_jaccard) & (length_gap <= max_distance)
+                & (1.0 - length_gap / longest >= min_similarity))
+        if brand_labels:
+            keep &= is_brand[chunk[:, 0]] | is_brand[chunk[:, 1]]
+        for a, b in chunk[keep].tolist():
+            i, j = eligible[a], eligible[b]
+            similarity = lookalike_similarity(labels[i], labels[j], skeletons[i], skeletons[j], max_distance)
+            if similarity is not None and similarity >= min_similarity:
+                lookalikes.append((i, j, similarity))
+    timings['verify'] = time.perf_counter() - started
+    return lookalikes
+
+
+def registrable_representatives(conn):
+    """Return {registrable domain: entity id} using the shortest name under each"""
+    best = {}
+    for entity_id, name, entity_type in conn.execute(
+            f"SELECT id, name, type FROM entities WHERE type_code IN {type_codes('domain', 'host')}"):
+        registrable = registrable_domain(domain_part(name, entity_type))
+        if registrable is None:
+            continue
+        current = best.get(registrable)
+        if current is None or (len(name), entity_id) < current[0]:
+            best[registrable] = ((len(name), entity_id), entity_id)
+    return {registrable: entity_id for registrable, (_, entity_id) in best.items()}
+
+
+def lookalike_pairs(conn, config=None):
+    """Return (entity1 id, entity2 id, similarity) for lookalike registrable domains in the database"""
+    config = config or {}
+    representatives = registrable_representatives(conn)
+    names = list(representatives)
+    pairs = find_lookalikes(
+        names,
+        num_perm=config.get('num_perm', DEFAULT_NUM_PERM),
+        bands=config.get('bands', DEFAULT_BANDS),
+        max_distance=config.get('max_distance', DEFAULT_MAX_DISTANCE),
+        min_similarity=config.get('min_similarity', DEFAULT_MIN_SIMILARITY),
+        min_length=config.get('min_length', DEFAULT_MIN_LENGTH),
+        max_bucket=config.get('max_bucket', DEFAULT_MAX_BUCKET),
+        min_jaccard=config.get('min_jaccard', DEFAULT_MIN_JACCARD),
+        brands=config.get('brands'),
+    )
+    return [(representatives[names[i]], representatives[names[j]], similarity) for i, j, similarity in pairs]
+
+
+def mutate(label, rng):
+    """A typo or lookalike spelling of label"""
+    position = rng.randrange(len(label))
+    kind = rng.randrange(5)
+    if kind == 0 and len(label) > 1:
+        position = min(position, len(label) - 2)
+        return label[:position] + label[position + 1] + label[position] + label[position + 2:]
+    if kind == 1:
+        swaps = {'o': '0', 'l': '1', 'e': '3', 'a': 'а', 'm': 'rn', 'w': 'vv', 'i': 'l'}
+        for i, char in enumerate(label):
+            if char in swaps:
+                return label[:i] + swaps[char] + label[i + 1:]
+    if kind == 2 and 0 < position:
+        return label[:position] + '-' + label[position:]
+    if kind == 3:
+        return label[:position] + label[position + 1:]
+    return label[:position] + label[position] + label[position:]
+
+
+def benchmark(count=1000000, variants=1000, seed=7, **options):
+    """Time lookalike detection over count synthetic names with planted variants, returns timings"""
+    rng = random.Random(seed)
+    onsets = [''] + list('bcdfghjklmnprstvwz') + ['br', 'cl', 'cr', 'dr', 'fl', 'fr', 'gr', 'pl', 'pr', 'sh',
+                                                 'sk', 'sl', 'sp', 'st', 'tr', 'th', 'ch']
+    syllables = [onset + vowel + coda for onset in onsets for vowel in ['a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ou']
+                 for coda in ['', 'n', 'r', 's', 't', 'l', 'm', 'ck', 'nd']]
+    suffixes = ['com', 'net', 'org', 'io', 'co.uk', 'de', 'info']
+    labels = set()
+    while len(labels) < count - variants:
+        labels.add(''.join(rng.choice(syllables) for _ in range(rng.randint(3, 4))))
+    labels = sorted(labels)
+    names = [f"{label}.{rng.choice(suffixes)}" for label in labels]
+
+    # Planted pairs whose skeletons really are within max_distance
+    limit = options.get('max_distance', DEFAULT_MAX_DISTANCE)
+    planted = set()
+    while len(planted) < variants:
+        original = rng.randrange(len(labels))
+        variant = mutate(labels[original], rng)
+        if variant in labels or len(skeleton(labels[original])) < DEFAULT_MIN_LENGTH:
+            continue
+        if bounded_distance(skeleton(variant), skeleton(labels[original]), limit) > limit:
+            continue
+        names.append(f"{variant}.{rng.choice(suffixes)}")
+        planted.add((original, len(names) - 1))
+
+    timings = {}
+    started = time.perf_counter()
+    pairs = find_lookalikes(names, timings=timings, **options)
+    timings['total'] = time.perf_counter() - started
+    found = {(i, j) for i, j, _ in pairs}
+    timings['names'] = len(names)
+    timings['pairs'] = len(pairs)
+    timings['planted_found'] = len(planted & found) / len(planted)
+    return timings
+
+
+def main():
+    # Imported here, the linker itself imports this module
+    from multi_tool_linker import DEFAULT_CONFIG, MultiToolLinker, load_config
+
+    parser = argparse.ArgumentParser(
+        description="Find typo and lookalike domains among discovered names",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Store lookalike relationships in ./results/correlations.db
+  %(prog)s detect -o ./results
+
+  # Only pairs involving our own brands, printed instead of stored
+  %(prog)s detect -o ./results --brand example.com --brand example-bank.com --dry-run
+
+  # Timings and recall over 1M synthetic names with 1000 planted lookalikes
+  %(prog)s bench -n 1000000
+"""
+    )
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    detect_parser = subparsers.add_parser("detect", help="Detect lookalikes in a correlation database")
+    detect_parser.add_argument("-o", "--output", default="./results", help="Output directory holding correlations.db")
+    detect_parser.add_argument("--brand", action="append", help="Only report lookalikes of this domain (repeatable)")
+    detect_parser.add_argument("--dry-run", action="store_true", help="Print pairs without storing them")
+
+    bench_parser = subparsers.add_parser("bench", help="Benchmark on synthetic names")
+    bench_parser.add_argument("-n", "--names", type=int, default=1000000, help="Number of names")
+    bench_parser.add_argument("--variants", type=int, default=1000, help="Planted lookalikes")
+    bench_parser.add_argument("--seed", type=int, default=7, help="Random seed")
+
+    args = parser.parse_args()
+    config = load_config(args.config)
+    lookalike_config = dict(config.get('correlation', {}).get('lookalike', {}))
+
+    if args.command == "bench":
+        options = {key: lookalike_config[key] for key in
+                   ('num_perm', 'bands', 'max_distance', 'min_similarity', 'min_length', 'max_bucket', 'min_jaccard')
+                   if key in lookalike_config}
+        timings = benchmark(args.names, args.variants, args.seed, **options)
+        print(f"[+] {timings['names']} names: {timings['candidates']} candidate pairs, "
+              f"{timings['pairs']} lookalikes, {timings['planted_found']:.1%} of planted pairs found")
+        for stage in ('skeletons', 'minhash', 'lsh', 'verify', 'total'):
+            print(f"    {stage:<12} {timings[stage]:8.2f}s")
+        return
+
+    if args.brand:
+        lookalike_config['brands'] = args.brand
+    linker = MultiToolLinker(args.output, config=config)
+    if args.dry_run:
+        conn = sqlite3.connect(linker.db_path)
+        for entity1_id, entity2_id, similarity in lookalike_pairs(conn, lookalike_config):
+            name1, name2 = (conn.execute("SELECT name FROM entities WHERE id = ?", (entity_id,)).fetchone()[0]
+                            for entity_id in (entity1_id, entity2_id))
+            print(f"{name1} ~ {name2} [{similarity}]")
+        conn.close()
+        return
+    linker.correlate_lookalikes(lookalike_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Local Maltego transform server over correlations.db
+
+Answers Maltego TRX requests (POST /run/<transform>) by expanding the single
+entity sent by Maltego through indexed lookups, instead of importing the whole
+database as entities.mtgx. Each response is capped by the request's soft limit
+and the configured maximum, and cached until the database changes.
+
+Entity types are sent as the Maltego entities named in config.json
+(maltego.entity_types), suspects as maltego.Person. Types without a standard
+Maltego entity (service, os, ...) are sent as the custom entity mtl.<Type>,
+e.g. mtl.Service, which shows as a generic entity unless defined in Maltego.
+"""
+
+import argparse
+import sqlite3
+import sys
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from multi_tool_linker import DEFAULT_CONFIG, add_maltego_entity, load_config
+from query_service import ConnectionPool, DatabaseVersion, ResponseCache
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+# Transform name -> entity types it returns (None means every type)
+TRANSFORMS = {
+    'expand': None,
+    'to_domains': ('domain',),
+    'to_hosts': ('host',),
+    'to_emails': ('email',),
+    'to_ips': ('ip',),
+    'to_suspects': ('suspect',),
+}
+
+# Used for types config.json does not map
+DEFAULT_ENTITY_TYPES = {
+    'domain': 'maltego.Domain',
+    'email': 'maltego.EmailAddress',
+    'host': 'maltego.Website',
+    'ip': 'maltego.IPv4Address',
+    'suspect': 'maltego.Person',
+}
+
+
+def maltego_entity_types(config):
+    """Our entity type -> Maltego entity id, from config maltego.entity_types"""
+    return {**DEFAULT_ENTITY_TYPES, **config.get('maltego', {}).get('entity_types', {})}
+
+
+def parse_request(body):
+    """Return (value, soft limit) from a TRX request body"""
+    root = ET.fromstring(body)
+    value = root.findtext(".//Entities/Entity/Value")
+    if value is None:
+        raise ValueError("request has no entity value")
+    limits = root.find(".//Limits")
+    soft_limit = int(limits.get("SoftLimit", DEFAULT_LIMIT)) if limits is not None else DEFAULT_LIMIT
+    return value.strip(), soft_limit
+
+
+def expand_entity(conn, value, types=None, limit=DEFAULT_LIMIT):
+    """Neighbours of the entity named value, strongest relationships first"""
+    row = conn.execute("SELECT id FROM entities WHERE name = ?", (value,)).fetchone()
+    if row is None:
+        return []
+
+    type_filter = ""
+    args = [row[0]]
+    if types:
+        type_filter = f"AND e.type IN ({','.join('?' * len(types))})"
+        args.extend(types)
+    args = args + args + [limit]
+
+    # Both endpoints are indexed; a UNION ALL keeps each side an index lookup
+    return conn.execute(f'''
+        SELECT name, type, source_tool, confidence, relationship_type, rel_confidence FROM (
+            SELECT e.name, e.type, e.source_tool, e.confidence,
+                   r.relationship_type, r.confidence AS rel_confidence
+            FROM relationships r JOIN entities e ON e.id = r.entity2_id
+            WHERE r.entity1_id = ? {type_filter}
+            UNION ALL
+            SELECT e.name, e.type, e.source_tool, e.confidence,
+                   r.relationship_type, r.confidence AS rel_confidence
+            FROM relationships r JOIN entities e ON e.id = r.entity1_id
+            WHERE r.entity2_id = ? {type_filter}
+        )
+        ORDER BY rel_confidence DESC
+        LIMIT ?
+    ''', args).fetchall()
+
+
+def build_response(neighbours, message=None, entity_types=DEFAULT_ENTITY_TYPES):
+    """Render a TRX response message"""
+    root = ET.Element("MaltegoMessage")
+    response = ET.SubElement(root, "MaltegoTransformResponseMessage")
+    entities_elem = ET.SubElement(response, "Entities")
+
+    for name, entity_type, source_tool, confidence, relationship_type, rel_confidence in neighbours:
+        entity_elem = add_maltego_entity(entities_elem, name, entity_type, source_tool, confidence,
+                                         entity_types)
+        weight = ET.SubElement(entity_elem, "Weight")
+        weight.text = str(int(round((rel_confidence or 0) * 100)))
+        link_field = ET.SubElement(entity_elem.find("AdditionalFields"), "Field")
+        link_field.set("Name", "link#maltego.link.label")
+        link_field.text = relationship_type
+
+    messages = ET.SubElement(response, "UIMessages")
+    if message:
+        ui_message = ET.SubElement(messages, "UIMessage")
+        ui_message.set("MessageType", "Inform")
+        ui_message.text = message
+
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+class TransformHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "CorrelationTRX/1.0"
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_xml(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Maltego probes the transform URL before using it
+        self.send_xml(200, b"<MaltegoMessage/>")
+
+    def do_POST(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if len(parts) != 2 or parts[0] != 'run' or parts[1] not in TRANSFORMS:
+            self.send_xml(404, build_response([], f"Unknown transform {self.path}"))
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            value, soft_limit = parse_request(body)
+        except (ET.ParseError, ValueError) as e:
+            self.send_xml(400, build_response([], f"Bad request: {e}"))
+            return
+
+        limit = max(1, min(soft_limit, self.server.max_limit))
+        cache_key = (self.server.version.current(), parts[1], value, limit)
+        response = self.server.cache.get(cache_key)
+
+        if response is None:
+            with self.server.pool.connection() as conn:
+                neighbours = expand_entity(conn, value, TRANSFORMS[parts[1]], limit)
+            message = None if neighbours else f"No related entities for {value}"
+            response = build_response(neighbours, message, self.server.entity_types)
+            self.server.cache.put(cache_key, response)
+
+        self.send_xml(200, response)
+
+
+class TransformServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, db_path, max_limit=MAX_LIMIT, pool_size=8, verbose=False,
+                 entity_types=DEFAULT_ENTITY_TYPES):
+        super().__init__(address, TransformHandler)
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.version = DatabaseVersion(db_path)
+        self.cache = ResponseCache()
+        self.max_limit = max_limit
+        self.verbose = verbose
+        self.entity_types = entity_types
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local Maltego transform server over correlations.db",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Transforms (add in Maltego as local TRX transforms pointing at /run/<name>):
+  {', '.join(TRANSFORMS)}
+
+Example:
+  %(prog)s results/correlations.db --port 8080
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file (maltego.entity_types)")
+    parser.add_argument("--max-results", type=int, default=MAX_LIMIT, help="Upper bound on entities per response")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+
+    args = parser.parse_args()
+
+    try:
+        server = TransformServer((args.host, args.port), args.database, args.max_results, verbose=args.verbose,
+                                 entity_types=maltego_entity_types(load_config(args.config)))
+    except sqlite3.OperationalError as e:
+        print(f"[-] Cannot open database: {e}")
+        sys.exit(1)
+
+    print(f"[+] Maltego transforms for {args.database} on http://{args.host}:{args.port}/run/<transform>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[-] Transform server stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Merge correlation databases from several scanner hosts
+
+Each source correlations.db is ATTACHed read-only and folded into the target
+with set-based INSERT ... SELECT statements, one transaction per source.
+Entities are unified by name: a name already in the target keeps its id,
+anything new is stored under its deterministic (type, name) id, so sources
+written with hashed ids need no remapping and older rowid databases are
+mapped on the fly. Edges are re-keyed onto (lower id, higher id, type) and
+merged with the target's, observations keep the latest sighting per source
+tool, and the source_tool provenance lists are unioned. Combined confidence
+and asset clusters are recomputed once at the end.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from asset_clusters import update_clusters
+from entity_ids import entity_id, insert_entity
+from multi_tool_linker import DEFAULT_CONFIG, MultiToolLinker, load_config
+
+try:
+    from confidence_scoring import rescore_database
+except ImportError:
+    # numpy missing, merged rows keep the stored per-tool confidence
+    rescore_database = None
+
+
+def merge_sources(existing, incoming):
+    """Union two comma-separated source_tool lists, keeping first-seen order"""
+    tools = [tool for tool in (existing or '').split(',') if tool]
+    for tool in (incoming or '').split(','):
+        if tool and tool not in tools:
+            tools.append(tool)
+    return ','.join(tools)
+
+
+def source_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")}
+
+
+def source_column(conn, table, column, default):
+    """Column expression for an attached table that may predate column"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA src.table_info({table})")]
+    return column if column in columns else default
+
+
+def map_entities(conn):
+    """Fill temp.merge_entities with source id -> target id, inserting new entities"""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS temp.merge_entities")
+    cursor.execute("CREATE TEMP TABLE merge_entities (src_id INTEGER PRIMARY KEY, new_id INTEGER)")
+
+    # Names the target already has keep their id, new names get their hashed id
+    cursor.execute('''
+        INSERT INTO temp.merge_entities (src_id, new_id)
+        SELECT s.id, COALESCE(t.id, entity_id(s.type, s.name))
+        FROM src.entities s LEFT JOIN main.entities t ON t.name = s.name
+    ''')
+
+    created_at = source_column(conn, 'entities', 'created_at', 'CURRENT_TIMESTAMP')
+    cursor.execute(f'''
+        INSERT INTO main.entities (id, name, type, source_tool, confidence, created_at)
+        SELECT m.new_id, s.name, s.type, s.source_tool, s.confidence, {created_at}
+        FROM src.entities s JOIN temp.merge_entities m ON m.src_id = s.id
+        WHERE true
+        ON CONFLICT DO NOTHING
+    ''')
+    inserted = cursor.rowcount
+
+    # Ids held by another name (hash collisions) go through the salting insert one by one
+    collisions = cursor.execute('''
+        SELECT s.id, s.name, s.type, s.source_tool, s.confidence
+        FROM src.entities s
+        JOIN temp.merge_entities m ON m.src_id = s.id
+        LEFT JOIN main.entities e ON e.id = m.new_id
+        WHERE e.name IS NOT s.name
+    ''').fetchall()
+    for src_id, name, entity_type, source_tool, confidence in collisions:
+        stored_id = insert_entity(cursor, name, entity_type, source_tool, confidence)
+        inserted += cursor.rowcount > 0
+        cursor.execute("UPDATE temp.merge_entities SET new_id = ? WHERE src_id = ?", (stored_id, src_id))
+
+    # Keep the earliest first-seen time across scanners
+    if created_at != 'CURRENT_TIMESTAMP':
+        cursor.execute('''
+            UPDATE main.entities SET created_at = s.created_at
+            FROM src.entities s JOIN temp.merge_entities m ON m.src_id = s.id
+            WHERE main.entities.id = m.new_id AND s.created_at < main.entities.created_at
+        ''')
+    return inserted
+
+
+def merge_entity_rows(conn, tables):
+    """Observations and attributes of the mapped entities"""
+    if 'entity_observations' in tables:
+        observed_at = source_column(conn, 'entity_observations', 'observed_at', 'CURRENT_TIMESTAMP')
+        conn.execute(f'''
+            INSERT INTO main.entity_observations (entity_id, source_tool, confidence, observed_at)
+            SELECT m.new_id, o.source_tool, o.confidence, {observed_at}
+            FROM src.entity_observations o JOIN temp.merge_entities m ON m.src_id = o.entity_id
+            WHERE true
+            ON CONFLICT (entity_id, source_tool) DO UPDATE SET
+                confidence = excluded.confidence,
+                observed_at = excluded.observed_at
+            WHERE excluded.observed_at > observed_at
+        ''')
+    else:
+        # Databases from before observations: the row itself is the one sighting
+        conn.execute('''
+            INSERT INTO main.entity_observations (entity_id, source_tool, confidence)
+            SELECT m.new_id, s.source_tool, s.confidence
+            FROM src.entities s JOIN temp.merge_entities m ON m.src_id = s.id
+            WHERE true
+            ON CONFLICT (entity_id, source_tool) DO NOTHING
+        ''')
+
+    if 'entity_attributes' in tables:
+        conn.execute('''
+            INSERT INTO main.entity_attributes (entity_id, name, value, updated_at)
+            SELECT m.new_id, a.name, a.value, a.updated_at
+            FROM src.entity_attributes a JOIN temp.merge_entities m ON m.src_id = a.entity_id
+            WHERE true
+            ON CONFLICT (entity_id, name) DO UPDATE SET
+                value = excluded.value,
+                updated_at = excluded.updated_at
+            WHERE excluded.updated_at > updated_at
+        ''')
+
+
+def merge_relationships(conn, tables):
+    """Re-key source edges onto target ids and merge them, returns edges added"""
+    if 'relationships' not in tables:
+        return 0
+    cursor = conn.cursor()
+    before = cursor.execute("SELECT COUNT(*) FROM main.relationships").fetchone()[0]
+    created_at = source_column(conn, 'relationships', 'created_at', 'CURRENT_TIMESTAMP')
+
+    cursor.execute("DROP TABLE IF EXISTS temp.merge_edges")
+    cursor.execute(f'''
+        CREATE TEMP TABLE merge_edges AS
+        SELECT r.id AS src_id,
+               MIN(m1.new_id, m2.new_id) AS entity1_id,
+               MAX(m1.new_id, m2.new_id) AS entity2_id,
+               r.relationship_type, r.source_tool, r.confidence,
+               {created_at} AS created_at
+        FROM src.relationships r
+        JOIN temp.merge_entities m1 ON m1.src_id = r.entity1_id
+        JOIN temp.merge_entities m2 ON m2.src_id = r.entity2_id
+    ''')
+
+    cursor.execute('''
+        INSERT INTO main.relationships
+            (entity1_id, entity2_id, relationship_type, source_tool, confidence, created_at)
+        SELECT entity1_id, entity2_id, relationship_type, source_tool, confidence, created_at
+        FROM temp.merge_edges
+        WHERE true
+        ON CONFLICT (entity1_id, entity2_id, relationship_type) DO UPDATE SET
+            confidence = MAX(confidence, excluded.confidence),
+            source_tool = merge_sources(source_tool, excluded.source_tool),
+            created_at = MIN(created_at, excluded.created_at)
+    ''')
+
+    if 'relationship_observations' in tables:
+        observed_at = source_column(conn, 'relationship_observations', 'observed_at', 'CURRENT_TIMESTAMP')
+        cursor.execute(f'''
+            INSERT INTO main.relationship_observations (relationship_id, source_tool, confidence, observed_at)
+            SELECT t.id, o.source_tool, o.confidence, {observed_at}
+            FROM src.relationship_observations o
+            JOIN temp.merge_edges e ON e.src_id = o.relationship_id
+            JOIN main.relationships t ON t.entity1_id = e.entity1_id AND t.entity2_id = e.entity2_id
+                AND t.relationship_type = e.relationship_type
+            WHERE true
+            ON CONFLICT (relationship_id, source_tool) DO UPDATE SET
+                confidence = excluded.confidence,
+                observed_at = excluded.observed_at
+            WHERE excluded.observed_at > observed_at
+        ''')
+
+    cursor.execute("DROP TABLE temp.merge_edges")
+    return cursor.execute("SELECT COUNT(*) FROM main.relationships").fetchone()[0] - before
+
+
+def merge_database(conn, source_path):
+    """Fold one source database into the target in a single transaction"""
+    conn.execute("ATTACH DATABASE ? AS src", (f"file:{os.path.abspath(source_path)}?mode=ro",))
+    try:
+        tables = source_tables(conn)
+        if 'entities' not in tables:
+            print(f"[!] {source_path} has no entities table, skipping")
+            return 0, 0
+        with conn:
+            entities = map_entities(conn)
+            merge_entity_rows(conn, tables)
+            relationships = merge_relationships(conn, tables)
+            conn.execute("DROP TABLE temp.merge_entities")
+        return entities, relationships
+    finally:
+        conn.execute("DETACH DATABASE src")
+
+
+def merge_databases(output_dir, sources, config=None):
+    """Merge every source correlations.db into output_dir's database"""
+    linker = MultiToolLinker(output_dir, config=config or {})
+    # ATTACH with a file: URI keeps the sources read-only
+    conn = sqlite3.connect(f"file:{os.path.abspath(linker.db_path)}", uri=True)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.create_function("entity_id", 2, entity_id, deterministic=True)
+    conn.create_function("merge_sources", 2, merge_sources, deterministic=True)
+
+    total_entities = total_relationships = 0
+    started = time.time()
+    for source_path in sources:
+        if os.path.abspath(source_path) == os.path.abspath(linker.db_path):
+            print(f"[!] {source_path} is the target database, skipping")
+            continue
+        source_started = time.time()
+        entities, relationships = merge_database(conn, source_path)
+        total_entities += entities
+        total_relationships += relationships
+        print(f"[+] {source_path}: {entities} new entities, {relationships} new relationships "
+              f"in {time.time() - source_started:.1f}s")
+
+    merges = update_clusters(conn)
+    conn.close()
+
+    if rescore_database is not None:
+        rescore_database(linker.db_path)
+    else:
+        print("[!] numpy not installed, keeping per-tool confidence values")
+
+    print(f"[+] Merged {len(sources)} databases in {time.time() - started:.1f}s: {total_entities} entities, "
+          f"{total_relationships} relationships added ({merges} asset cluster merges)")
+    return total_entities, total_relationships
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge correlations.db files from several scanner hosts",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Fold two scanners' results into ./merged/correlations.db
+  %(prog)s -o ./merged scanner1/results/correlations.db scanner2/results/correlations.db
+
+  # Add another scanner to an existing results directory
+  %(prog)s -o ./results /mnt/scanner3/enhanced_results/python_correlation/correlations.db
+"""
+    )
+    parser.add_argument("sources", nargs='+', help="Source correlations.db files")
+    parser.add_argument("-o", "--output", default="./results", help="Output directory holding the target database")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+
+    args = parser.parse_args()
+
+    missing = [path for path in args.sources if not os.path.exists(path)]
+    if missing:
+        print(f"[-] Source databases not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    try:
+        merge_databases(args.output, args.sources, load_config(args.config))
+    except sqlite3.DatabaseError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
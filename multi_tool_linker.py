@@ -6,6 +6,10 @@ Integrates Maltego, TheHarvester, Recon-ng, SpiderFoot, and other tools
 
 import subprocess
 import json
+import itertools
+import shutil
+import tempfile
+import threading
 import csv
 import xml.etree.ElementTree as ET
 import argparse
@@ -14,11 +18,137 @@ import sys
 from datetime import datetime
 import sqlite3
 import re
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from asset_clusters import largest_clusters, rebuild_clusters, setup_clusters, update_clusters
+from compact_database import ensure_unique_indexes
+from entity_filter import load_name_filter, save_name_filter
+from entity_ids import ensure_entity_ids, insert_entity, resolve_ids
+from entity_types import canonical_record, canonical_type, setup_entity_types, type_codes
+from entity_search import create_search_index
+from http_probe import probe_database, setup_entity_attributes
+from netblock_index import (NETBLOCK_SOURCE, NetblockIndex, index_ip_entities, netblock_rollups,
+                            pending_ip_addresses, ranges_signature, setup_netblocks, unlink_netblock)
+from nmap_ingest import NMAP_SOURCE, iter_nmap_hosts, service_name
+from partitioned_correlation import partitioned_correlations
+from rate_limiter import RateLimiter, output_tail, throttled
+from result_storage import compress_file, compression_from_config, find_result, open_result, open_result_writer
+from run_history import (finish_run, previous_run, record_run_entity, record_run_relationship, setup_run_history,
+                         start_run, write_delta_report)
+from wildcard_dns import WildcardFilter
+
+try:
+    from confidence_scoring import rescore_database
+except ImportError:
+    # numpy is optional, analysis still runs with per-tool confidence
+    rescore_database = None
+
+try:
+    from lookalike_domains import LOOKALIKE_SOURCE, lookalike_pairs
+except ImportError:
+    # numpy missing, lookalike detection is skipped
+    lookalike_pairs = None
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+SPIDERFOOT_PATH = "/usr/share/spiderfoot/sf.py"
+# Sightings remembered for in-batch dedup, forgotten past this many so memory stays flat
+SEEN_WINDOW = 10000
+
+def load_config(config_path=DEFAULT_CONFIG):
+    """Load config.json, returns an empty config if it is missing"""
+    if not config_path or not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+# Compact tuple-backed entity record passed from parsers to the writer and exporter
+EntityRecord = namedtuple('EntityRecord', ['name', 'type', 'source_tool', 'confidence'])
+
+def entity_record(name, entity_type, source_tool, confidence):
+    """Build an entity record, interning the repeated type and source strings"""
+    return EntityRecord(name, sys.intern(entity_type), sys.intern(source_tool), confidence)
+
+def parse_hostname_list(lines, target, source_tool):
+    """Turn hostname-per-line output into host entity records under target
+
+    dnsrecon and fierce print the hostname among other fields
+    ('[*] A www.example.com 192.0.2.1', 'Found: www.example.com. (192.0.2.1)'),
+    the first field under target is taken.
+    """
+    suffix = '.' + target
+    for line in lines:
+        for field in line.lower().split():
+            host = field.rstrip('.')
+            if host == target or host.endswith(suffix):
+                yield entity_record(host, 'host', source_tool, 0.7)
+                break
+
+def add_maltego_entity(entities_elem, name, entity_type, source_tool, confidence, entity_types=None):
+    """Append a Maltego Entity element, returns it
+
+    entity_types maps our types to Maltego entity ids (config maltego.entity_types);
+    types missing from it become the custom entity mtl.<Type>.
+    """
+    entity_elem = ET.SubElement(entities_elem, "Entity")
+    if entity_types is not None:
+        maltego_type = entity_types.get(entity_type) or f"mtl.{entity_type.capitalize()}"
+    else:
+        # Use Person type for suspects, otherwise capitalize the existing type
+        maltego_type = "maltego." + ("Person" if entity_type == 'suspect' else entity_type.capitalize())
+    entity_elem.set("Type", maltego_type)
+    
+    value_elem = ET.SubElement(entity_elem, "Value")
+    value_elem.text = name
+    
+    # Add additional fields
+    additional_fields = ET.SubElement(entity_elem, "AdditionalFields")
+    
+    source_field = ET.SubElement(additional_fields, "Field")
+    source_field.set("Name", "source_tool")
+    source_field.text = source_tool
+    
+    confidence_field = ET.SubElement(additional_fields, "Field")
+    confidence_field.set("Name", "confidence")
+    confidence_field.text = str(confidence)
+    
+    return entity_elem
 
 class MultiToolLinker:
-    def __init__(self, output_dir="./results"):
+    def __init__(self, output_dir="./results", config=None):
         self.output_dir = output_dir
+        self.config = config or {}
         self.db_path = os.path.join(output_dir, "correlations.db")
+        # Reports go to a per-run folder when output.timestamp_folders is set
+        self.report_dir = output_dir
+        # Run that entity and relationship writes are recorded under, see run_history.py
+        self.run_id = None
+        correlation_config = self.config.get('correlation', {})
+        self.confidence_threshold = correlation_config.get('confidence_threshold', 0.0)
+        self.scoring_config = correlation_config.get('scoring', {})
+        self.correlation_workers = correlation_config.get('workers') or os.cpu_count()
+        self.correlation_batch_size = correlation_config.get('partition_batch_size', 20000)
+        self.lookalike_config = correlation_config.get('lookalike', {})
+        self.search_config = self.config.get('search', {})
+        self.probe_config = self.config.get('probe', {})
+        self.dedup_config = self.config.get('dedup', {})
+        self.wildcard_config = self.config.get('wildcard_dns', {})
+        # Created on first use, keeps zone fingerprints across host lists
+        self.wildcard_filter = None
+        self.netblock_config = self.config.get('netblocks', {})
+        # Ranges file index, loaded when there are IPs to look up
+        self.netblock_index = None
+        self.netblock_signature = None
+        # Loaded on first write, see entity_filter.py
+        self.name_filter = None
+        self.compression = compression_from_config(self.config)
+        self.timestamp_folders = self.config.get('output', {}).get('timestamp_folders', False)
+        self.spiderfoot_path = self.config.get('tools', {}).get('spiderfoot', {}).get('path', SPIDERFOOT_PATH)
+        # Upstream API quotas, shared with every other process using the same state file
+        self.rate_limiter = RateLimiter.from_config(self.config)
+        # Seconds spent per analysis stage, read by throughput_harness.py
+        self.stage_times = {}
         self.setup_directories()
         self.setup_database()
         
@@ -35,6 +165,9 @@ class MultiToolLinker:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        # Only takes effect on a new file; lets prune_database shrink it online
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        
         # Create tables for different data types
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS entities (
@@ -61,11 +194,52 @@ class MultiToolLinker:
             )
         ''')
         
+        # Every tool sighting is kept so confidence can be rescored later
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS entity_observations (
+                entity_id INTEGER,
+                source_tool TEXT,
+                confidence REAL,
+                observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (entity_id) REFERENCES entities (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS relationship_observations (
+                relationship_id INTEGER,
+                source_tool TEXT,
+                confidence REAL,
+                observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (relationship_id) REFERENCES relationships (id)
+            )
+        ''')
+        
         conn.commit()
+        
+        # One row per canonical edge and per (row, source) observation
+        ensure_unique_indexes(conn)
+        
+        # The unique edge index covers entity1_id lookups, this covers the other end
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_relationships_entity2 ON relationships (entity2_id)")
+        conn.commit()
+        
+        setup_run_history(conn)
+        setup_entity_types(conn)
+        setup_entity_attributes(conn)
+        setup_clusters(conn)
+        setup_netblocks(conn)
+        # Entity ids are hashes of (type, name); renumbers rowid databases once
+        ensure_entity_ids(conn)
+        
+        # Optional trigram index for substring search over entity names
+        if self.search_config.get('trigram_index'):
+            create_search_index(conn)
+        
         conn.close()
         
     def run_theharvester(self, domain):
-        """Run TheHarvester for email and subdomain enumeration"""
+        """Run TheHarvester for email and subdomain enumeration, yields entity records"""
         print(f"[+] Running TheHarvester on {domain}")
         output_file = os.path.join(self.output_dir, "harvester", f"{domain}_harvester.json")
         
@@ -76,54 +250,49 @@ class MultiToolLinker:
             "-f", output_file
         ]
         
+        self.rate_limiter.acquire('theharvester')
         try:
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            self.rate_limiter.report('theharvester', throttled(result.stdout, result.stderr))
             if result.returncode == 0:
                 print(f"[+] TheHarvester completed. Results saved to {output_file}")
-                return self.parse_harvester_results(output_file)
             else:
                 print(f"[-] TheHarvester failed: {result.stderr}")
+                return
         except subprocess.TimeoutExpired:
+            self.rate_limiter.report('theharvester', True)
             print("[-] TheHarvester timed out")
+            return
         except Exception as e:
             print(f"[-] Error running TheHarvester: {e}")
+            return
         
-        return []
+        yield from self.parse_harvester_results(output_file)
+        if self.compression and os.path.exists(output_file):
+            compress_file(output_file, self.compression)
     
     def parse_harvester_results(self, output_file):
-        """Parse TheHarvester JSON output"""
-        entities = []
+        """Parse TheHarvester JSON output, yields entity records"""
         try:
-            with open(output_file, 'r') as f:
+            with open_result(output_file) as f:
                 data = json.load(f)
                 
             # Extract emails
             if 'emails' in data:
                 for email in data['emails']:
-                    entities.append({
-                        'name': email,
-                        'type': 'email',
-                        'source_tool': 'theharvester',
-                        'confidence': 0.8
-                    })
+                    yield entity_record(email, 'email', 'theharvester', 0.8)
             
             # Extract hosts/subdomains
             if 'hosts' in data:
                 for host in data['hosts']:
-                    entities.append({
-                        'name': host,
-                        'type': 'domain',
-                        'source_tool': 'theharvester',
-                        'confidence': 0.8
-                    })
+                    # Resolved hosts come as "host:ip"
+                    yield entity_record(host.partition(':')[0], 'domain', 'theharvester', 0.8)
                     
         except Exception as e:
             print(f"[-] Error parsing TheHarvester results: {e}")
-            
-        return entities
     
     def run_recon_ng(self, domain):
-        """Run Recon-ng modules"""
+        """Run Recon-ng modules, yields entity records"""
         print(f"[+] Running Recon-ng on {domain}")
         
         # Create recon-ng resource file
@@ -146,119 +315,143 @@ class MultiToolLinker:
         with open(resource_file, 'w') as f:
             f.write('\n'.join(commands))
         
+        self.rate_limiter.acquire('recon-ng')
         try:
             cmd = ["recon-ng", "-r", resource_file]
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            self.rate_limiter.report('recon-ng', throttled(result.stdout, result.stderr))
             
-            if result.returncode == 0:
-                print(f"[+] Recon-ng completed")
-                return self.parse_recon_results()
-            else:
+            if result.returncode != 0:
                 print(f"[-] Recon-ng failed: {result.stderr}")
+                return
+            print(f"[+] Recon-ng completed")
+        except subprocess.TimeoutExpired:
+            self.rate_limiter.report('recon-ng', True)
+            print("[-] Recon-ng timed out")
+            return
         except Exception as e:
             print(f"[-] Error running Recon-ng: {e}")
+            return
             
-        return []
+        yield from self.parse_recon_results()
     
     def parse_recon_results(self):
-        """Parse Recon-ng CSV output"""
-        entities = []
+        """Parse Recon-ng CSV output, yields entity records"""
         try:
-            if os.path.exists("/tmp/recon_hosts.csv"):
-                with open("/tmp/recon_hosts.csv", 'r') as f:
+            if find_result("/tmp/recon_hosts.csv"):
+                with open_result("/tmp/recon_hosts.csv") as f:
                     reader = csv.DictReader(f)
                     for row in reader:
                         if 'host' in row:
-                            entities.append({
-                                'name': row['host'],
-                                'type': 'host',
-                                'source_tool': 'recon-ng',
-                                'confidence': 0.7
-                            })
+                            yield entity_record(row['host'], 'host', 'recon-ng', 0.7)
         except Exception as e:
             print(f"[-] Error parsing Recon-ng results: {e}")
-            
-        return entities
     
     def run_spiderfoot(self, target):
-        """Run SpiderFoot scan"""
+        """Run SpiderFoot scan, yields entity records"""
         print(f"[+] Running SpiderFoot on {target}")
         
         scan_name = f"{target}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
+        self.rate_limiter.acquire('spiderfoot')
         try:
             # Start SpiderFoot scan
             cmd = [
-                "python3", "/usr/share/spiderfoot/sf.py",
+                "python3", self.spiderfoot_path,
                 "-s", target,
                 "-t", "TLD",
                 "-o", "csv"
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+            # Stream stdout straight to the result file instead of holding it in memory;
+            # stderr goes to a file too, a full stderr pipe would stall the child
+            output_file = os.path.join(self.output_dir, "spiderfoot", f"{scan_name}.csv")
+            with open_result_writer(output_file, self.compression, 'wb') as f, tempfile.TemporaryFile() as errors:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+                timer = threading.Timer(600, process.kill)
+                timer.start()
+                try:
+                    shutil.copyfileobj(process.stdout, f)
+                    returncode = process.wait()
+                finally:
+                    timer.cancel()
+                stderr = output_tail(errors)
+            # Killed by the timer counts as a timeout
+            self.rate_limiter.report('spiderfoot', returncode == -9 or throttled(stderr))
             
-            if result.returncode == 0:
-                print(f"[+] SpiderFoot completed")
-                return self.parse_spiderfoot_results(result.stdout)
-            else:
-                print(f"[-] SpiderFoot failed: {result.stderr}")
+            if returncode != 0:
+                print(f"[-] SpiderFoot failed: {stderr}")
+                return
+            print(f"[+] SpiderFoot completed")
         except Exception as e:
             print(f"[-] Error running SpiderFoot: {e}")
+            return
             
-        return []
+        with open_result(output_file) as f:
+            yield from self.parse_spiderfoot_results(f)
     
     def parse_spiderfoot_results(self, output):
-        """Parse SpiderFoot output"""
-        entities = []
-        lines = output.split('\n')
+        """Parse SpiderFoot output, given as text or a stream of lines, yields entity records"""
+        lines = output.split('\n') if isinstance(output, str) else output
         
         for line in lines:
             if ',' in line and not line.startswith('#'):
                 parts = line.split(',')
                 if len(parts) >= 3:
-                    entities.append({
-                        'name': parts[1].strip(),
-                        'type': parts[0].strip().lower(),
-                        'source_tool': 'spiderfoot',
-                        'confidence': 0.6
-                    })
-                    
-        return entities
+                    # SpiderFoot event types outside the type dictionary are not entities
+                    entity_type = canonical_type(parts[0], 'spiderfoot')
+                    if entity_type is not None:
+                        yield entity_record(parts[1].strip(), entity_type, 'spiderfoot', 0.6)
+    
+    def read_host_list(self, path, target):
+        """Yield host records from a hostname-per-line result file (amass, subfinder, ...)"""
+        # Results live under <output>/<tool>/, the folder names the source tool
+        source_tool = os.path.basename(os.path.dirname(os.path.abspath(path))) or 'hostlist'
+        try:
+            with open_result(path) as f:
+                yield from parse_hostname_list(f, target, source_tool)
+        except FileNotFoundError:
+            print(f"[!] Host list {path} not found, skipping")
+    
+    def filter_wildcards(self, records):
+        """Drop host records that only resolve to their zone's wildcard answers, see wildcard_dns.py"""
+        if not self.wildcard_config.get('enabled'):
+            yield from records
+            return
+        if self.wildcard_filter is None:
+            self.wildcard_filter = WildcardFilter.from_config(self.wildcard_config)
+            if self.wildcard_filter is None:
+                print("[!] No DNS resolver configured or in resolv.conf, wildcard filtering disabled")
+                self.wildcard_config = {}
+                yield from records
+                return
+        
+        stats, zones = Counter(), Counter()
+        yield from self.wildcard_filter.filter(records, stats, zones)
+        if stats['hosts']:
+            print(f"[i] Wildcard DNS: {stats['suppressed']} of {stats['hosts']} host records suppressed")
+            for zone, count in zones.most_common(5):
+                answers = ', '.join(sorted(self.wildcard_filter.fingerprints[zone]))
+                print(f"    *.{zone} -> {answers}: {count}")
     
     def create_maltego_transforms(self, entities):
-        """Create Maltego transform data"""
+        """Create Maltego transform data, streaming entity records to the file"""
         print("[+] Creating Maltego transforms")
         
         # Create Maltego XML format
-        maltego_xml = os.path.join(self.output_dir, "maltego", "entities.mtgx")
-        
-        root = ET.Element("MaltegoMessage")
-        transform_response = ET.SubElement(root, "MaltegoTransformResponseMessage")
-        entities_elem = ET.SubElement(transform_response, "Entities")
+        maltego_xml = os.path.join(self.report_dir, "maltego", "entities.mtgx")
         
-        for entity in entities:
-            entity_elem = ET.SubElement(entities_elem, "Entity")
-            # Use Person type for suspects, otherwise capitalize the existing type
-            entity_type = "Person" if entity['type'] == 'suspect' else entity['type'].capitalize()
-            entity_elem.set("Type", f"maltego.{entity_type}")
+        with open(maltego_xml, 'wb') as f:
+            f.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write(b"<MaltegoMessage><MaltegoTransformResponseMessage><Entities>")
             
-            value_elem = ET.SubElement(entity_elem, "Value")
-            value_elem.text = entity['name']
-            
-            # Add additional fields
-            additional_fields = ET.SubElement(entity_elem, "AdditionalFields")
-            
-            source_field = ET.SubElement(additional_fields, "Field")
-            source_field.set("Name", "source_tool")
-            source_field.text = entity['source_tool']
+            # Serialize one Entity element at a time so memory stays flat
+            for entity in entities:
+                holder = ET.Element("Entities")
+                add_maltego_entity(holder, entity.name, entity.type, entity.source_tool, entity.confidence)
+                f.write(ET.tostring(holder[0], encoding='utf-8'))
             
-            confidence_field = ET.SubElement(additional_fields, "Field")
-            confidence_field.set("Name", "confidence")
-            confidence_field.text = str(entity['confidence'])
-        
-        # Write XML file
-        tree = ET.ElementTree(root)
-        tree.write(maltego_xml, encoding='utf-8', xml_declaration=True)
+            f.write(b"</Entities></MaltegoTransformResponseMessage></MaltegoMessage>")
         
         print(f"[+] Maltego transform data saved to {maltego_xml}")
         
@@ -270,10 +463,8 @@ class MultiToolLinker:
         
         for name in suspect_names:
             try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO entities (name, type, source_tool, confidence)
-                    VALUES (?, ?, ?, ?)
-                ''', (name, 'suspect', 'user_input', 1.0))
+                insert_entity(cursor, name, 'suspect', 'user_input', 1.0)
+                self.record_observation(cursor, name, 'user_input', 1.0)
                 print(f"[+] Added suspect: {name}")
             except Exception as e:
                 print(f"[-] Error storing suspect name {name}: {e}")
@@ -281,141 +472,462 @@ class MultiToolLinker:
         conn.commit()
         conn.close()
         
-    def store_entities(self, entities):
-        """Store entities in database"""
-        conn = sqlite3.connect(self.db_path)
+    def record_observation(self, cursor, name, source_tool, confidence):
+        """Record a tool sighting of the named entity"""
+        cursor.execute('''
+            INSERT INTO entity_observations (entity_id, source_tool, confidence)
+            SELECT id, ?, ? FROM entities WHERE name = ?
+            ON CONFLICT (entity_id, source_tool) DO UPDATE SET
+                confidence = excluded.confidence,
+                observed_at = CURRENT_TIMESTAMP
+        ''', (source_tool, confidence, name))
+        if self.run_id is not None:
+            # Own cursor, store_entities reads this cursor's rowcount
+            record_run_entity(cursor.connection, self.run_id, name)
+        
+    def upsert_relationship(self, cursor, entity1_id, entity2_id, relationship_type, source_tool, confidence):
+        """Insert an edge under its canonical key or merge it into the existing one"""
+        entity1_id, entity2_id = min(entity1_id, entity2_id), max(entity1_id, entity2_id)
+        cursor.execute('''
+            INSERT INTO relationships
+            (entity1_id, entity2_id, relationship_type, source_tool, confidence)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (entity1_id, entity2_id, relationship_type) DO UPDATE SET
+                confidence = MAX(confidence, excluded.confidence),
+                source_tool = CASE
+                    WHEN instr(',' || source_tool || ',', ',' || excluded.source_tool || ',') > 0
+                    THEN source_tool
+                    ELSE source_tool || ',' || excluded.source_tool
+                END
+            RETURNING id
+        ''', (entity1_id, entity2_id, relationship_type, source_tool, confidence))
+        relationship_id = cursor.fetchone()[0]
+        
+        cursor.execute('''
+            INSERT INTO relationship_observations (relationship_id, source_tool, confidence)
+            VALUES (?, ?, ?)
+            ON CONFLICT (relationship_id, source_tool) DO UPDATE SET
+                confidence = excluded.confidence,
+                observed_at = CURRENT_TIMESTAMP
+        ''', (relationship_id, source_tool, confidence))
+        if self.run_id is not None:
+            record_run_relationship(cursor.connection, self.run_id, relationship_id,
+                                    entity1_id, entity2_id, relationship_type)
+        return relationship_id
+        
+    def store_entities(self, entities, conn=None, verbose=True):
+        """Store an iterable of entity records, reusing conn when one is given"""
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        if self.name_filter is None:
+            self.name_filter = load_name_filter(conn, self.db_path, self.dedup_config)
+        name_filter = self.name_filter
+        
+        # Repeats of a recent sighting are dropped outright, older ones just upsert again
+        seen = set()
+        received = invalid = repeated = stored = skipped_inserts = 0
         for entity in entities:
+            received += 1
+            # Canonical type and name, malformed domains, emails and IPs are dropped
+            entity = canonical_record(entity)
+            if entity is None:
+                invalid += 1
+                continue
+            sighting = (entity.name, entity.source_tool)
+            if sighting in seen:
+                repeated += 1
+                continue
+            if len(seen) >= SEEN_WINDOW:
+                seen.clear()
+            seen.add(sighting)
+            
             try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO entities (name, type, source_tool, confidence)
-                    VALUES (?, ?, ?, ?)
-                ''', (entity['name'], entity['type'], entity['source_tool'], entity['confidence']))
+                known = name_filter.check_and_add(entity.name)
+                if not known:
+                    insert_entity(cursor, *entity)
+                self.record_observation(cursor, entity.name, entity.source_tool, entity.confidence)
+                
+                if known and cursor.rowcount == 0:
+                    # Filter false positive or a row deleted since, store it after all
+                    insert_entity(cursor, *entity)
+                    self.record_observation(cursor, entity.name, entity.source_tool, entity.confidence)
+                elif known:
+                    skipped_inserts += 1
+                stored += 1
             except Exception as e:
-                print(f"[-] Error storing entity {entity['name']}: {e}")
+                print(f"[-] Error storing entity {entity.name}: {e}")
         
         conn.commit()
-        conn.close()
+        if own_conn:
+            conn.close()
+        
+        if received and verbose:
+            avoided = (invalid + repeated) * 2 + skipped_inserts
+            print(f"[i] Pre-dedup: {invalid} invalid and {repeated} repeated records "
+                  f"dropped, {skipped_inserts} entity inserts skipped ({avoided / (received * 2):.1%} of writes avoided)")
+        return stored
+        
+    def ingest_nmap(self, xml_file, conn=None, batch_size=1000):
+        """Stream an nmap XML scan into ip, service and os entities and their edges"""
+        print(f"[+] Ingesting nmap results from {xml_file}")
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         
-    def find_correlations(self):
-        """Find correlations between entities"""
+        hosts = iter_nmap_hosts(xml_file)
+        total_hosts = total_services = 0
+        while True:
+            batch = list(itertools.islice(hosts, batch_size))
+            if not batch:
+                break
+            
+            records, edges, attributes = [], [], []
+            # Names are canonicalized here, as store_entities would, so edges and ids
+            # use the stored spelling; edges to a dropped name (a bare PTR label) are skipped
+            for host in batch:
+                hostnames = [record for record in (canonical_record(entity_record(hostname, 'host', NMAP_SOURCE, 0.8))
+                                                   for hostname in host.hostnames) if record]
+                os_record = None
+                if host.os_matches:
+                    # Only the best OS guess becomes an entity, weighted by nmap's accuracy
+                    os_name, accuracy = max(host.os_matches, key=lambda match: match[1])
+                    os_record = canonical_record(entity_record(os_name, 'os', NMAP_SOURCE, accuracy / 100))
+                for address in host.addresses:
+                    ip_record = canonical_record(entity_record(address, 'ip', NMAP_SOURCE, 0.9))
+                    if ip_record is None:
+                        continue
+                    address = ip_record.name
+                    records.append(ip_record)
+                    for hostname in hostnames:
+                        records.append(hostname)
+                        edges.append((hostname.name, address, 'resolves_to', 0.8))
+                    for port, protocol, service_attributes in host.services:
+                        name = service_name(address, port, protocol)
+                        records.append(entity_record(name, 'service', NMAP_SOURCE, 0.9))
+                        edges.append((address, name, 'exposes_service', 0.9))
+                        attributes.extend((name, key, value) for key, value in service_attributes.items())
+                    if os_record:
+                        records.append(os_record)
+                        edges.append((address, os_record.name, 'runs_os', os_record.confidence))
+                total_services += len(host.services)
+            total_hosts += len(batch)
+            
+            self.store_entities(records, conn=conn, verbose=False)
+            # Ids are hashes of (type, name), no lookup needed for the edges
+            ids = resolve_ids(cursor, records)
+            for name1, name2, relationship_type, confidence in edges:
+                self.upsert_relationship(cursor, ids[name1], ids[name2], relationship_type, NMAP_SOURCE, confidence)
+            cursor.executemany('''
+                INSERT OR REPLACE INTO entity_attributes (entity_id, name, value) VALUES (?, ?, ?)
+            ''', [(ids[name], key, value) for name, key, value in attributes])
+            conn.commit()
+        
+        if own_conn:
+            conn.close()
+        print(f"[+] nmap: {total_hosts} hosts and {total_services} open ports ingested")
+        
+    def find_correlations(self, conn=None):
+        """Find correlations between entities, reusing conn when one is given"""
         print("[+] Finding correlations between entities")
         
-        conn = sqlite3.connect(self.db_path)
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Find entities that share common patterns
-        cursor.execute('''
-            SELECT e1.id, e1.name, e1.type, e2.id, e2.name, e2.type
+        # Domains, hosts and emails are matched per registrable domain in worker processes
+        correlations = partitioned_correlations(conn, self.correlation_workers, self.correlation_batch_size)
+        
+        # Suspects are free text, the few there are get matched against everything
+        suspect_correlations = conn.execute(f'''
+            SELECT e1.id, e2.id
             FROM entities e1, entities e2
-            WHERE e1.id < e2.id
-            AND (
-                (e1.type = 'email' AND e2.type = 'domain' AND e1.name LIKE '%' || e2.name || '%')
-                OR (e1.type = 'domain' AND e2.type = 'host' AND e2.name LIKE '%' || e1.name || '%')
-                OR (e1.type = 'host' AND e2.type = 'domain' AND e1.name LIKE '%' || e2.name || '%')
-                OR (e1.type = 'suspect' AND (e2.type = 'email' OR e2.type = 'domain' OR e2.type = 'host') 
-                    AND (e1.name LIKE '%' || e2.name || '%' OR e2.name LIKE '%' || e1.name || '%'))
-            )
+            WHERE e1.type_code = {type_codes('suspect')[0]}
+            AND e2.type_code IN {type_codes('email', 'domain', 'host')}
+            AND (e1.name LIKE '%' || e2.name || '%' OR e2.name LIKE '%' || e1.name || '%')
         ''')
         
-        correlations = cursor.fetchall()
-        
-        for corr in correlations:
+        found = 0
+        for entity1_id, entity2_id in itertools.chain(correlations, suspect_correlations):
+            found += 1
             try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO relationships 
-                    (entity1_id, entity2_id, relationship_type, source_tool, confidence)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (corr[0], corr[3], 'domain_association', 'correlation_engine', 0.8))
+                self.upsert_relationship(cursor, entity1_id, entity2_id, 'domain_association', 'correlation_engine', 0.8)
             except Exception as e:
                 print(f"[-] Error storing correlation: {e}")
         
+        linked, unlinked = self.correlate_netblocks(conn)
+        if self.lookalike_config.get('enabled'):
+            self.correlate_lookalikes(self.lookalike_config, conn)
         conn.commit()
-        conn.close()
         
-        print(f"[+] Found {len(correlations)} correlations")
+        # Fold the new edges into the asset clusters; moved IPs can split one
+        merges = rebuild_clusters(conn) if unlinked else update_clusters(conn)
+        if own_conn:
+            conn.close()
+        
+        print(f"[+] Found {found} correlations, {linked} IPs placed in netblocks ({merges} asset cluster merges)")
+        
+    def correlate_lookalikes(self, lookalike_config, conn=None):
+        """Store typo and lookalike registrable domains as scored lookalike relationships"""
+        if lookalike_pairs is None:
+            print("[!] numpy not installed, skipping lookalike detection")
+            return 0
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        pairs = lookalike_pairs(conn, lookalike_config)
+        for entity1_id, entity2_id, similarity in pairs:
+            self.upsert_relationship(cursor, entity1_id, entity2_id, 'lookalike', LOOKALIKE_SOURCE, similarity)
         
-    def generate_report(self):
-        """Generate correlation report"""
+        if own_conn:
+            conn.commit()
+            conn.close()
+        print(f"[+] Found {len(pairs)} lookalike domain pairs")
+        return len(pairs)
+        
+    def correlate_netblocks(self, conn):
+        """Link IPs to their most specific netblock from netblocks.ranges_file, returns (linked, unlinked)"""
+        cursor = conn.cursor()
+        index_ip_entities(conn)
+        
+        ranges_file = self.netblock_config.get('ranges_file')
+        if not ranges_file:
+            return 0, 0
+        if not os.path.exists(ranges_file):
+            print(f"[!] Netblock ranges file {ranges_file} not found, skipping netblock correlation")
+            return 0, 0
+        
+        signature = ranges_signature(ranges_file)
+        pending = pending_ip_addresses(conn, signature)
+        if not pending:
+            return 0, 0
+        if self.netblock_signature != signature:
+            self.netblock_index = NetblockIndex.from_file(ranges_file)
+            self.netblock_signature = signature
+            print(f"[+] Loaded {len(self.netblock_index)} netblock ranges")
+        
+        netblock_ids = {}
+        updates = []
+        linked = unlinked = 0
+        for ip_id, address, old_netblock_id in pending:
+            block = self.netblock_index.lookup(address)
+            netblock_id = 0
+            if block is not None:
+                netblock_id = netblock_ids.get(block.name)
+                if netblock_id is None:
+                    netblock_id = insert_entity(cursor, block.name, 'netblock', NETBLOCK_SOURCE, 1.0)
+                    self.record_observation(cursor, block.name, NETBLOCK_SOURCE, 1.0)
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO entity_attributes (entity_id, name, value) VALUES (?, ?, ?)
+                    ''', [(netblock_id, key, value) for key, value in
+                          (('asn', block.asn), ('as_name', block.description)) if value])
+                    netblock_ids[block.name] = netblock_id
+                self.upsert_relationship(cursor, ip_id, netblock_id, 'ip_netblock', NETBLOCK_SOURCE, 1.0)
+                linked += 1
+            # The ranges file moved this IP to another netblock
+            if old_netblock_id and old_netblock_id != netblock_id:
+                unlinked += unlink_netblock(cursor, ip_id, old_netblock_id)
+            updates.append((netblock_id, ip_id))
+        cursor.executemany("UPDATE ip_addresses SET netblock_id = ? WHERE entity_id = ?", updates)
+        return linked, unlinked
+        
+    def probe_hosts(self):
+        """Probe host entities over HTTP(S) when probe.enabled is set"""
+        if not self.probe_config.get('enabled'):
+            return
+        probe_database(
+            self.db_path,
+            concurrency=self.probe_config.get('concurrency', 50),
+            timeout=self.probe_config.get('timeout', 10),
+            max_redirects=self.probe_config.get('max_redirects', 3),
+            refresh_seconds=self.probe_config.get('refresh_seconds', 86400)
+        )
+        
+    def rescore_confidence(self):
+        """Recompute combined confidence from all tool observations"""
+        if rescore_database is None:
+            print("[!] numpy not installed, keeping per-tool confidence values")
+            return
+        rescore_database(
+            self.db_path,
+            half_life_days=self.scoring_config.get('half_life_days', 180),
+            batch_size=self.scoring_config.get('batch_size', 500000)
+        )
+        
+    def generate_report(self, conn=None):
+        """Generate correlation report, reusing conn when one is given"""
         print("[+] Generating correlation report")
         
-        conn = sqlite3.connect(self.db_path)
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         # Get all entities with their relationships
         cursor.execute('''
             SELECT e.name, e.type, e.source_tool, e.confidence,
-                   COUNT(r.id) as relationship_count
+                   COUNT(r.id) as relationship_count, e.cluster_id
             FROM entities e
             LEFT JOIN relationships r ON (e.id = r.entity1_id OR e.id = r.entity2_id)
+                AND r.confidence >= ?
+            WHERE e.confidence >= ?
             GROUP BY e.id
             ORDER BY relationship_count DESC, e.confidence DESC
-        ''')
-        
-        entities = cursor.fetchall()
+        ''', (self.confidence_threshold, self.confidence_threshold))
         
-        report_file = os.path.join(self.output_dir, "correlation_report.txt")
+        report_file = os.path.join(self.report_dir, "correlation_report.txt")
         
         with open(report_file, 'w') as f:
             f.write("Multi-Tool Correlation Report\n")
             f.write("=" * 50 + "\n\n")
-            f.write(f"Generated: {datetime.now()}\n\n")
+            f.write(f"Generated: {datetime.now()}\n")
+            f.write(f"Confidence threshold: {self.confidence_threshold}\n\n")
+            
+            f.write("Largest Asset Clusters:\n")
+            f.write("-" * 30 + "\n")
+            for cluster_id, size, name, types in largest_clusters(conn):
+                breakdown = ', '.join(f"{count} {entity_type}" for entity_type, count in sorted(types.items()))
+                f.write(f"Cluster {cluster_id}: {size} entities around {name} ({breakdown})\n")
+            f.write("\n")
+            
+            rollups = netblock_rollups(conn)
+            if rollups:
+                f.write("Netblocks:\n")
+                f.write("-" * 30 + "\n")
+                for name, asn, description, ips, hosts, services in rollups:
+                    owner = ' '.join(part for part in (asn, description) if part)
+                    f.write(f"{name}{f' ({owner})' if owner else ''}: {ips} IPs, {hosts} hosts, {services} services\n")
+                f.write("\n")
             
             f.write("Entities by Relationship Count:\n")
             f.write("-" * 30 + "\n")
             
-            for entity in entities:
+            for entity in cursor:
                 f.write(f"Name: {entity[0]}\n")
                 f.write(f"Type: {entity[1]}\n")
                 f.write(f"Source: {entity[2]}\n")
                 f.write(f"Confidence: {entity[3]}\n")
                 f.write(f"Relationships: {entity[4]}\n")
+                f.write(f"Cluster: {entity[5] if entity[5] is not None else '-'}\n")
                 f.write("-" * 20 + "\n")
         
-        conn.close()
+        if own_conn:
+            conn.close()
         
         print(f"[+] Report saved to {report_file}")
         
-    def run_analysis(self, target, suspect_names=None):
-        """Run complete multi-tool analysis"""
-        print(f"[+] Starting multi-tool analysis on {target}")
+    def start_run(self, target):
+        """Record a new run and choose where its reports are written"""
+        conn = sqlite3.connect(self.db_path)
+        run_id = start_run(conn, target)
+        conn.close()
+        self.run_id = run_id
+        
+        if self.timestamp_folders:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            self.report_dir = os.path.join(self.output_dir, "runs", f"{run_id:04d}_{timestamp}")
+            os.makedirs(os.path.join(self.report_dir, "maltego"), exist_ok=True)
+        
+        print(f"[+] Started run {run_id}")
+        return run_id
         
-        all_entities = []
+    def finish_run(self, run_id):
+        """Store run membership and write the delta against the previous run"""
+        conn = sqlite3.connect(self.db_path)
+        finish_run(conn, run_id, self.report_dir)
+        self.run_id = None
+        
+        last_run = previous_run(conn, run_id)
+        if last_run is not None:
+            write_delta_report(conn, last_run, run_id, os.path.join(self.report_dir, "delta_report.txt"))
         
-        # Run each tool
-        all_entities.extend(self.run_theharvester(target))
-        all_entities.extend(self.run_recon_ng(target))
-        all_entities.extend(self.run_spiderfoot(target))
+        conn.close()
         
-        # Store entities in database
-        self.store_entities(all_entities)
+    def flush_name_filter(self):
+        """Persist the name filter, called once a run or stage has stored its entities"""
+        if self.name_filter is not None:
+            save_name_filter(self.name_filter, self.db_path)
+        
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of run_analysis into stage_times"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = self.stage_times.get(name, 0.0) + time.perf_counter() - started
+        
+    def run_analysis(self, target, suspect_names=None, host_lists=None, nmap_files=None):
+        """Run complete multi-tool analysis"""
+        print(f"[+] Starting multi-tool analysis on {target}")
+        
+        run_id = self.start_run(target)
+        
+        # Run each tool, streaming parsed records straight into the database
+        with self.stage('tools_and_ingest'):
+            tool_entities = itertools.chain(
+                self.run_theharvester(target),
+                self.run_recon_ng(target),
+                self.run_spiderfoot(target),
+                # Brute-forced lists are where wildcard zones flood in
+                self.filter_wildcards(itertools.chain(
+                    *(self.read_host_list(path, target) for path in host_lists or [])
+                ))
+            )
+            stored = self.store_entities(tool_entities)
+            print(f"[+] Stored {stored} entity observations")
         
         # Add suspect names if provided
         if suspect_names:
             print(f"[+] Adding {len(suspect_names)} suspect names")
             self.add_suspect_names(suspect_names)
         
+        # Ports, services and OS guesses from nmap XML scans
+        with self.stage('nmap_ingest'):
+            for xml_file in nmap_files or []:
+                self.ingest_nmap(xml_file)
+            # The Bloom file is rewritten once per run, not per stored batch
+            self.flush_name_filter()
+        
+        # Status, title and redirect for every host, stored as entity attributes
+        with self.stage('http_probe'):
+            self.probe_hosts()
+        
         # Find correlations
-        self.find_correlations()
+        with self.stage('correlation'):
+            self.find_correlations()
         
-        # Create Maltego transforms
-        # Query all entities including suspects for transform generation
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, type, source_tool, confidence FROM entities")
-        all_entities = [
-            {'name': row[0], 'type': row[1], 'source_tool': row[2], 'confidence': row[3]}
-            for row in cursor.fetchall()
-        ]
-        conn.close()
+        # Combine per-tool confidence across sources
+        with self.stage('scoring'):
+            self.rescore_confidence()
         
-        self.create_maltego_transforms(all_entities)
+        # Create Maltego transforms
+        # Query all entities including suspects above the threshold for transform generation
+        with self.stage('maltego_export'):
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT name, type, source_tool, confidence FROM entities WHERE confidence >= ?",
+                (self.confidence_threshold,)
+            )
+            self.create_maltego_transforms(map(EntityRecord._make, cursor))
+            conn.close()
         
         # Generate report
-        self.generate_report()
+        with self.stage('report'):
+            self.generate_report()
+        
+        # Record run membership and report what changed since the last run
+        with self.stage('run_history'):
+            self.finish_run(run_id)
         
-        print(f"[+] Analysis complete. Results in {self.output_dir}")
+        print(f"[+] Analysis complete. Results in {self.report_dir}")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -436,15 +948,19 @@ Examples:
     parser.add_argument("target", help="Target domain or entity to analyze")
     parser.add_argument("-o", "--output", default="./results", help="Output directory")
     parser.add_argument("-s", "--suspects", nargs='+', help="List of suspect names to add")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    parser.add_argument("--host-lists", nargs='+', help="Hostname-per-line tool results to ingest (amass, subfinder, ...)")
+    parser.add_argument("--nmap-xml", nargs='+', help="nmap -oX scan results to ingest")
     
     args = parser.parse_args()
     
     try:
         # Create linker instance
-        linker = MultiToolLinker(args.output)
+        linker = MultiToolLinker(args.output, config=load_config(args.config))
         
         # Run analysis with optional suspect names
-        linker.run_analysis(args.target, suspect_names=args.suspects)
+        linker.run_analysis(args.target, suspect_names=args.suspects, host_lists=args.host_lists,
+                            nmap_files=args.nmap_xml)
         
     except KeyboardInterrupt:
         print("\n[-] Analysis interrupted by user")
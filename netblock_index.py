@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+IP/CIDR interval index for netblock correlation
+
+IP entities are also stored as integers in ip_addresses, IPv4 mapped into the
+IPv6 space (::ffff:a.b.c.d) so both families share one ordering; the 16-byte
+big-endian BLOB sorts like the number, so "every IP in this netblock" is an
+indexed BETWEEN. Netblock and ASN ranges are loaded from a local file (CIDR or
+start/end lines, e.g. iptoasn.com's ip2asn TSV, plain or compressed) into a
+sorted interval index: nested or overlapping ranges are flattened into
+disjoint segments labelled with the narrowest range covering them, so finding
+the netblock of an IP is one bisect. ip_addresses.netblock_id remembers the
+answer (0 for no match), so each run only looks up new IPs, or all of them when
+the ranges file changes.
+"""
+
+import argparse
+import heapq
+import ipaddress
+import os
+import random
+import re
+import sqlite3
+import sys
+from bisect import bisect_right
+from collections import namedtuple
+
+from entity_types import type_codes
+from result_storage import open_result
+
+NETBLOCK_SOURCE = 'netblock_index'
+
+# IPv4 lives at ::ffff:0:0/96
+IPV4_MAPPED = 0xffff << 32
+
+ASN_PATTERN = re.compile(r'^(?:AS)?(\d+)$', re.IGNORECASE)
+
+Netblock = namedtuple('Netblock', ['start', 'end', 'name', 'asn', 'description'])
+
+NETBLOCK_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS ip_addresses (
+        entity_id INTEGER PRIMARY KEY,
+        address BLOB,
+        netblock_id INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_ip_addresses_address ON ip_addresses (address)",
+    "CREATE INDEX IF NOT EXISTS idx_ip_addresses_netblock ON ip_addresses (netblock_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS netblock_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''',
+]
+
+
+def ip_to_int(address):
+    """Integer of an IPv4 or IPv6 address in the shared IPv6 ordering, None if malformed"""
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return None
+    return int(ip) + IPV4_MAPPED if ip.version == 4 else int(ip)
+
+
+def ip_blob(value):
+    return value.to_bytes(16, 'big')
+
+
+def range_name(start, end):
+    """CIDR when the range is exactly one network, start-end otherwise"""
+    networks = list(ipaddress.summarize_address_range(start, end))
+    return str(networks[0]) if len(networks) == 1 else f"{start}-{end}"
+
+
+def parse_range(line):
+    """Netblock from a 'CIDR [ASN] [description]' or 'start end [ASN] [description]' line"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    separator = '\t' if '\t' in line else (',' if ',' in line else None)
+    fields = [field.strip() for field in line.split(separator)]
+
+    try:
+        if '/' in fields[0]:
+            network = ipaddress.ip_network(fields[0], strict=False)
+            start, end, rest = network[0], network[-1], fields[1:]
+        else:
+            start, end, rest = ipaddress.ip_address(fields[0]), ipaddress.ip_address(fields[1]), fields[2:]
+    except (ValueError, IndexError):
+        return None
+    if start.version != end.version or start > end:
+        return None
+
+    asn = None
+    match = ASN_PATTERN.match(rest[0]) if rest else None
+    if match:
+        # ip2asn marks unrouted space with AS 0
+        if match.group(1) == '0':
+            return None
+        asn, rest = f"AS{match.group(1)}", rest[1:]
+    description = ' '.join(field for field in rest if field) or None
+    return Netblock(ip_to_int(str(start)), ip_to_int(str(end)), range_name(start, end), asn, description)
+
+
+class NetblockIndex:
+    """Sorted disjoint segments, each labelled with the most specific range covering it"""
+
+    def __init__(self, netblocks):
+        self.netblocks = sorted(netblocks, key=lambda block: (block.start, -block.end))
+        self.starts = []
+        self.ends = []
+        self.labels = []
+
+        # Sweep the range boundaries; between two of them the narrowest covering range
+        # is the label, so nested and partly overlapping ranges are handled alike
+        boundaries = sorted({block.start for block in self.netblocks} | {block.end + 1 for block in self.netblocks})
+        covering = []
+        following = 0
+        for i, point in enumerate(boundaries[:-1]):
+            while following < len(self.netblocks) and self.netblocks[following].start == point:
+                block = self.netblocks[following]
+                # Later ranges win ties, as a duplicate line overrides an earlier one
+                heapq.heappush(covering, (block.end - block.start, -following))
+                following += 1
+            while covering and self.netblocks[-covering[0][1]].end < point:
+                heapq.heappop(covering)
+            if covering:
+                self.segment(point, boundaries[i + 1] - 1, -covering[0][1])
+
+    def segment(self, start, end, label):
+        if self.labels and self.labels[-1] == label and self.ends[-1] + 1 == start:
+            self.ends[-1] = end
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.labels.append(label)
+
+    @classmethod
+    def from_file(cls, path):
+        with open_result(path) as f:
+            return cls(block for block in map(parse_range, f) if block is not None)
+
+    def __len__(self):
+        return len(self.netblocks)
+
+    def lookup(self, value):
+        """Most specific netblock containing the integer address, or None"""
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.netblocks[self.labels[i]]
+        return None
+
+
+def check_index(trials=200, seed=None):
+    """Compare the index with a brute-force scan over random overlapping ranges, returns mismatches"""
+    rng = random.Random(seed)
+    problems = []
+    for trial in range(trials):
+        blocks = []
+        for number in range(rng.randint(1, 12)):
+            start = rng.randint(0, 60)
+            blocks.append(Netblock(start, start + rng.randint(0, 20), f"r{number}", None, None))
+        index = NetblockIndex(blocks)
+        for value in range(0, 85):
+            covering = [(block.end - block.start, -label) for label, block in enumerate(index.netblocks)
+                        if block.start <= value <= block.end]
+            expected = index.netblocks[-min(covering)[1]] if covering else None
+            found = index.lookup(value)
+            if found != expected:
+                ranges = ', '.join(f"[{block.start},{block.end}]" for block in blocks)
+                problems.append(f"{value} in {ranges}: got {found and found.name}, expected {expected and expected.name}")
+                break
+        if len(problems) >= 10:
+            break
+    return problems
+
+
+def ranges_signature(path):
+    """Changes whenever the ranges file is replaced or edited"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def setup_netblocks(conn):
+    """Create ip_addresses and the netblock state table"""
+    for statement in NETBLOCK_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def index_ip_entities(conn):
+    """Add ip entities not yet in ip_addresses, returns how many were added"""
+    rows = conn.execute(f'''
+        SELECT e.id, e.name FROM entities e
+        WHERE e.type_code = {type_codes('ip')[0]}
+        AND NOT EXISTS (SELECT 1 FROM ip_addresses a WHERE a.entity_id = e.id)
+    ''').fetchall()
+    values = []
+    for entity_id, name in rows:
+        value = ip_to_int(name)
+        if value is not None:
+            values.append((entity_id, ip_blob(value)))
+    conn.executemany("INSERT INTO ip_addresses (entity_id, address) VALUES (?, ?)", values)
+    return len(values)
+
+
+def pending_ip_addresses(conn, signature):
+    """Return (entity id, integer address, current netblock id) for IPs needing a lookup"""
+    row = conn.execute("SELECT value FROM netblock_state WHERE key = 'ranges'").fetchone()
+    if row is None or row[0] != signature:
+        # New ranges file, every IP is looked up again
+        rows = conn.execute("SELECT entity_id, address, netblock_id FROM ip_addresses").fetchall()
+        conn.execute("INSERT OR REPLACE INTO netblock_state (key, value) VALUES ('ranges', ?)", (signature,))
+    else:
+        rows = conn.execute(
+            "SELECT entity_id, address, netblock_id FROM ip_addresses WHERE netblock_id IS NULL"
+        ).fetchall()
+    return [(entity_id, int.from_bytes(address, 'big'), netblock_id) for entity_id, address, netblock_id in rows]
+
+
+def unlink_netblock(cursor, ip_id, netblock_id):
+    """Delete the ip_netblock edge between an IP and a netblock it no longer belongs to"""
+    cursor.execute('''
+        DELETE FROM relationship_observations WHERE relationship_id IN (
+            SELECT id FROM relationships
+            WHERE entity1_id = ? AND entity2_id = ? AND relationship_type = 'ip_netblock'
+        )
+    ''', (min(ip_id, netblock_id), max(ip_id, netblock_id)))
+    cursor.execute('''
+        DELETE FROM relationships WHERE entity1_id = ? AND entity2_id = ? AND relationship_type = 'ip_netblock'
+    ''', (min(ip_id, netblock_id), max(ip_id, netblock_id)))
+    return cursor.rowcount
+
+
+def related_count(conn, netblock_id, relationship_type):
+    """Distinct entities linked to the netblock's IPs by relationship_type"""
+    return conn.execute('''
+        SELECT COUNT(DISTINCT CASE WHEN r.entity1_id = a.entity_id THEN r.entity2_id ELSE r.entity1_id END)
+        FROM ip_addresses a
+        JOIN relationships r ON (r.entity1_id = a.entity_id OR r.entity2_id = a.entity_id)
+            AND r.relationship_type = ?
+        WHERE a.netblock_id = ?
+    ''', (relationship_type, netblock_id)).fetchone()[0]
+
+
+def netblock_rollups(conn, limit=20):
+    """Return (netblock, asn, description, ips, hosts, services) for the netblocks with most IPs"""
+    rollups = []
+    for netblock_id, name, ips in conn.execute('''
+        SELECT a.netblock_id, n.name, COUNT(*) FROM ip_addresses a
+        JOIN entities n ON n.id = a.netblock_id
+        GROUP BY a.netblock_id ORDER BY COUNT(*) DESC LIMIT ?
+    ''', (limit,)).fetchall():
+        attributes = dict(conn.execute(
+            "SELECT name, value FROM entity_attributes WHERE entity_id = ?", (netblock_id,)
+        ))
+        rollups.append((name, attributes.get('asn'), attributes.get('as_name'), ips,
+                        related_count(conn, netblock_id, 'resolves_to'),
+                        related_count(conn, netblock_id, 'exposes_service')))
+    return rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Netblock lookups and per-netblock rollups",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Most specific range containing each address
+  %(prog)s lookup ip2asn-combined.tsv.gz 104.16.1.1 2606:4700::1
+
+  # IPs, hosts and services per netblock in a correlation database
+  %(prog)s rollup results/correlations.db
+
+  # Check lookups over random overlapping ranges against a brute-force scan
+  %(prog)s check
+"""
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lookup_parser = subparsers.add_parser("lookup", help="Look addresses up in a ranges file")
+    lookup_parser.add_argument("ranges", help="CIDR or start/end ranges file")
+    lookup_parser.add_argument("addresses", nargs='+', help="IPv4 or IPv6 addresses")
+
+    rollup_parser = subparsers.add_parser("rollup", help="Per-netblock counts from a database")
+    rollup_parser.add_argument("database", help="Path to correlations.db")
+    rollup_parser.add_argument("-n", "--limit", type=int, default=20, help="Netblocks to show")
+
+    check_parser = subparsers.add_parser("check", help="Check the index against a brute-force scan")
+    check_parser.add_argument("-n", "--trials", type=int, default=2000, help="Random range sets to try")
+    check_parser.add_argument("--seed", type=int, help="Random seed")
+
+    args = parser.parse_args()
+
+    if args.command == "lookup":
+        index = NetblockIndex.from_file(args.ranges)
+        print(f"[i] {len(index)} ranges loaded")
+        for address in args.addresses:
+            value = ip_to_int(address)
+            block = index.lookup(value) if value is not None else None
+            if block is None:
+                print(f"{address}: no netblock")
+            else:
+                print(f"{address}: {block.name} {block.asn or ''} {block.description or ''}".rstrip())
+        return
+
+    if args.command == "check":
+        problems = check_index(args.trials, args.seed)
+        for problem in problems:
+            print(f"[-] {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"[+] {args.trials} random range sets match a brute-force scan")
+        return
+
+    try:
+        conn = sqlite3.connect(args.database)
+        setup_netblocks(conn)
+        for name, asn, description, ips, hosts, services in netblock_rollups(conn, args.limit):
+            owner = ' '.join(part for part in (asn, description) if part)
+            print(f"{name}{f' ({owner})' if owner else ''}: {ips} IPs, {hosts} hosts, {services} services")
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
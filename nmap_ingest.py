@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for nmap XML output
+
+Walks nmap -oX files with iterparse and clears every <host> element once it
+has been read, so memory stays flat on /16-sized scans. Each host becomes ip,
+service and os entity records plus the edges between them; the correlator
+stores them in batches (see MultiToolLinker.ingest_nmap).
+"""
+
+import argparse
+import sys
+import xml.etree.ElementTree as ET
+
+from result_storage import open_result
+
+NMAP_SOURCE = 'nmap'
+
+
+class NmapHost:
+    """What the correlator needs from one <host> element"""
+
+    __slots__ = ('addresses', 'hostnames', 'services', 'os_matches')
+
+    def __init__(self, addresses, hostnames, services, os_matches):
+        self.addresses = addresses
+        self.hostnames = hostnames
+        self.services = services
+        self.os_matches = os_matches
+
+
+def parse_host(elem):
+    """Extract addresses, hostnames, open services and OS guesses from a <host>"""
+    status = elem.find('status')
+    if status is not None and status.get('state') != 'up':
+        return None
+
+    addresses = [address.get('addr') for address in elem.iter('address')
+                 if address.get('addrtype') in ('ipv4', 'ipv6')]
+    if not addresses:
+        return None
+    hostnames = [hostname.get('name').lower() for hostname in elem.iter('hostname') if hostname.get('name')]
+
+    services = []
+    for port in elem.iter('port'):
+        state = port.find('state')
+        if state is None or state.get('state') != 'open':
+            continue
+        service = port.find('service')
+        attributes = {}
+        if service is not None:
+            for key in ('name', 'product', 'version', 'extrainfo', 'tunnel'):
+                if service.get(key):
+                    attributes[f"service_{key}"] = service.get(key)
+        services.append((port.get('portid'), port.get('protocol'), attributes))
+
+    os_matches = [(match.get('name'), int(match.get('accuracy', 0)))
+                  for match in elem.iter('osmatch') if match.get('name')]
+
+    return NmapHost(addresses, hostnames, services, os_matches)
+
+
+def iter_nmap_hosts(path):
+    """Yield NmapHost for every up host in an nmap XML file, compressed or not"""
+    with open_result(path, 'rb') as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        root = None
+        for event, elem in context:
+            if root is None:
+                root = elem
+            if event == 'end' and elem.tag == 'host':
+                host = parse_host(elem)
+                # Drop the parsed subtree and the root's reference to it
+                elem.clear()
+                root.clear()
+                if host is not None:
+                    yield host
+
+
+def service_name(address, port, protocol):
+    """Entity name of an open port, e.g. 192.0.2.10:443/tcp"""
+    if ':' in address:
+        return f"[{address}]:{port}/{protocol}"
+    return f"{address}:{port}/{protocol}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarise an nmap XML scan without loading it into memory",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s enhanced_results/nmap/nmap_example.com.xml
+"""
+    )
+    parser.add_argument("files", nargs='+', help="nmap -oX output files")
+
+    args = parser.parse_args()
+
+    try:
+        for path in args.files:
+            hosts = services = 0
+            for host in iter_nmap_hosts(path):
+                hosts += 1
+                services += len(host.services)
+                for port, protocol, attributes in host.services:
+                    print(f"{service_name(host.addresses[0], port, protocol)} {attributes.get('service_name', '')}")
+            print(f"[+] {path}: {hosts} hosts up, {services} open ports")
+    except (OSError, ET.ParseError) as e:
+        print(f"[-] Error reading nmap XML: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Partitioned correlation of domains, hosts and emails
+
+Entities only correlate with entities under the same registrable domain
+(example.co.uk, not co.uk), so the database is split into partitions by that
+key and the partitions are matched in a process pool. Inside a partition a
+name is matched against the domains that are label suffixes of it, a dict
+lookup per label instead of a LIKE scan over every other entity. Workers only
+return (entity1_id, entity2_id) pairs; the caller remains the single writer.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from entity_types import type_codes
+
+try:
+    from publicsuffix2 import get_tld
+except ImportError:
+    # Without publicsuffix2 the built-in list of common multi-label suffixes is used
+    get_tld = None
+
+CORRELATED_TYPES = ('email', 'domain', 'host')
+DEFAULT_BATCH_SIZE = 20000
+
+# Multi-label public suffixes seen most often in recon data
+MULTI_LABEL_SUFFIXES = {
+    'ac.uk', 'co.uk', 'gov.uk', 'ltd.uk', 'me.uk', 'net.uk', 'org.uk', 'plc.uk', 'sch.uk', 'nhs.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'asn.au', 'id.au',
+    'co.nz', 'net.nz', 'org.nz', 'govt.nz', 'ac.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'go.jp',
+    'co.kr', 'or.kr', 'ac.kr', 'go.kr',
+    'com.br', 'net.br', 'org.br', 'gov.br', 'edu.br',
+    'com.cn', 'net.cn', 'org.cn', 'gov.cn', 'edu.cn',
+    'com.hk', 'com.sg', 'com.tw', 'com.my', 'com.ph', 'com.vn', 'com.pk',
+    'co.in', 'net.in', 'org.in', 'gov.in', 'ac.in', 'firm.in',
+    'co.za', 'org.za', 'gov.za', 'ac.za',
+    'com.mx', 'com.ar', 'com.co', 'com.pe', 'com.tr', 'com.ua', 'com.eg', 'com.sa',
+    'co.il', 'org.il', 'ac.il', 'co.id', 'or.id', 'ac.id', 'co.th', 'ac.th',
+    'com.es', 'com.pl', 'com.ru', 'co.at', 'or.at', 'co.ke',
+    'github.io', 'herokuapp.com', 'azurewebsites.net', 'cloudfront.net', 'appspot.com',
+    'blogspot.com', 'netlify.app', 'vercel.app', 'pages.dev', 'workers.dev',
+}
+
+
+def domain_part(name, entity_type):
+    """Hostname part of an entity name, lowercased"""
+    name = name.strip().lower().rstrip('.')
+    if entity_type == 'email':
+        name = name.rpartition('@')[2]
+    return name
+
+
+def registrable_domain(hostname):
+    """example.co.uk for www.example.co.uk, None for bare public suffixes"""
+    labels = hostname.split('.')
+    if get_tld is not None:
+        suffix_length = (get_tld(hostname) or labels[-1]).count('.') + 1
+    else:
+        suffix_length = 2 if '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    if len(labels) <= suffix_length:
+        return None
+    return '.'.join(labels[-suffix_length - 1:])
+
+
+def correlate_partition(entities):
+    """Return (id, id) pairs within one registrable-domain partition"""
+    domains = {}
+    for entity_id, hostname, entity_type in entities:
+        if entity_type == 'domain':
+            domains.setdefault(hostname, []).append(entity_id)
+
+    pairs = []
+    for entity_id, hostname, entity_type in entities:
+        if entity_type == 'domain':
+            continue
+        # Hosts and emails link to every domain entity they sit under
+        labels = hostname.split('.')
+        for start in range(len(labels) - 1):
+            for domain_id in domains.get('.'.join(labels[start:]), ()):
+                pairs.append((domain_id, entity_id))
+    return pairs
+
+
+def correlate_batch(partitions):
+    """Worker entry point: match a batch of registrable-domain partitions"""
+    pairs = []
+    for entities in partitions:
+        pairs.extend(correlate_partition(entities))
+    return pairs
+
+
+def batch_buckets(buckets, batch_size):
+    """Group partitions into batches of about batch_size entities"""
+    batch, size = [], 0
+    # Largest buckets first so the biggest tasks are not left for last
+    for entities in sorted(buckets.values(), key=len, reverse=True):
+        batch.append(entities)
+        size += len(entities)
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def partitioned_correlations(conn, workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield (entity1_id, entity2_id) pairs for domain, host and email entities"""
+    buckets = {}
+    total = 0
+    # type_code is indexed, the type strings are not
+    for entity_id, name, entity_type in conn.execute(f'''
+        SELECT id, name, type FROM entities WHERE type_code IN ({','.join('?' * len(CORRELATED_TYPES))})
+    ''', type_codes(*CORRELATED_TYPES)):
+        hostname = domain_part(name, entity_type)
+        # Bare public suffixes (co.uk) have nothing to correlate with
+        key = registrable_domain(hostname)
+        if key is None:
+            continue
+        buckets.setdefault(key, []).append((entity_id, hostname, entity_type))
+        total += 1
+
+    batches = batch_buckets(buckets, batch_size)
+    if workers == 1 or total <= batch_size:
+        # Not worth starting processes for a single batch
+        for batch in batches:
+            yield from correlate_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for pairs in executor.map(correlate_batch, batches):
+            yield from pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time partitioned correlation on a database without writing edges",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compare worker counts on a large database
+  %(prog)s results/correlations.db -j 1
+  %(prog)s results/correlations.db -j 32
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Entities per worker task")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+        started = time.time()
+        found = sum(1 for _ in partitioned_correlations(conn, args.workers, args.batch_size))
+        print(f"[+] {found} correlations with {args.workers} workers in {time.time() - started:.2f}s")
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Retention policy for the correlation database
+
+Entities not seen by any tool for longer than their type's maximum age
+(retention.max_age_days in config.json) are deleted together with their
+observations, attributes and every relationship that touches them. Deletes
+run in bounded batches, each its own short write transaction with a pause in
+between, so the monitor and the query service are never locked out for long.
+An entity's last sighting is its newest entity_observations row, or its
+created_at if it has none. Run history is left alone, so delta reports still
+list pruned assets as removed.
+
+Freed pages are returned with PRAGMA incremental_vacuum, a few thousand pages
+per transaction, which readers never wait for. Databases created before
+auto_vacuum=INCREMENTAL are converted once with --convert: a VACUUM INTO copy
+in incremental mode is swapped in, which needs the other processes stopped.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from asset_clusters import rebuild_clusters
+from entity_types import ENTITY_TYPES, setup_entity_types
+from multi_tool_linker import DEFAULT_CONFIG, load_config
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PAUSE = 0.05
+DEFAULT_VACUUM_PAGES = 2000
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def table_exists(conn, table):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def retention_days(retention):
+    """Return {type: max age in days} for every type with a limit"""
+    max_age = retention.get('max_age_days', {})
+    default = retention.get('default_days')
+    unknown = sorted(set(max_age) - set(ENTITY_TYPES))
+    if unknown:
+        print(f"[!] Retention set for types outside the dictionary: {', '.join(unknown)}")
+    days = {}
+    for entity_type in ENTITY_TYPES:
+        value = max_age.get(entity_type, default)
+        if value is not None:
+            days[entity_type] = value
+    return days
+
+
+def stale_entities(conn, entity_type, days, after_id, limit):
+    """Next ids of entity_type last seen more than days ago, in id order after after_id"""
+    return [row[0] for row in conn.execute('''
+        SELECT e.id FROM entities e
+        WHERE e.type_code = ? AND e.id > ?
+        AND COALESCE(
+            (SELECT MAX(o.observed_at) FROM entity_observations o WHERE o.entity_id = e.id),
+            e.created_at
+        ) < datetime('now', ?)
+        ORDER BY e.id LIMIT ?
+    ''', (ENTITY_TYPES[entity_type], after_id, f"-{days} days", limit))]
+
+
+def orphaned_relationships(conn, after_id, limit):
+    """Next ids of relationships with an endpoint that no longer exists"""
+    return [row[0] for row in conn.execute('''
+        SELECT r.id FROM relationships r
+        WHERE r.id > ?
+        AND (NOT EXISTS (SELECT 1 FROM entities e WHERE e.id = r.entity1_id)
+             OR NOT EXISTS (SELECT 1 FROM entities e WHERE e.id = r.entity2_id))
+        ORDER BY r.id LIMIT ?
+    ''', (after_id, limit))]
+
+
+def delete_relationships(conn):
+    """Delete the edges in temp.prune_edges and their observations"""
+    if table_exists(conn, 'relationship_observations'):
+        conn.execute('''
+            DELETE FROM relationship_observations
+            WHERE relationship_id IN (SELECT id FROM temp.prune_edges)
+        ''')
+    return conn.execute("DELETE FROM relationships WHERE id IN (SELECT id FROM temp.prune_edges)").rowcount
+
+
+def delete_entities(conn, ids, tables):
+    """Delete one batch of entities and everything hanging off them, returns (entities, relationships)"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM temp.prune_ids")
+        conn.executemany("INSERT INTO temp.prune_ids (id) VALUES (?)", [(entity_id,) for entity_id in ids])
+
+        # Edges from either end; entity2_id has its own index
+        conn.execute("DELETE FROM temp.prune_edges")
+        conn.execute('''
+            INSERT OR IGNORE INTO temp.prune_edges (id)
+            SELECT id FROM relationships WHERE entity1_id IN (SELECT id FROM temp.prune_ids)
+            UNION
+            SELECT id FROM relationships WHERE entity2_id IN (SELECT id FROM temp.prune_ids)
+        ''')
+        relationships = delete_relationships(conn)
+
+        for table in ('entity_observations', 'entity_attributes', 'ip_addresses'):
+            if table in tables:
+                conn.execute(f"DELETE FROM {table} WHERE entity_id IN (SELECT id FROM temp.prune_ids)")
+        if 'ip_addresses' in tables:
+            # IPs of a pruned netblock are looked up again on the next run
+            conn.execute("UPDATE ip_addresses SET netblock_id = NULL WHERE netblock_id IN (SELECT id FROM temp.prune_ids)")
+        if 'entity_id_exceptions' in tables:
+            conn.execute("DELETE FROM entity_id_exceptions WHERE entity_id IN (SELECT id FROM temp.prune_ids)")
+        entities = conn.execute("DELETE FROM entities WHERE id IN (SELECT id FROM temp.prune_ids)").rowcount
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return entities, relationships
+
+
+def delete_orphans(conn, ids):
+    """Delete one batch of orphaned relationships"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM temp.prune_edges")
+        conn.executemany("INSERT INTO temp.prune_edges (id) VALUES (?)", [(edge_id,) for edge_id in ids])
+        removed = delete_relationships(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return removed
+
+
+def prune_entities(conn, days, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE, dry_run=False):
+    """Delete entities past their retention, returns ({type: entities}, relationships removed)"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS prune_ids (id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS prune_edges (id INTEGER PRIMARY KEY)")
+
+    removed = {}
+    relationships = 0
+    for entity_type, max_age in days.items():
+        after_id = -1
+        count = 0
+        while True:
+            ids = stale_entities(conn, entity_type, max_age, after_id, batch_size)
+            if not ids:
+                break
+            after_id = ids[-1]
+            if dry_run:
+                count += len(ids)
+                continue
+            entities, edges = delete_entities(conn, ids, tables)
+            count += entities
+            relationships += edges
+            # Let other writers take the lock between batches
+            time.sleep(pause)
+        if count:
+            removed[entity_type] = count
+
+    # Edges left dangling by anything that deleted entities without cascading
+    after_id = -1
+    while not dry_run:
+        ids = orphaned_relationships(conn, after_id, batch_size)
+        if not ids:
+            break
+        after_id = ids[-1]
+        relationships += delete_orphans(conn, ids)
+        time.sleep(pause)
+    return removed, relationships
+
+
+def incremental_vacuum(conn, pages=DEFAULT_VACUUM_PAGES, pause=DEFAULT_PAUSE):
+    """Return free pages to the filesystem a chunk at a time, returns pages freed"""
+    freed = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            break
+        # The pragma frees one page per result row, step through all of them
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        freed += min(free, pages)
+        time.sleep(pause)
+    # Copy the shrunken pages back without waiting for readers
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return freed
+
+
+def convert_to_incremental(db_path):
+    """Rewrite db_path with auto_vacuum=INCREMENTAL and swap it in, other processes must be stopped"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+    if busy:
+        conn.close()
+        raise sqlite3.OperationalError("database is in use, stop the monitor and query service to convert it")
+    temp_path = f"{db_path}.prune-tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn.execute("VACUUM INTO ?", (temp_path,))
+    conn.close()
+
+    conn = sqlite3.connect(temp_path)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # auto_vacuum only changes on a full rebuild, the copy is still private
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+    os.replace(temp_path, db_path)
+
+
+def prune_database(db_path, retention, dry_run=False, convert=False):
+    """Apply the retention policy to db_path and compact it, returns entities removed"""
+    days = retention_days(retention)
+    if not days:
+        print("[i] No retention limits configured, nothing to prune")
+        return 0
+    batch_size = retention.get('batch_size', DEFAULT_BATCH_SIZE)
+    pause = retention.get('pause_seconds', DEFAULT_PAUSE)
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    setup_entity_types(conn)
+    size_before = os.path.getsize(db_path)
+    started = time.time()
+
+    removed, relationships = prune_entities(conn, days, batch_size, pause, dry_run)
+    for entity_type, count in sorted(removed.items()):
+        print(f"[i] {entity_type}: {count} entities older than {days[entity_type]} days")
+    total = sum(removed.values())
+    if dry_run:
+        print(f"[i] Dry run, {total} entities would be removed")
+        conn.close()
+        return total
+    print(f"[+] Removed {total} entities and {relationships} relationships in {time.time() - started:.1f}s")
+
+    if relationships:
+        # Union-find cannot split clusters, recompute them from the remaining edges
+        rebuild_clusters(conn)
+
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        freed = incremental_vacuum(conn, retention.get('vacuum_pages', DEFAULT_VACUUM_PAGES), pause)
+        conn.close()
+        print(f"[+] Returned {freed} free pages")
+    elif convert:
+        conn.close()
+        print("[+] Converting to auto_vacuum=INCREMENTAL")
+        convert_to_incremental(db_path)
+    else:
+        conn.close()
+        print("[!] auto_vacuum is not incremental, freed pages are reused but the file does not shrink; "
+              "rerun with --convert once while other processes are stopped")
+
+    print(f"[+] Size: {size_before} -> {os.path.getsize(db_path)} bytes")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete entities past their retention and compact the correlation database",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Apply retention.max_age_days from config.json
+  %(prog)s results/correlations.db
+
+  # Show what would be removed, keeping hosts for 90 days
+  %(prog)s results/correlations.db --max-age host=90 --dry-run
+
+  # One-time switch of an older database to incremental vacuum (stop the monitor first)
+  %(prog)s results/correlations.db --convert
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    parser.add_argument("--max-age", action="append", default=[], metavar="TYPE=DAYS",
+                        help="Override the maximum age of one entity type (repeatable)")
+    parser.add_argument("--batch-size", type=int, help="Entities deleted per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Count stale entities without deleting")
+    parser.add_argument("--convert", action="store_true",
+                        help="Rewrite a database without incremental auto_vacuum so it can shrink")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"[-] Database not found: {args.database}")
+        sys.exit(1)
+
+    retention = dict(load_config(args.config).get('retention', {}))
+    retention['max_age_days'] = dict(retention.get('max_age_days', {}))
+    for override in args.max_age:
+        entity_type, _, days = override.partition('=')
+        try:
+            days = float(days)
+        except ValueError:
+            print(f"[-] Invalid --max-age {override}, expected TYPE=DAYS")
+            sys.exit(1)
+        retention['max_age_days'][entity_type] = int(days) if days.is_integer() else days
+    if args.batch_size:
+        retention['batch_size'] = args.batch_size
+
+    try:
+        prune_database(args.database, retention, args.dry_run, args.convert)
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Query-plan audit for the correlation engine's SQL
+
+Runs the engine's heavy paths (find_correlations, generate_report, the suspect
+address report and add_target's cross join) on a copy of a database, with a
+trace callback and a progress handler on the connection. Statements are grouped
+by shape (literals replaced by ?). Each one is charged the time from its first
+step until the next statement starts, and the VM instructions counted in
+between; a cursor still being read while other statements run is charged to
+those. EXPLAIN QUERY PLAN is then captured for every shape, and full SCANs of
+tables holding at least --min-rows rows are flagged.
+
+The check command runs the same paths on a fresh schema and exits non-zero
+when a statement in HOT_QUERIES stops using its index, so a schema change that
+turns a lookup into a scan fails before it ships.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import add_target
+import correlate_suspects
+from multi_tool_linker import DEFAULT_CONFIG, MultiToolLinker, entity_record, load_config
+
+DEFAULT_MIN_ROWS = 10000
+PROGRESS_STEPS = 1000
+
+WORKLOADS = ('find_correlations', 'generate_report', 'suspect_report', 'add_target')
+
+# Statements with no plan worth auditing
+UNPLANNED = {'PRAGMA', 'BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'CREATE', 'DROP',
+             'ALTER', 'ANALYZE', 'VACUUM', 'ATTACH', 'DETACH', 'REINDEX'}
+
+LITERAL_PATTERN = re.compile(r"[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+VALUE_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+# Lookahead, so 'e.name FROM entities e' does not swallow the FROM
+ALIAS_PATTERN = re.compile(r'(?=(?:\bFROM|\bJOIN|,)\s+([\w.]+)\s+(?:AS\s+)?(\w+))', re.IGNORECASE)
+PLAN_TABLE_PATTERN = re.compile(r'^(SCAN|SEARCH) (\S+)')
+ALIAS_KEYWORDS = {'on', 'where', 'join', 'left', 'inner', 'cross', 'natural', 'group', 'order', 'limit',
+                  'set', 'using', 'values', 'select', 'from', 'as', 'and', 'or', 'not', 'union', 'except'}
+
+# Hot statements and the indexes their plan must use: (name, workload, shape pattern, table, indexes)
+HOT_QUERIES = [
+    ('partition read', 'find_correlations',
+     r'^SELECT id, name, type FROM entities WHERE type_code IN', 'entities', ('idx_entities_type_code',)),
+    ('suspect matching', 'find_correlations',
+     r'FROM entities e1, entities e2 WHERE e1\.type_code', 'entities', ('idx_entities_type_code',)),
+    ('new ip entities', 'find_correlations',
+     r'NOT EXISTS \(SELECT \? FROM ip_addresses', 'ip_addresses', ('INTEGER PRIMARY KEY',)),
+    ('cluster edge batches', 'find_correlations',
+     r'FROM relationships WHERE id > \?', 'relationships', ('INTEGER PRIMARY KEY',)),
+    ('report edge counts', 'generate_report',
+     r'COUNT\(r\.id\) as relationship_count', 'relationships', ('idx_relationships_edge', 'idx_relationships_entity2')),
+    ('largest clusters', 'generate_report',
+     r'FROM clusters c LEFT JOIN entities', 'clusters', ('idx_clusters_size',)),
+    ('netblock rollup', 'generate_report',
+     r'FROM ip_addresses a JOIN entities n', 'ip_addresses', ('idx_ip_addresses_netblock',)),
+    ('suspect address lookup', 'suspect_report',
+     r'^SELECT name, metadata FROM entities WHERE name = \?', 'entities', ('sqlite_autoindex_entities_1',)),
+    # No index on type in add_target's schema; SQLite builds one per query instead of pairing every row
+    ('target address pairs', 'add_target',
+     r"FROM entities e1, entities e2 WHERE e1\.type = \?", 'entities', ('AUTOMATIC',)),
+]
+
+
+def statement_shape(sql):
+    """sql with literals and value lists replaced, so repeated executions group together"""
+    shape = LITERAL_PATTERN.sub('?', sql)
+    shape = VALUE_LIST_PATTERN.sub('(?, ...)', shape)
+    return ' '.join(shape.split())
+
+
+def table_aliases(sql):
+    """{alias: table} for 'FROM table alias' and 'JOIN table AS alias' in sql"""
+    return {alias: table.split('.')[-1] for table, alias in ALIAS_PATTERN.findall(sql)
+            if alias.lower() not in ALIAS_KEYWORDS}
+
+
+def explain_plan(conn, sql):
+    """EXPLAIN QUERY PLAN details of sql, unbound parameters bound to NULL"""
+    try:
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    except sqlite3.ProgrammingError as e:
+        # Older Pythons trace the statement without its values; plans do not depend on them
+        count = re.search(r'uses (\d+)', str(e))
+        if count is None:
+            raise
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * int(count.group(1))).fetchall()
+    return [row[3] for row in rows]
+
+
+class StatementStats:
+    """Executions, time, VM steps and plan of one statement shape"""
+
+    def __init__(self, shape, sql):
+        self.shape = shape
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.steps = 0
+        self.plan = []
+        self.scans = []
+        self.error = None
+
+    def as_dict(self):
+        return {'statement': self.shape, 'calls': self.calls, 'seconds': round(self.seconds, 6),
+                'steps': self.steps, 'plan': self.plan,
+                'scans': [{'table': table, 'rows': rows, 'detail': detail} for table, rows, detail in self.scans],
+                'error': self.error}
+
+
+class QueryAudit:
+    """Statements run on the connections it is attached to, see the module docstring"""
+
+    def __init__(self):
+        self.statements = {}
+        self.current = None
+        self.started = None
+
+    def attach(self, conn):
+        conn.set_trace_callback(self.trace)
+        conn.set_progress_handler(self.progress, PROGRESS_STEPS)
+
+    def detach(self, conn):
+        self.finish(time.perf_counter())
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, PROGRESS_STEPS)
+
+    def trace(self, sql):
+        now = time.perf_counter()
+        self.finish(now)
+        sql = sql.strip()
+        # Trigger bodies are traced as comments
+        if not sql or sql.startswith('--') or sql.split(None, 1)[0].upper() in UNPLANNED:
+            return
+        shape = statement_shape(sql)
+        stats = self.statements.get(shape)
+        if stats is None:
+            stats = self.statements[shape] = StatementStats(shape, sql)
+        stats.calls += 1
+        self.current = stats
+        self.started = now
+
+    def progress(self):
+        if self.current is not None:
+            self.current.steps += PROGRESS_STEPS
+        return 0
+
+    def finish(self, now):
+        if self.current is not None:
+            self.current.seconds += now - self.started
+            self.current = None
+
+    def explain(self, conn, min_rows=DEFAULT_MIN_ROWS):
+        """Capture every statement's plan and flag full scans of tables with min_rows or more rows"""
+        tables = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' UNION SELECT name FROM temp.sqlite_master"
+        )}
+        sizes = {}
+        for stats in self.statements.values():
+            stats.plan, stats.scans, stats.error = [], [], None
+            try:
+                stats.plan = explain_plan(conn, stats.sql)
+            except sqlite3.Error as e:
+                # Usually a temp table dropped before the audit ended
+                stats.error = str(e)
+                continue
+            for operation, table, detail in plan_tables(stats):
+                if operation != 'SCAN' or table not in tables:
+                    continue
+                if table not in sizes:
+                    sizes[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                if sizes[table] >= min_rows:
+                    stats.scans.append((table, sizes[table], detail))
+
+    def uses_index(self, pattern, table, indexes):
+        """Statement matching pattern and whether its plan reaches table through one of indexes
+
+        Returns (None, None) when no statement matched. A join may still scan its outer side.
+        """
+        for stats in self.statements.values():
+            if re.search(pattern, stats.shape, re.IGNORECASE):
+                ok = any(plan_table == table and any(f' {index}' in detail for index in indexes)
+                         for _, plan_table, detail in plan_tables(stats))
+                return stats, ok
+        return None, None
+
+
+def plan_tables(stats):
+    """Yield (SCAN or SEARCH, table, detail) for the plan lines of a statement, aliases resolved"""
+    aliases = table_aliases(stats.sql)
+    for detail in stats.plan:
+        match = PLAN_TABLE_PATTERN.match(detail)
+        if match:
+            yield match.group(1), aliases.get(match.group(2), match.group(2)), detail
+
+
+def copy_database(source, destination):
+    """Consistent copy of source, WAL included"""
+    src = sqlite3.connect(f"file:{os.path.abspath(source)}?mode=ro", uri=True)
+    dst = sqlite3.connect(destination)
+    src.backup(dst)
+    dst.close()
+    src.close()
+
+
+def suspect_database(path):
+    """Database with correlate_suspects' own schema and rows, its report does not run on engine databases"""
+    conn = correlate_suspects.setup_database(path)
+    correlate_suspects.add_entities(conn, correlate_suspects.ADDRESS, correlate_suspects.SUSPECTS)
+    correlate_suspects.create_relationships(conn, correlate_suspects.ADDRESS, correlate_suspects.SUSPECTS)
+    return conn
+
+
+def run_workload(name, linker, audit):
+    """Run one engine path on the linker's database with audit attached to its connection"""
+    db_path = linker.db_path
+    if name == 'suspect_report':
+        conn = sqlite3.connect(db_path)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(entities)")]
+        conn.close()
+        if 'metadata' not in columns:
+            db_path = os.path.join(linker.output_dir, 'suspects.db')
+            suspect_database(db_path).close()
+
+    conn = sqlite3.connect(db_path)
+    audit.attach(conn)
+    try:
+        if name == 'find_correlations':
+            linker.find_correlations(conn=conn)
+        elif name == 'generate_report':
+            linker.generate_report(conn=conn)
+        elif name == 'suspect_report':
+            correlate_suspects.generate_correlation_report(conn, linker.output_dir)
+        elif name == 'add_target':
+            add_target.find_correlations(db_path, conn=conn)
+    finally:
+        audit.detach(conn)
+    return conn
+
+
+def audit_workloads(linker, workloads=WORKLOADS, min_rows=DEFAULT_MIN_ROWS):
+    """Run workloads on the linker's database, returns [(workload, QueryAudit)]"""
+    results = []
+    for name in workloads:
+        audit = QueryAudit()
+        conn = run_workload(name, linker, audit)
+        audit.explain(conn, min_rows)
+        conn.close()
+        results.append((name, audit))
+    return results
+
+
+def audit_linker(workdir, config, database=None):
+    """Linker on workdir holding a copy of database, or a fresh schema with a few rows of every kind"""
+    config = json.loads(json.dumps(config))
+    # Worker processes would not be traced, and audited paths must not read a ranges file
+    config.setdefault('correlation', {})['workers'] = 1
+    config.setdefault('netblocks', {})['ranges_file'] = None
+    linker = MultiToolLinker(workdir, config=config)
+    if database:
+        # Copied over the schema the linker just created, so missing indexes stay missing
+        copy_database(database, linker.db_path)
+        return linker
+    linker.store_entities([
+        entity_record('example.com', 'domain', 'seed', 0.9),
+        entity_record('www.example.com', 'host', 'seed', 0.7),
+        entity_record('mail.example.com', 'host', 'seed', 0.7),
+        entity_record('exarnple.com', 'domain', 'seed', 0.6),
+        entity_record('admin@example.com', 'email', 'seed', 0.8),
+        entity_record('192.0.2.10', 'ip', 'seed', 0.9),
+        entity_record('example', 'suspect', 'seed', 1.0),
+        entity_record(add_target.TARGET_INFO['address'], 'physical_address', 'seed', 1.0),
+    ], verbose=False)
+    return linker
+
+
+def print_audit(results, top):
+    for name, audit in results:
+        statements = sorted(audit.statements.values(), key=lambda stats: stats.seconds, reverse=True)
+        calls = sum(stats.calls for stats in statements)
+        seconds = sum(stats.seconds for stats in statements)
+        print(f"\n[+] {name}: {len(statements)} statements, {calls} executions, {seconds:.3f}s")
+        for stats in statements[:top]:
+            print(f"  {stats.calls:>8} calls {stats.seconds * 1000:>10.1f} ms {stats.steps:>12} steps  "
+                  f"{stats.shape[:100]}")
+            for detail in stats.plan:
+                print(f"      {detail}")
+            for table, rows, detail in stats.scans:
+                print(f"      [!] {detail}: full scan of {table} ({rows} rows)")
+            if stats.error:
+                print(f"      [i] No plan: {stats.error}")
+        flagged = sum(bool(stats.scans) for stats in statements)
+        if flagged:
+            print(f"[!] {flagged} statements in {name} scan large tables")
+
+
+def check_hot_queries(results):
+    """Print a line per HOT_QUERIES entry, returns the number that lost their index"""
+    audits = dict(results)
+    failures = 0
+    for name, workload, pattern, table, indexes in HOT_QUERIES:
+        stats, ok = audits[workload].uses_index(pattern, table, indexes)
+        if stats is None:
+            failures += 1
+            print(f"[-] {name}: statement not run by {workload}, update HOT_QUERIES")
+        elif stats.error:
+            print(f"[!] {name}: not checked, {stats.error}")
+        elif ok:
+            print(f"[+] {name}: {table} via {' / '.join(indexes)}")
+        else:
+            failures += 1
+            print(f"[-] {name}: {table} no longer searched via {' / '.join(indexes)}: {'; '.join(stats.plan)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Capture plans and timings of the engine's SQL and flag full scans",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Statements, timings and plans of every audited path on a copy of a database
+  %(prog)s audit results/correlations.db
+
+  # Only the report, flag scans of tables over 1000 rows, keep a JSON copy
+  %(prog)s audit results/correlations.db -w generate_report --min-rows 1000 -o plans.json
+
+  # Fail when a hot query loses its index (fresh schema, or an existing database)
+  %(prog)s check
+  %(prog)s check results/correlations.db
+"""
+    )
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    audit_parser = subparsers.add_parser("audit", help="Trace and explain the engine's statements")
+    audit_parser.add_argument("database", help="Path to correlations.db, left untouched")
+    audit_parser.add_argument("-w", "--workloads", nargs='+', choices=WORKLOADS, default=list(WORKLOADS),
+                              help="Engine paths to run")
+    audit_parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS,
+                              help="Flag full scans of tables with at least this many rows")
+    audit_parser.add_argument("-n", "--top", type=int, default=20, help="Statements shown per path, slowest first")
+    audit_parser.add_argument("-o", "--output", help="Write the audit as JSON")
+
+    check_parser = subparsers.add_parser("check", help="Exit non-zero when a hot query loses its index")
+    check_parser.add_argument("database", nargs='?', help="Explain against this database instead of a fresh schema")
+
+    args = parser.parse_args()
+
+    if args.database and not os.path.exists(args.database):
+        print(f"[-] {args.database} not found")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='mtl_audit_')
+    try:
+        if args.command == "audit":
+            linker = audit_linker(workdir, load_config(args.config), args.database)
+            results = audit_workloads(linker, args.workloads, args.min_rows)
+            print_audit(results, args.top)
+            if args.output:
+                with open(args.output, 'w') as f:
+                    json.dump({name: [stats.as_dict() for stats in audit.statements.values()]
+                               for name, audit in results}, f, indent=2)
+                print(f"[+] Audit written to {args.output}")
+            return
+
+        # Statements come from a small seeded run, a lost index would make the real data crawl
+        linker = audit_linker(workdir, load_config(args.config))
+        workloads = [name for name in WORKLOADS if any(query[1] == name for query in HOT_QUERIES)]
+        results = audit_workloads(linker, workloads)
+        if args.database:
+            conn = sqlite3.connect(f"file:{os.path.abspath(args.database)}?mode=ro", uri=True)
+            for _, audit in results:
+                audit.explain(conn)
+            conn.close()
+        failures = check_hot_queries(results)
+        if failures:
+            print(f"[-] {failures} of {len(HOT_QUERIES)} hot queries lost their index")
+            sys.exit(1)
+        print("[+] No hot query lost its index")
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
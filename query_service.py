@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Read-only HTTP query service over correlations.db
+
+Serves entities, relationships, neighbours and name search as JSON from a pool
+of read-only connections, so dashboards stop opening the database directly.
+Listings use keyset pagination (?after=<last id>, <last name> for search), responses are streamed in
+chunks, and an ETag derived from the database version lets clients and the
+built-in response cache skip work until the next write.
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from entity_search import search_entities
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+CACHE_ENTRIES = 512
+CACHE_MAX_BYTES = 256 * 1024
+BATCH_SIZE = 200
+
+# 63-bit hashed ids lose precision as JSON numbers in JavaScript, they are sent as strings
+ID_COLUMNS = {'id', 'entity_id', 'entity1_id', 'entity2_id'}
+
+
+class ConnectionPool:
+    """Fixed pool of read-only SQLite connections"""
+
+    def __init__(self, db_path, size=8):
+        # WAL lets readers run alongside the writer; it is a property of the file
+        setup = sqlite3.connect(db_path)
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.close()
+
+        self.connections = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self.connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+
+class DatabaseVersion:
+    """Changes whenever another connection commits to the database"""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.data_version = None
+        self.generation = 0
+
+    def current(self):
+        with self.lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                self.data_version = data_version
+                self.generation += 1
+            return f"{self.boot_id}-{self.generation}"
+
+
+class ResponseCache:
+    """Small LRU of rendered responses keyed by request and database version"""
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def page_size(params):
+    return max(1, min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+
+
+def query_entities(conn, params):
+    """Entities after the cursor id, optionally of one type"""
+    query = "SELECT id, name, type, source_tool, confidence FROM entities WHERE id > ?"
+    args = [int(params.get('after', 0))]
+    if 'type' in params:
+        query += " AND type = ?"
+        args.append(params['type'])
+    query += " ORDER BY id LIMIT ?"
+    args.append(page_size(params))
+    columns = ('id', 'name', 'type', 'source_tool', 'confidence')
+    return columns, conn.execute(query, args)
+
+
+def query_relationships(conn, params):
+    """Relationships after the cursor id, optionally of one type"""
+    query = '''
+        SELECT id, entity1_id, entity2_id, relationship_type, source_tool, confidence
+        FROM relationships WHERE id > ?
+    '''
+    args = [int(params.get('after', 0))]
+    if 'type' in params:
+        query += " AND relationship_type = ?"
+        args.append(params['type'])
+    query += " ORDER BY id LIMIT ?"
+    args.append(page_size(params))
+    columns = ('id', 'entity1_id', 'entity2_id', 'relationship_type', 'source_tool', 'confidence')
+    return columns, conn.execute(query, args)
+
+
+def query_neighbours(conn, params, entity_id):
+    """Entities linked to entity_id, paged by relationship id"""
+    limit = page_size(params)
+    after = int(params.get('after', 0))
+    # Two index lookups instead of an OR join so both sides use an index
+    query = '''
+        SELECT * FROM (
+            SELECT r.id AS id, e.id AS entity_id, e.name, e.type, r.relationship_type, r.confidence
+            FROM relationships r JOIN entities e ON e.id = r.entity2_id
+            WHERE r.entity1_id = ? AND r.id > ?
+            UNION ALL
+            SELECT r.id AS id, e.id AS entity_id, e.name, e.type, r.relationship_type, r.confidence
+            FROM relationships r JOIN entities e ON e.id = r.entity1_id
+            WHERE r.entity2_id = ? AND r.id > ?
+        )
+        ORDER BY id LIMIT ?
+    '''
+    columns = ('id', 'entity_id', 'name', 'type', 'relationship_type', 'confidence')
+    return columns, conn.execute(query, (entity_id, after, entity_id, after, limit))
+
+
+def query_search(conn, params):
+    """Name search through the trigram index when present"""
+    if 'q' not in params:
+        raise ValueError("missing q parameter")
+    rows = search_entities(
+        conn, params['q'], glob=params.get('glob') == '1',
+        types=params['type'].split(',') if 'type' in params else None,
+        sources=params['source'].split(',') if 'source' in params else None,
+        limit=page_size(params), after=params.get('after')
+    )
+    return ('id', 'name', 'type', 'source_tool', 'confidence'), iter(rows)
+
+
+def next_batch(rows):
+    """Up to BATCH_SIZE rows from a cursor or iterator, empty when done"""
+    if hasattr(rows, 'fetchmany'):
+        return rows.fetchmany(BATCH_SIZE)
+    return [row for _, row in zip(range(BATCH_SIZE), rows)]
+
+
+# (path, handler, column the listing is ordered by and next_after is taken from)
+ROUTES = [
+    (re.compile(r'^/entities$'), query_entities, 'id'),
+    (re.compile(r'^/relationships$'), query_relationships, 'id'),
+    (re.compile(r'^/entities/(\d+)/neighbours$'), query_neighbours, 'id'),
+    (re.compile(r'^/search$'), query_search, 'name'),
+]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "CorrelationQuery/1.0"
+    # Buffer small writes into full packets and send them without Nagle delays
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json_error(self, status, message):
+        body = json.dumps({'error': message}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        for pattern, handler, cursor_column in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            self.send_json_error(404, "unknown endpoint")
+            return
+
+        version = self.server.version.current()
+        cache_key = (version, self.path)
+        # Stable across processes, unlike hash() on strings
+        etag = f'"{version}-{zlib.crc32(self.path.encode()):08x}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        cached = self.server.cache.get(cache_key)
+        if cached is not None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cached)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(cached)
+            return
+
+        try:
+            with self.server.pool.connection() as conn:
+                columns, rows = handler(conn, params, *map(int, match.groups()))
+                # Read before any header goes out, so a failing query still gets a 400
+                batch = next_batch(rows)
+                self.stream_rows(columns, rows, batch, etag, cache_key, columns.index(cursor_column))
+        except (ValueError, sqlite3.OperationalError) as e:
+            self.send_json_error(400, str(e))
+
+    def stream_rows(self, columns, rows, batch, etag, cache_key, cursor_index=0):
+        """Write batch and the rest of rows as a chunked JSON document, caching it if small"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        buffered = []
+        size = 0
+        last_id = None
+        first = True
+        id_indexes = [index for index, column in enumerate(columns) if column in ID_COLUMNS]
+
+        self.write_chunk(b'{"items": [')
+        buffered.append(b'{"items": [')
+        while batch:
+            parts = []
+            for row in batch:
+                row = list(row)
+                for index in id_indexes:
+                    if row[index] is not None:
+                        row[index] = str(row[index])
+                parts.append(json.dumps(dict(zip(columns, row))))
+                last_id = row[cursor_index]
+            data = (("" if first else ",") + ",".join(parts)).encode()
+            first = False
+            self.write_chunk(data)
+            size += len(data)
+            if size <= CACHE_MAX_BYTES:
+                buffered.append(data)
+            try:
+                batch = next_batch(rows)
+            except (ValueError, sqlite3.Error) as e:
+                # The 200 is already sent, drop the connection without the final chunk
+                # so the client sees a truncated response instead of a short valid one
+                self.log_error("Query failed while streaming %s: %s", self.path, e)
+                self.close_connection = True
+                return
+
+        tail = f'], "next_after": {json.dumps(last_id)}}}'.encode()
+        self.write_chunk(tail)
+        self.wfile.write(b"0\r\n\r\n")
+
+        if size <= CACHE_MAX_BYTES:
+            buffered.append(tail)
+            self.server.cache.put(cache_key, b"".join(buffered))
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, db_path, pool_size=8, verbose=False):
+        super().__init__(address, QueryHandler)
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.version = DatabaseVersion(db_path)
+        self.cache = ResponseCache()
+        self.verbose = verbose
+
+
+def load_test(url, concurrency=16, requests_per_worker=500, paths=None):
+    """Hammer a running service with keep-alive clients and report throughput and latency"""
+    target = urlsplit(url)
+    paths = paths or ["/entities?limit=100", "/relationships?limit=100", "/entities/1/neighbours", "/search?q=com"]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80)
+        local = []
+        for index in range(requests_per_worker):
+            path = paths[(offset + index) % len(paths)]
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(str(e))
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80)
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"[+] {total} requests in {elapsed:.2f}s with {concurrency} clients")
+    print(f"[+] Throughput: {total / elapsed:.0f} req/s")
+    print(f"[+] Latency p50: {latencies[total // 2] * 1000:.2f} ms, "
+          f"p99: {latencies[min(total - 1, int(total * 0.99))] * 1000:.2f} ms")
+    if errors:
+        print(f"[-] {len(errors)} failed requests")
+    return total / elapsed, latencies[min(total - 1, int(total * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Read-only HTTP query service over correlations.db",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Endpoints:
+  GET /entities?type=host&after=<id>&limit=100
+  GET /relationships?type=domain_association&after=<id>
+  GET /entities/<id>/neighbours?after=<relationship id>
+  GET /search?q=mail&type=host,domain&source=recon-ng&glob=1&after=<name>
+
+Examples:
+  %(prog)s serve results/correlations.db --port 8765
+  %(prog)s loadtest http://127.0.0.1:8765 -c 32 -n 1000
+"""
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the query service")
+    serve_parser.add_argument("database", help="Path to correlations.db")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    serve_parser.add_argument("--pool-size", type=int, default=8, help="Read-only connections")
+    serve_parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+
+    load_parser = subparsers.add_parser("loadtest", help="Measure throughput and p99 latency of a running service")
+    load_parser.add_argument("url", help="Base URL of the service")
+    load_parser.add_argument("-c", "--concurrency", type=int, default=16, help="Concurrent clients")
+    load_parser.add_argument("-n", "--requests", type=int, default=500, help="Requests per client")
+    load_parser.add_argument("-p", "--path", action="append", dest="paths", help="Path to request (repeatable)")
+
+    args = parser.parse_args()
+
+    if args.command == "loadtest":
+        load_test(args.url, args.concurrency, args.requests, args.paths)
+        return
+
+    try:
+        server = QueryServer((args.host, args.port), args.database, args.pool_size, args.verbose)
+    except sqlite3.OperationalError as e:
+        print(f"[-] Cannot open database: {e}")
+        sys.exit(1)
+
+    print(f"[+] Serving {args.database} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[-] Query service stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
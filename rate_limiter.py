@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limits for upstream data sources, shared across processes
+
+theHarvester, recon-ng's hackertarget/threatcrowd modules, SpiderFoot and the
+passive enumerators all spend third-party API quota. Every tool run takes one
+token from the bucket of each upstream source it uses (rate_limits.tools in
+config.json), and the buckets live in one small SQLite file so concurrent
+jobs, the monitor, the scheduler and separate linker processes all draw from
+the same quota. A run that reports throttling (HTTP 429, "rate limit", a
+timeout) halves that source's rate and blocks it for a growing cooldown;
+clean runs raise the rate again step by step, so sustained throughput settles
+just under the quota.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+DEFAULT_STATE_FILE = os.path.join(tempfile.gettempdir(), 'multi_tool_rate_limits.db')
+
+DEFAULT_LIMIT = {'rate_per_minute': 10.0, 'burst': 1}
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_RECOVERY_STEP = 0.1
+DEFAULT_MIN_SCALE = 0.05
+DEFAULT_COOLDOWN = 60
+DEFAULT_MAX_COOLDOWN = 3600
+
+# Tool output that means an upstream pushed back
+THROTTLE_PATTERN = re.compile(r'\b429\b|too many requests|rate[ -]?limit|quota exceeded', re.IGNORECASE)
+# Rate-limit messages are looked for in this much of the end of a tool's output
+THROTTLE_TAIL_BYTES = 64 * 1024
+
+BUCKET_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS buckets (
+        source TEXT PRIMARY KEY,
+        tokens REAL,
+        updated_at REAL,
+        scale REAL DEFAULT 1.0,
+        strikes INTEGER DEFAULT 0,
+        blocked_until REAL DEFAULT 0
+    )
+'''
+
+
+def output_tail(f, size=THROTTLE_TAIL_BYTES):
+    """Last size bytes of an open binary file, as text"""
+    f.seek(0, os.SEEK_END)
+    f.seek(max(0, f.tell() - size))
+    return f.read().decode('utf-8', errors='replace')
+
+
+def throttled(*outputs):
+    """True when any tool output looks like an upstream rate-limit response"""
+    return any(output and THROTTLE_PATTERN.search(output) for output in outputs)
+
+
+class RateLimiter:
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.state_file = self.config.get('state_file') or DEFAULT_STATE_FILE
+        self.limits = self.config.get('sources', {})
+        self.tool_sources = self.config.get('tools', {})
+        self.backoff_factor = self.config.get('backoff_factor', DEFAULT_BACKOFF_FACTOR)
+        self.recovery_step = self.config.get('recovery_step', DEFAULT_RECOVERY_STEP)
+        self.min_scale = self.config.get('min_scale', DEFAULT_MIN_SCALE)
+        self.cooldown = self.config.get('cooldown_seconds', DEFAULT_COOLDOWN)
+        self.max_cooldown = self.config.get('max_cooldown_seconds', DEFAULT_MAX_COOLDOWN)
+        self.enabled = self.config.get('enabled', True)
+
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        os.makedirs(directory, exist_ok=True)
+        conn = self.connect()
+        conn.execute(BUCKET_SCHEMA)
+        conn.close()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('rate_limits', {}))
+
+    def connect(self):
+        # Short-lived connections, the file is shared with other processes
+        conn = sqlite3.connect(self.state_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def sources_for(self, tool):
+        if not self.enabled:
+            return []
+        return self.tool_sources.get(tool, [])
+
+    def limit(self, source):
+        limit = dict(DEFAULT_LIMIT)
+        limit.update(self.limits.get(source, {}))
+        return limit
+
+    def refill(self, conn, source, now):
+        """Return (tokens, scale, strikes, blocked_until) for source, refilled up to now"""
+        limit = self.limit(source)
+        row = conn.execute(
+            "SELECT tokens, updated_at, scale, strikes, blocked_until FROM buckets WHERE source = ?", (source,)
+        ).fetchone()
+        if row is None:
+            return float(limit['burst']), 1.0, 0, 0.0
+        tokens, updated_at, scale, strikes, blocked_until = row
+        rate = limit['rate_per_minute'] * scale / 60.0
+        tokens = min(float(limit['burst']), tokens + max(0.0, now - updated_at) * rate)
+        return tokens, scale, strikes, blocked_until
+
+    def save(self, conn, source, now, tokens, scale, strikes, blocked_until):
+        conn.execute('''
+            INSERT OR REPLACE INTO buckets (source, tokens, updated_at, scale, strikes, blocked_until)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (source, tokens, now, scale, strikes, blocked_until))
+
+    def wait_time(self, buckets, now):
+        """Seconds until every bucket has a token and no source is cooling down"""
+        wait = 0.0
+        for source, (tokens, scale, _, blocked_until) in buckets.items():
+            rate = self.limit(source)['rate_per_minute'] * scale / 60.0
+            wait = max(wait, blocked_until - now, (1.0 - tokens) / rate if tokens < 1.0 else 0.0)
+        return wait
+
+    def try_acquire(self, tool):
+        """Take a token from every source of tool, returns 0 or seconds to wait"""
+        sources = self.sources_for(tool)
+        if not sources:
+            return 0.0
+
+        conn = self.connect()
+        try:
+            # IMMEDIATE takes the write lock first, so two processes cannot spend the same token
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            buckets = {source: self.refill(conn, source, now) for source in sources}
+            wait = self.wait_time(buckets, now)
+
+            # All or nothing, a blocked source keeps the others' tokens intact
+            for source, (tokens, scale, strikes, blocked_until) in buckets.items():
+                self.save(conn, source, now, tokens - (1.0 if wait <= 0 else 0.0), scale, strikes, blocked_until)
+            conn.execute("COMMIT")
+            return max(wait, 0.0)
+        finally:
+            conn.close()
+
+    def delay(self, tool):
+        """Seconds until tool could start, without taking tokens"""
+        sources = self.sources_for(tool)
+        if not sources:
+            return 0.0
+        conn = self.connect()
+        try:
+            now = time.time()
+            return self.wait_time({source: self.refill(conn, source, now) for source in sources}, now)
+        finally:
+            conn.close()
+
+    def acquire(self, tool, max_wait=None):
+        """Block until tool may hit its upstream sources, returns seconds waited"""
+        started = time.time()
+        announced = False
+        while True:
+            wait = self.try_acquire(tool)
+            if wait <= 0:
+                return time.time() - started
+            if max_wait is not None and time.time() - started + wait > max_wait:
+                raise TimeoutError(f"{tool} rate limited for another {wait:.0f}s")
+            if not announced:
+                print(f"[i] {tool} rate limited, waiting {wait:.0f}s for {', '.join(self.sources_for(tool))}")
+                announced = True
+            time.sleep(wait)
+
+    def report(self, tool, was_throttled):
+        """Feed a run's outcome back: back off on throttling, recover on success"""
+        sources = self.sources_for(tool)
+        if not sources:
+            return
+
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            for source in sources:
+                tokens, scale, strikes, blocked_until = self.refill(conn, source, now)
+                if was_throttled:
+                    # Multiplicative decrease and an exponentially growing pause
+                    strikes += 1
+                    scale = max(self.min_scale, scale * self.backoff_factor)
+                    blocked_until = now + min(self.max_cooldown, self.cooldown * 2 ** (strikes - 1))
+                    tokens = 0.0
+                else:
+                    # Additive increase back towards the configured rate
+                    strikes = 0
+                    scale = min(1.0, scale + self.recovery_step)
+                self.save(conn, source, now, tokens, scale, strikes, blocked_until)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if was_throttled:
+            print(f"[!] {tool} was throttled, backing off {', '.join(sources)}")
+
+    def status(self):
+        """Return (source, tokens, effective rate per minute, blocked seconds) for known sources"""
+        conn = self.connect()
+        try:
+            now = time.time()
+            known = {row[0] for row in conn.execute("SELECT source FROM buckets")}
+            rows = []
+            for source in sorted(known | set(self.limits)):
+                tokens, scale, _, blocked_until = self.refill(conn, source, now)
+                rows.append((source, tokens, self.limit(source)['rate_per_minute'] * scale,
+                             max(0.0, blocked_until - now)))
+            return rows
+        finally:
+            conn.close()
+
+    def reset(self, sources=None):
+        """Forget backoff state, for all sources or the given ones"""
+        conn = self.connect()
+        if sources:
+            conn.executemany("DELETE FROM buckets WHERE source = ?", [(source,) for source in sources])
+        else:
+            conn.execute("DELETE FROM buckets")
+        conn.close()
+
+
+def main():
+    # Imported here, the linker itself imports this module
+    from multi_tool_linker import DEFAULT_CONFIG, load_config
+
+    parser = argparse.ArgumentParser(
+        description="Inspect or reset the shared upstream rate limits",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Tokens, current rate and cooldown per upstream source
+  %(prog)s status
+
+  # Clear backoff after changing API keys
+  %(prog)s reset hackertarget
+"""
+    )
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show every bucket")
+    reset_parser = subparsers.add_parser("reset", help="Clear backoff state")
+    reset_parser.add_argument("sources", nargs='*', help="Sources to reset (default: all)")
+
+    args = parser.parse_args()
+
+    try:
+        limiter = RateLimiter.from_config(load_config(args.config))
+        if args.command == "status":
+            for source, tokens, rate, blocked in limiter.status():
+                state = f", blocked for {blocked:.0f}s" if blocked else ""
+                print(f"{source}: {tokens:.2f} tokens, {rate:.2f}/min{state}")
+        else:
+            limiter.reset(args.sources)
+            print(f"[+] Reset {', '.join(args.sources) or 'all sources'}")
+    except sqlite3.OperationalError as e:
+        print(f"[-] Rate limit state error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Compressed storage for raw tool outputs
+
+Result files are written through streaming zstd or gzip compression when
+output.compress_results is set in config.json, and every parser opens them
+through open_result() so plain, .gz and .zst files read the same way.
+The migrate command compresses existing result trees in parallel.
+"""
+
+import argparse
+import gzip
+import io
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional, gzip is always available
+    zstandard = None
+
+EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
+CHUNK_SIZE = 1024 * 1024
+
+# Raw tool output by result directory and extension, the only files migrate compresses;
+# reports, Maltego and CSV exports and recon-ng resource files stay plain for people
+RESULT_FILES = {
+    'nmap': ('.xml', '.txt'),
+    'amass': ('.txt',),
+    'subfinder': ('.txt',),
+    'assetfinder': ('.txt',),
+    'dnsrecon': ('.txt',),
+    'fierce': ('.txt',),
+    'harvester': ('.json',),
+    'spiderfoot': ('.csv',),
+}
+
+# Written to the top of the result directory by enhanced_multi_tool.sh
+TOP_LEVEL_RESULTS = ('whatweb_', 'dirb_')
+
+
+def resolve_format(compression):
+    """Pick the compression format to use, falling back to gzip without zstandard"""
+    if compression == 'zstd' and zstandard is None:
+        return 'gzip'
+    return compression
+
+
+def compression_from_config(config):
+    """Return the configured compression format, or None when disabled"""
+    output_config = config.get('output', {})
+    if not output_config.get('compress_results'):
+        return None
+    return resolve_format(output_config.get('compression_format', 'zstd'))
+
+
+def find_result(path):
+    """Return the existing plain or compressed variant of path, or None"""
+    for candidate in (path, path + EXTENSIONS['zstd'], path + EXTENSIONS['gzip']):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def open_result(path, mode='rt'):
+    """Open a result file for reading, decompressing transparently"""
+    resolved = find_result(path)
+    if resolved is None:
+        raise FileNotFoundError(path)
+
+    with open(resolved, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        raw = gzip.open(resolved, 'rb')
+    elif magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {resolved}")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(resolved, 'rb'), closefd=True)
+    else:
+        raw = open(resolved, 'rb')
+
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+
+
+def open_result_writer(path, compression=None, mode='wt'):
+    """Open a result file for writing, compressing when compression is set"""
+    compression = resolve_format(compression) if compression else None
+
+    if compression == 'gzip':
+        raw = gzip.open(path + EXTENSIONS['gzip'], 'wb')
+    elif compression == 'zstd':
+        raw = zstandard.ZstdCompressor().stream_writer(open(path + EXTENSIONS['zstd'], 'wb'), closefd=True)
+    else:
+        raw = open(path, 'wb')
+
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+def compress_file(path, compression='zstd'):
+    """Compress path next to itself and remove the original, returns the new path"""
+    compression = resolve_format(compression)
+    target = path + EXTENSIONS[compression]
+
+    with open(path, 'rb') as src, open_result_writer(path, compression, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    shutil.copystat(path, target)
+    os.remove(path)
+    return target
+
+
+def iter_uncompressed(root):
+    """Yield raw tool output files under root that are not compressed yet"""
+    root = os.path.abspath(root)
+    for dirpath, _, filenames in os.walk(root):
+        extensions = RESULT_FILES.get(os.path.basename(dirpath))
+        if extensions:
+            wanted = [filename for filename in filenames if filename.endswith(extensions)]
+        elif dirpath == root:
+            wanted = [filename for filename in filenames
+                      if filename.startswith(TOP_LEVEL_RESULTS) and filename.endswith('.txt')]
+        else:
+            continue
+        for filename in wanted:
+            yield os.path.join(dirpath, filename)
+
+
+def migrate_tree(root, compression='zstd', workers=None):
+    """Compress every raw tool output file under root in parallel"""
+    compression = resolve_format(compression)
+    paths = list(iter_uncompressed(root))
+    print(f"[+] Compressing {len(paths)} result files under {root} with {compression}")
+
+    saved = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        sizes = [os.path.getsize(path) for path in paths]
+        for path, size, target in zip(paths, sizes, executor.map(compress_file, paths, [compression] * len(paths))):
+            saved += size - os.path.getsize(target)
+
+    print(f"[+] Compression saved {saved} bytes")
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compressed storage for raw tool outputs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compress an existing result tree using all cores
+  %(prog)s migrate ./enhanced_results
+
+  # Stream a result file, compressed or not
+  %(prog)s cat ./enhanced_results/nmap/nmap_example.com.txt
+"""
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Compress existing result files")
+    migrate_parser.add_argument("directory", help="Result directory to compress")
+    migrate_parser.add_argument("-f", "--format", choices=sorted(EXTENSIONS), default="zstd",
+                                help="Compression format")
+    migrate_parser.add_argument("-j", "--jobs", type=int, help="Parallel workers (default: CPU count)")
+
+    cat_parser = subparsers.add_parser("cat", help="Write a result file to stdout")
+    cat_parser.add_argument("files", nargs='+', help="Result files")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "migrate":
+            migrate_tree(args.directory, args.format, args.jobs)
+        else:
+            for path in args.files:
+                with open_result(path, 'rb') as f:
+                    shutil.copyfileobj(f, sys.stdout.buffer, CHUNK_SIZE)
+    except Exception as e:
+        print(f"[-] Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Run history and delta reports for the correlation database
+
+Each analysis run gets a run id. Every entity and relationship the run writes
+is recorded as a compact (run_id, row_id) membership row as it is written,
+relationships with their endpoint ids and type so edges pruned since can still
+be reported. The final confidence is filled in when the run finishes, so two runs can be
+compared with set-based SQL and only the difference written out. Writes by
+other processes during the run are not counted as the run's.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+RUN_HISTORY_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        target TEXT,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        report_dir TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS run_entities (
+        run_id INTEGER,
+        entity_id INTEGER,
+        confidence REAL,
+        PRIMARY KEY (run_id, entity_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS run_relationships (
+        run_id INTEGER,
+        relationship_id INTEGER,
+        confidence REAL,
+        entity1_id INTEGER,
+        entity2_id INTEGER,
+        relationship_type TEXT,
+        PRIMARY KEY (run_id, relationship_id)
+    ) WITHOUT ROWID
+    ''',
+]
+
+# Confidence moves smaller than this are not reported as changes
+CONFIDENCE_EPSILON = 1e-6
+
+
+def setup_run_history(conn):
+    """Create run history tables"""
+    for statement in RUN_HISTORY_SCHEMA:
+        conn.execute(statement)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(run_relationships)")]
+    if 'entity1_id' not in columns:
+        for column, column_type in (('entity1_id', 'INTEGER'), ('entity2_id', 'INTEGER'),
+                                    ('relationship_type', 'TEXT')):
+            conn.execute(f"ALTER TABLE run_relationships ADD COLUMN {column} {column_type}")
+        # Older runs only kept the relationship id, copy the edges that still exist
+        conn.execute('''
+            UPDATE run_relationships SET entity1_id = rel.entity1_id, entity2_id = rel.entity2_id,
+                                         relationship_type = rel.relationship_type
+            FROM relationships rel
+            WHERE rel.id = run_relationships.relationship_id
+        ''')
+    conn.commit()
+
+
+def start_run(conn, target):
+    """Record the start of a run, returns its id"""
+    cursor = conn.execute("INSERT INTO runs (target) VALUES (?)", (target,))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def record_run_entity(conn, run_id, name):
+    """Add the named entity to the run's membership"""
+    conn.execute(
+        "INSERT OR IGNORE INTO run_entities (run_id, entity_id) SELECT ?, id FROM entities WHERE name = ?",
+        (run_id, name)
+    )
+
+
+def record_run_relationship(conn, run_id, relationship_id, entity1_id, entity2_id, relationship_type):
+    """Add a relationship to the run's membership"""
+    conn.execute('''
+        INSERT OR IGNORE INTO run_relationships
+        (run_id, relationship_id, entity1_id, entity2_id, relationship_type)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (run_id, relationship_id, entity1_id, entity2_id, relationship_type))
+
+
+def finish_run(conn, run_id, report_dir=None):
+    """Store the final confidence of everything the run wrote and mark it finished"""
+    conn.execute('''
+        UPDATE run_entities SET confidence = e.confidence
+        FROM entities e
+        WHERE run_entities.run_id = ? AND e.id = run_entities.entity_id
+    ''', (run_id,))
+    conn.execute('''
+        UPDATE run_relationships SET confidence = rel.confidence
+        FROM relationships rel
+        WHERE run_relationships.run_id = ? AND rel.id = run_relationships.relationship_id
+    ''', (run_id,))
+    conn.execute(
+        "UPDATE runs SET finished_at = CURRENT_TIMESTAMP, report_dir = ? WHERE id = ?",
+        (report_dir, run_id)
+    )
+    conn.commit()
+
+
+def previous_run(conn, run_id):
+    """Return the last finished run for the same target before run_id"""
+    row = conn.execute('''
+        SELECT p.id FROM runs p
+        JOIN runs r ON r.id = ?
+        WHERE p.target = r.target AND p.id < r.id AND p.finished_at IS NOT NULL
+        ORDER BY p.id DESC LIMIT 1
+    ''', (run_id,)).fetchone()
+    return row[0] if row else None
+
+
+def entity_delta(conn, old_run, new_run):
+    """Return (added, removed, changed) entity rows between two runs"""
+    added = conn.execute('''
+        SELECT e.name, e.type, n.confidence
+        FROM run_entities n
+        JOIN entities e ON e.id = n.entity_id
+        WHERE n.run_id = ?
+        AND NOT EXISTS (SELECT 1 FROM run_entities o WHERE o.run_id = ? AND o.entity_id = n.entity_id)
+        ORDER BY e.type, e.name
+    ''', (new_run, old_run)).fetchall()
+
+    removed = conn.execute('''
+        SELECT COALESCE(e.name, '#' || o.entity_id), e.type, o.confidence
+        FROM run_entities o
+        LEFT JOIN entities e ON e.id = o.entity_id
+        WHERE o.run_id = ?
+        AND NOT EXISTS (SELECT 1 FROM run_entities n WHERE n.run_id = ? AND n.entity_id = o.entity_id)
+        ORDER BY e.type, e.name
+    ''', (old_run, new_run)).fetchall()
+
+    changed = conn.execute('''
+        SELECT e.name, e.type, o.confidence, n.confidence
+        FROM run_entities n
+        JOIN run_entities o ON o.run_id = ? AND o.entity_id = n.entity_id
+        JOIN entities e ON e.id = n.entity_id
+        WHERE n.run_id = ? AND ABS(n.confidence - o.confidence) > ?
+        ORDER BY e.type, e.name
+    ''', (old_run, new_run, CONFIDENCE_EPSILON)).fetchall()
+
+    return added, removed, changed
+
+
+def relationship_delta(conn, old_run, new_run):
+    """Return (added, removed, changed) relationship rows between two runs"""
+    # Endpoints come from the membership rows, so edges pruned since the run still print
+    def edge_columns(run):
+        return f'''
+            COALESCE(e1.name, '#' || {run}.entity1_id, 'relationship #' || {run}.relationship_id),
+            COALESCE(e2.name, '#' || {run}.entity2_id, 'relationship #' || {run}.relationship_id),
+            {run}.relationship_type
+        '''
+
+    def edge_joins(run):
+        return f'''
+            LEFT JOIN entities e1 ON e1.id = {run}.entity1_id
+            LEFT JOIN entities e2 ON e2.id = {run}.entity2_id
+        '''
+
+    # Ids of pruned relationships are reused, so the same id must also be the same edge
+    same_edge = '''
+        o.relationship_id = n.relationship_id AND o.entity1_id IS n.entity1_id
+        AND o.entity2_id IS n.entity2_id AND o.relationship_type IS n.relationship_type
+    '''
+
+    added = conn.execute(f'''
+        SELECT {edge_columns('n')}, n.confidence
+        FROM run_relationships n
+        {edge_joins('n')}
+        WHERE n.run_id = ?
+        AND NOT EXISTS (SELECT 1 FROM run_relationships o WHERE o.run_id = ? AND {same_edge})
+    ''', (new_run, old_run)).fetchall()
+
+    removed = conn.execute(f'''
+        SELECT {edge_columns('o')}, o.confidence
+        FROM run_relationships o
+        {edge_joins('o')}
+        WHERE o.run_id = ?
+        AND NOT EXISTS (SELECT 1 FROM run_relationships n WHERE n.run_id = ? AND {same_edge})
+    ''', (old_run, new_run)).fetchall()
+
+    changed = conn.execute(f'''
+        SELECT {edge_columns('n')}, o.confidence, n.confidence
+        FROM run_relationships n
+        JOIN run_relationships o ON o.run_id = ? AND {same_edge}
+        {edge_joins('n')}
+        WHERE n.run_id = ? AND ABS(n.confidence - o.confidence) > ?
+    ''', (old_run, new_run, CONFIDENCE_EPSILON)).fetchall()
+
+    return added, removed, changed
+
+
+def write_delta_report(conn, old_run, new_run, report_file):
+    """Write the differences between two runs, returns the number of changes"""
+    added, removed, changed = entity_delta(conn, old_run, new_run)
+    rel_added, rel_removed, rel_changed = relationship_delta(conn, old_run, new_run)
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+
+    with open(report_file, 'w') as f:
+        f.write("Run Delta Report\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"Generated: {datetime.now()}\n")
+        f.write(f"Runs: {old_run} -> {new_run}\n\n")
+
+        f.write(f"Entities added: {len(added)}\n")
+        for name, entity_type, confidence in added:
+            f.write(f"+ {name} ({entity_type}) [{confidence}]\n")
+        f.write(f"\nEntities removed: {len(removed)}\n")
+        for name, entity_type, confidence in removed:
+            f.write(f"- {name} ({entity_type}) [{confidence}]\n")
+        f.write(f"\nEntities changed: {len(changed)}\n")
+        for name, entity_type, old_confidence, new_confidence in changed:
+            f.write(f"~ {name} ({entity_type}) [{old_confidence} -> {new_confidence}]\n")
+
+        f.write(f"\nRelationships added: {len(rel_added)}\n")
+        for name1, name2, rel_type, confidence in rel_added:
+            f.write(f"+ {name1} <-> {name2} ({rel_type}) [{confidence}]\n")
+        f.write(f"\nRelationships removed: {len(rel_removed)}\n")
+        for name1, name2, rel_type, confidence in rel_removed:
+            f.write(f"- {name1} <-> {name2} ({rel_type}) [{confidence}]\n")
+        f.write(f"\nRelationships changed: {len(rel_changed)}\n")
+        for name1, name2, rel_type, old_confidence, new_confidence in rel_changed:
+            f.write(f"~ {name1} <-> {name2} ({rel_type}) [{old_confidence} -> {new_confidence}]\n")
+
+    total = sum(map(len, (added, removed, changed, rel_added, rel_removed, rel_changed)))
+    print(f"[+] Delta report ({total} changes) saved to {report_file}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect run history and compare runs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # List recorded runs
+  %(prog)s results/correlations.db list
+
+  # Compare the latest run with the previous run of the same target
+  %(prog)s results/correlations.db delta
+
+  # Compare two specific runs
+  %(prog)s results/correlations.db delta --from 3 --to 7 -o delta.txt
+"""
+    )
+    parser.add_argument("database", help="Path to correlations.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List recorded runs")
+
+    delta_parser = subparsers.add_parser("delta", help="Write the differences between two runs")
+    delta_parser.add_argument("--from", dest="old_run", type=int, help="Older run id (default: previous run)")
+    delta_parser.add_argument("--to", dest="new_run", type=int, help="Newer run id (default: latest run)")
+    delta_parser.add_argument("-o", "--output", default="delta_report.txt", help="Report file")
+
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(args.database)
+        setup_run_history(conn)
+
+        if args.command == "list":
+            for run in conn.execute("SELECT id, target, started_at, finished_at, report_dir FROM runs ORDER BY id"):
+                print(f"{run[0]}: {run[1]} started {run[2]} finished {run[3] or '-'} {run[4] or ''}")
+        else:
+            new_run = args.new_run
+            if new_run is None:
+                row = conn.execute("SELECT MAX(id) FROM runs WHERE finished_at IS NOT NULL").fetchone()
+                new_run = row[0]
+            old_run = args.old_run if args.old_run is not None else previous_run(conn, new_run)
+            if new_run is None or old_run is None:
+                print("[-] Need two finished runs to compare")
+                sys.exit(1)
+            write_delta_report(conn, old_run, new_run, args.output)
+
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print(f"[-] Database error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
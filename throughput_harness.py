@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end throughput harness
+
+Runs the whole pipeline (tool scheduling, ingestion, nmap ingest,
+correlation, scoring, Maltego export, report) against fake tool binaries that
+print realistic output for a synthetic target, so the Python-side stages can
+be timed without network access or the real tools installed. The fake tools
+draw overlapping subsets of one seeded host universe, like real sources do,
+and can sleep to stand in for tool latency. HTTP probing is turned off, it
+would only time out against the synthetic hosts, and so are the upstream rate
+limits.
+
+--rss checks that the streaming path (host list parser, entity writer, Maltego
+export) keeps peak RSS flat: it runs it in fresh processes at two input sizes
+and fails if the larger one peaks noticeably higher.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from attack_surface_monitor import HOSTNAME_LIST_TOOLS, result_file
+from multi_tool_linker import DEFAULT_CONFIG, EntityRecord, MultiToolLinker, load_config
+from tool_scheduler import DEFAULT_TOOLS, ToolScheduler
+
+DEFAULT_TARGET = 'harness.example'
+DEFAULT_HOSTS = 10000
+
+# Peak RSS may grow this much (KiB) when the input grows RSS_SCALE times
+RSS_SCALE = 4
+RSS_TOLERANCE_KB = 8192
+
+FAKE_TOOL_NAMES = ['theHarvester', 'recon-ng', 'sf.py', *DEFAULT_TOOLS]
+
+# One script for every tool, dispatching on the name it was started as
+FAKE_TOOL = r'''#!/usr/bin/env python3
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+hosts_total = int(os.environ.get('FAKE_TOOL_HOSTS', '1000'))
+latency = float(os.environ.get('FAKE_TOOL_LATENCY', '0'))
+seed = int(os.environ.get('FAKE_TOOL_SEED', '1'))
+tool = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+
+
+def option(flag, default=None):
+    return args[args.index(flag) + 1] if flag in args else default
+
+
+target = option('-d') or option('--domain') or option('-s') or (args[-1] if args else 'example.com')
+words = ['www', 'mail', 'vpn', 'api', 'dev', 'staging', 'app', 'portal', 'cdn', 'git', 'shop', 'intranet']
+
+
+def universe():
+    rng = random.Random(seed)
+    for index in range(hosts_total):
+        yield f"{rng.choice(words)}{index}.{rng.choice(['', 'eu.', 'us.', 'corp.'])}{target}", index
+
+
+def sample(share):
+    # Each tool sees its own overlapping share of the same hosts
+    rng = random.Random(f"{seed}-{tool}")
+    return [(host, index) for host, index in universe() if rng.random() < share]
+
+
+def address(index):
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+
+time.sleep(latency)
+out = sys.stdout
+
+if tool == 'theHarvester':
+    hosts = [target] + [host for host, _ in sample(0.5)]
+    emails = [f"user{index}@{target}" for index in range(max(1, hosts_total // 20))]
+    with open(option('-f'), 'w') as f:
+        json.dump({'emails': emails, 'hosts': hosts}, f)
+elif tool == 'recon-ng':
+    # The target and export path are in the resource file
+    with open(option('-r')) as f:
+        commands = f.read().splitlines()
+    target = [line.split()[-1] for line in commands if line.startswith('db insert domains')][0]
+    export = [line.split()[-1] for line in commands if line.startswith('export csv hosts')]
+    with open(export[0], 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['host', 'ip_address'])
+        for host, index in sample(0.4):
+            writer.writerow([host, address(index)])
+elif tool == 'sf.py':
+    out.write('Type,Data,Module\n')
+    for host, index in sample(0.3):
+        out.write(f"Domain,{host},sfp_dnsresolve\n")
+        out.write(f"IP_Address,{address(index)},sfp_dnsresolve\n")
+elif tool in ('amass', 'subfinder', 'assetfinder'):
+    for host, _ in sample(0.6):
+        out.write(f"{host}\n")
+elif tool == 'dnsrecon':
+    for host, index in sample(0.2):
+        out.write(f"[*] \t A {host} {address(index)}\n")
+elif tool == 'fierce':
+    out.write(f"NS: ns1.{target}.\nFound: ")
+    for host, index in sample(0.2):
+        out.write(f"{host}. ({address(index)})\n")
+elif tool == 'nmap':
+    out.write('<?xml version="1.0"?>\n<nmaprun scanner="nmap">\n')
+    for host, index in sample(0.3):
+        out.write(f'<host><status state="up"/><address addr="{address(index)}" addrtype="ipv4"/>'
+                  f'<hostnames><hostname name="{host}" type="PTR"/></hostnames><ports>'
+                  '<port protocol="tcp" portid="22"><state state="open"/><service name="ssh" product="OpenSSH"/></port>'
+                  '<port protocol="tcp" portid="443"><state state="open"/><service name="https" product="nginx"/></port>'
+                  '</ports><os><osmatch name="Linux 5.X" accuracy="95"/></os></host>\n')
+    out.write('</nmaprun>\n')
+else:
+    sys.exit(f"unknown fake tool {tool}")
+'''
+
+
+def install_fake_tools(bin_dir):
+    """Write the fake tool script and link every tool name to it"""
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.join(bin_dir, 'fake_tool.py')
+    with open(script, 'w') as f:
+        f.write(FAKE_TOOL)
+    os.chmod(script, 0o755)
+    for name in FAKE_TOOL_NAMES:
+        link = os.path.join(bin_dir, name)
+        if not os.path.exists(link):
+            os.symlink(script, link)
+    return bin_dir
+
+
+def count_records(db_path):
+    conn = sqlite3.connect(db_path)
+    entities = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+    relationships = conn.execute("SELECT COUNT(*) FROM relationships").fetchone()[0]
+    conn.close()
+    return entities, relationships
+
+
+def run_harness(workdir, hosts, latency, seed, config):
+    """Run scheduler and analysis against the fake tools
+
+    Returns (wall-clock timings, linker stage timings, (entities, relationships)).
+    """
+    bin_dir = install_fake_tools(os.path.join(workdir, 'bin'))
+    output_dir = os.path.join(workdir, 'results')
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    os.environ.update(FAKE_TOOL_HOSTS=str(hosts), FAKE_TOOL_LATENCY=str(latency), FAKE_TOOL_SEED=str(seed))
+
+    config = json.loads(json.dumps(config))
+    config.setdefault('probe', {})['enabled'] = False
+    # Synthetic hosts do not resolve anywhere
+    config.setdefault('wildcard_dns', {})['enabled'] = False
+    # Fake tools have no upstream quota to protect
+    config.setdefault('rate_limits', {})['enabled'] = False
+    config.setdefault('tools', {}).setdefault('spiderfoot', {})['path'] = os.path.join(bin_dir, 'sf.py')
+    for tool in DEFAULT_TOOLS:
+        config['tools'].setdefault(tool, {})['enabled'] = True
+
+    timings = {}
+    started = time.perf_counter()
+    ToolScheduler(DEFAULT_TARGET, output_dir, config).run(DEFAULT_TOOLS)
+    timings['scheduled_tools'] = time.perf_counter() - started
+
+    host_lists = [result_file(output_dir, tool, DEFAULT_TARGET) for tool in sorted(HOSTNAME_LIST_TOOLS)]
+    # Compressed variants written by the scheduler are resolved when the files are opened
+    nmap_files = [result_file(output_dir, 'nmap', DEFAULT_TARGET)]
+
+    linker = MultiToolLinker(output_dir, config=config)
+    started = time.perf_counter()
+    linker.run_analysis(DEFAULT_TARGET, host_lists=host_lists, nmap_files=nmap_files)
+    timings['analysis'] = time.perf_counter() - started
+
+    return timings, linker.stage_times, count_records(linker.db_path)
+
+
+def stream_peak_rss(workdir, hosts, bloom_capacity):
+    """Ingest and export a synthetic host list of the given size, returns peak RSS in KiB
+
+    Runs in a fresh process; the exact name filter is a set of every stored name
+    by design, so a Bloom filter of the same capacity is used at every size.
+    """
+    output_dir = os.path.join(workdir, f'rss_{hosts}')
+    shutil.rmtree(output_dir, ignore_errors=True)
+    config = {
+        'dedup': {'exact_limit': 0, 'bloom_capacity': bloom_capacity},
+        'probe': {'enabled': False},
+        'wildcard_dns': {'enabled': False},
+        'rate_limits': {'enabled': False},
+    }
+    linker = MultiToolLinker(output_dir, config=config)
+    host_list = os.path.join(output_dir, 'amass', f'amass_{DEFAULT_TARGET}.txt')
+    os.makedirs(os.path.dirname(host_list), exist_ok=True)
+    with open(host_list, 'w') as f:
+        for index in range(hosts):
+            f.write(f"host{index}.{DEFAULT_TARGET}\n")
+
+    linker.store_entities(linker.read_host_list(host_list, DEFAULT_TARGET), verbose=False)
+    conn = sqlite3.connect(linker.db_path)
+    cursor = conn.execute("SELECT name, type, source_tool, confidence FROM entities")
+    linker.create_maltego_transforms(map(EntityRecord._make, cursor))
+    conn.close()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def check_rss(workdir, hosts):
+    """Return (peak KiB at hosts, peak KiB at RSS_SCALE * hosts), each from a fresh process"""
+    peaks = []
+    for size in (hosts, hosts * RSS_SCALE):
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            peaks.append(pool.apply(stream_peak_rss, (workdir, size, 2 * hosts * RSS_SCALE)))
+    return tuple(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the full pipeline offline against fake tool binaries",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 10k synthetic hosts, tools answer instantly
+  %(prog)s
+
+  # 200k hosts with two seconds of simulated tool latency, keep the results
+  %(prog)s -n 200000 --latency 2 -w /tmp/harness
+
+  # Fail if peak RSS of the streaming path grows from 50k to 200k hosts
+  %(prog)s --rss -n 50000
+"""
+    )
+    parser.add_argument("-n", "--hosts", type=int, default=DEFAULT_HOSTS, help="Size of the synthetic host universe")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every fake tool sleeps before answering")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic hosts")
+    parser.add_argument("-w", "--workdir", help="Keep fake tools and results here instead of a temporary directory")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    parser.add_argument("--rss", action="store_true",
+                        help=f"Check peak RSS stays flat from N to {RSS_SCALE}N hosts instead of timing")
+
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mtl_harness_')
+    if args.rss:
+        try:
+            small, large = check_rss(workdir, args.hosts)
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        growth = large - small
+        print(f"\n[+] Peak RSS {small / 1024:.1f} MiB at {args.hosts} hosts, "
+              f"{large / 1024:.1f} MiB at {args.hosts * RSS_SCALE} hosts")
+        if growth > RSS_TOLERANCE_KB:
+            print(f"[-] Peak RSS grew {growth / 1024:.1f} MiB with the input, "
+                  f"more than {RSS_TOLERANCE_KB / 1024:.0f} MiB")
+            sys.exit(1)
+        print("[+] Peak RSS stays flat as the input grows")
+        return
+
+    try:
+        timings, stages, (entities, relationships) = run_harness(
+            workdir, args.hosts, args.latency, args.seed, load_config(args.config)
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    total = sum(timings.values())
+    print(f"\n[+] Throughput for {args.hosts} synthetic hosts ({entities} entities, {relationships} relationships)")
+    print(f"    {'scheduled_tools':<18} {timings['scheduled_tools']:8.2f}s")
+    for stage, seconds in stages.items():
+        rate = f"{entities / seconds:12.0f} entities/s" if seconds >= 0.01 else ''
+        print(f"    {stage:<18} {seconds:8.2f}s {rate}")
+    print(f"    {'end_to_end':<18} {total:8.2f}s {entities / total if total else 0:12.0f} entities/s")
+
+
+if __name__ == "__main__":
+    main()
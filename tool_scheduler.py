@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Resource-aware scheduler for the external recon tools
+
+Used by enhanced_multi_tool.sh instead of starting every tool at once. Each
+tool has a CPU and memory cost in config.json (scheduler.costs); a job is only
+admitted while the running jobs fit in the CPU/memory budget, and lighter jobs
+queued behind a blocked heavy one are started in the meantime. Children run
+niced and, when configured, under an address-space rlimit.
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from attack_surface_monitor import HOSTNAME_LIST_TOOLS, RESULT_EXTENSIONS, build_command, result_file
+from multi_tool_linker import DEFAULT_CONFIG, load_config
+from rate_limiter import RateLimiter, output_tail, throttled
+from result_storage import compress_file, compression_from_config
+
+DEFAULT_TOOLS = ['nmap', 'dnsrecon', 'fierce', 'amass', 'subfinder', 'assetfinder']
+
+DEFAULT_COST = {'cpu': 1.0, 'memory_mb': 256}
+DEFAULT_NICE = 10
+POLL_SECONDS = 0.5
+
+
+def available_memory_mb():
+    """Return MemAvailable from /proc/meminfo, or physical memory elsewhere"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+
+def child_limits(nice, max_memory_mb=None):
+    """Return a preexec_fn applying niceness and an address-space limit"""
+    def apply():
+        os.nice(nice)
+        if max_memory_mb:
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return apply
+
+
+class ToolScheduler:
+    def __init__(self, target, output_dir, config=None):
+        self.target = target
+        self.output_dir = output_dir
+        self.config = config or {}
+        self.compression = compression_from_config(self.config)
+
+        scheduler_config = self.config.get('scheduler', {})
+        self.cpu_budget = scheduler_config.get('cpu_budget') or os.cpu_count() or 1
+        self.memory_budget = scheduler_config.get('memory_budget_mb') or int(available_memory_mb() * 0.8)
+        self.nice = scheduler_config.get('nice', DEFAULT_NICE)
+        self.costs = scheduler_config.get('costs', {})
+        self.rate_limiter = RateLimiter.from_config(self.config)
+
+        self.pending = []
+        self.running = {}
+        self.cpu_used = 0.0
+        self.memory_used = 0
+
+    def cost(self, tool):
+        cost = dict(DEFAULT_COST)
+        cost.update(self.costs.get(tool, {}))
+        return cost
+
+    def fits(self, cost):
+        """True when cost fits in what is left of the budget"""
+        return (self.cpu_used + cost['cpu'] <= self.cpu_budget
+                and self.memory_used + cost['memory_mb'] <= self.memory_budget)
+
+    def queue_tools(self, tools):
+        """Queue installed tools, heaviest first so long jobs start early"""
+        tools_config = self.config.get('tools', {})
+        for tool in tools:
+            if not tools_config.get(tool, {}).get('enabled', True):
+                continue
+            if shutil.which(tool) is None:
+                print(f"[!] {tool} is not installed, skipping")
+                continue
+            self.pending.append(tool)
+        self.pending.sort(key=lambda tool: (self.cost(tool)['cpu'], self.cost(tool)['memory_mb']), reverse=True)
+
+    def start(self, tool):
+        cost = self.cost(tool)
+        tool_config = self.config.get('tools', {}).get(tool, {})
+        cmd = build_command(tool, self.target, tool_config.get('options', ''))
+
+        path = result_file(self.output_dir, tool, self.target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        output = open(path, 'wb')
+
+        # Hostname lists and XML are parsed, keep stderr out of those files but
+        # hold on to it, upstream rate-limit messages end up there
+        parsed = tool in HOSTNAME_LIST_TOOLS or tool in RESULT_EXTENSIONS
+        errors = tempfile.TemporaryFile() if parsed else None
+        process = subprocess.Popen(
+            cmd, stdout=output,
+            stderr=errors if parsed else subprocess.STDOUT,
+            preexec_fn=child_limits(cost.get('nice', self.nice), cost.get('max_memory_mb'))
+        )
+        output.close()
+
+        self.cpu_used += cost['cpu']
+        self.memory_used += cost['memory_mb']
+        self.running[tool] = (process, path, time.time(), tool_config.get('timeout'), errors)
+        print(f"[i] Running {tool} (cpu {cost['cpu']}, {cost['memory_mb']} MB)")
+
+    def was_throttled(self, tool, path, errors):
+        """Look for rate-limit responses in stderr and, unless it is XML, the result file"""
+        outputs = []
+        if errors is not None:
+            outputs.append(output_tail(errors))
+            errors.close()
+        # Port numbers in XML would match a bare 429
+        if tool not in RESULT_EXTENSIONS:
+            with open(path, 'rb') as f:
+                outputs.append(output_tail(f))
+        return throttled(*outputs)
+
+    def finish(self, tool, returncode, timed_out=False):
+        process, path, started, _, errors = self.running.pop(tool)
+        # Read before the result file is compressed
+        self.rate_limiter.report(tool, timed_out or self.was_throttled(tool, path, errors))
+        cost = self.cost(tool)
+        self.cpu_used -= cost['cpu']
+        self.memory_used -= cost['memory_mb']
+
+        if self.compression:
+            compress_file(path, self.compression)
+        if returncode == 0:
+            print(f"[+] {tool} completed in {time.time() - started:.0f}s")
+        else:
+            print(f"[-] {tool} exited with status {returncode} after {time.time() - started:.0f}s")
+
+    def dispatch(self):
+        """Start every pending job that fits, lighter jobs may pass a blocked heavy one"""
+        for tool in list(self.pending):
+            cost = self.cost(tool)
+            # A job larger than the whole budget still runs, on its own
+            if self.fits(cost) or not self.running:
+                # Out of upstream quota, stays queued and later jobs may pass it
+                if self.rate_limiter.try_acquire(tool) > 0:
+                    continue
+                self.pending.remove(tool)
+                self.start(tool)
+
+    def reap(self):
+        """Collect finished jobs and kill ones past their timeout"""
+        now = time.time()
+        for tool, (process, _, started, timeout, _) in list(self.running.items()):
+            returncode = process.poll()
+            timed_out = bool(returncode is None and timeout and now - started > timeout)
+            if timed_out:
+                print(f"[!] {tool} timed out after {timeout}s, killing it")
+                process.kill()
+                returncode = process.wait()
+            if returncode is not None:
+                self.finish(tool, returncode, timed_out)
+
+    def run(self, tools):
+        self.queue_tools(tools)
+        print(f"[+] Scheduling {len(self.pending)} tools within {self.cpu_budget} CPUs "
+              f"and {self.memory_budget} MB")
+        started = time.time()
+
+        try:
+            while self.pending or self.running:
+                self.dispatch()
+                time.sleep(POLL_SECONDS)
+                self.reap()
+        except KeyboardInterrupt:
+            print("\n[-] Interrupted, stopping running tools")
+            for process, _, _, _, _ in self.running.values():
+                process.kill()
+            raise
+
+        print(f"[+] All scheduled tools completed in {time.time() - started:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run external recon tools within a CPU/memory budget",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Run the default tool set against a target
+  %(prog)s example.com -o ./enhanced_results
+
+  # Run selected tools with a custom config
+  %(prog)s example.com -o ./results -c config.json -t amass subfinder
+"""
+    )
+    parser.add_argument("target", help="Target domain")
+    parser.add_argument("-o", "--output", default="./enhanced_results", help="Output directory")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Configuration file")
+    parser.add_argument("-t", "--tools", nargs='+', default=DEFAULT_TOOLS, help="Tools to run")
+
+    args = parser.parse_args()
+
+    try:
+        ToolScheduler(args.target, args.output, load_config(args.config)).run(args.tools)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
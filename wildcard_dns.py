@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Wildcard-DNS suppression for brute-forced hostnames
+
+fierce, dnsrecon and amass guess subdomains; against a zone with a wildcard
+record every guess resolves, so their results carry hundreds of thousands of
+hosts that are all the same catch-all answer. Before host lists are ingested,
+each parent zone is probed with a few random labels. A zone whose random names
+resolve has a wildcard, and the addresses and CNAME targets they resolve to are
+its fingerprint. Hosts under such a zone are resolved in bulk, and the ones
+whose answers are all in the fingerprint are dropped, or collapsed into one
+representative host per zone. Queries go over one UDP socket to a single
+resolver with bounded concurrency, so the filter can be run offline against
+the stub server in this module (wildcard_dns.py stub).
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import random
+import socketserver
+import string
+import struct
+import sys
+from collections import Counter
+
+from partitioned_correlation import registrable_domain
+
+DEFAULT_PROBES = 3
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_RETRIES = 2
+DEFAULT_CONCURRENCY = 100
+DEFAULT_BATCH_SIZE = 20000
+RESOLV_CONF = '/etc/resolv.conf'
+
+HEADER = struct.Struct('!HHHHHH')
+RECORD_TYPES = {'A': 1, 'CNAME': 5, 'AAAA': 28}
+RECORD_NAMES = {code: name for name, code in RECORD_TYPES.items()}
+RCODE_NXDOMAIN = 3
+
+LABEL_CHARS = string.ascii_lowercase + string.digits
+
+
+def random_label(length=16):
+    return ''.join(random.choices(LABEL_CHARS, k=length))
+
+
+def encode_name(name):
+    labels = [label.encode('ascii') for label in name.rstrip('.').split('.') if label]
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\0'
+
+
+def decode_name(message, offset):
+    """Read a possibly compressed name, returns (name, offset after it)"""
+    labels = []
+    end = None
+    # Bounded so a pointer loop in a hostile answer cannot spin forever
+    for _ in range(128):
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            return '.'.join(labels).lower(), end if end is not None else offset
+        labels.append(message[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    raise ValueError("DNS name compression loop")
+
+
+def build_query(query_id, name, record_type):
+    # Recursion desired, one question
+    return HEADER.pack(query_id, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack('!HH', record_type, 1)
+
+
+def parse_response(message):
+    """Return (query id, question name, rcode, [(type, value)]) keeping A, AAAA and CNAME answers"""
+    query_id, flags, questions, answer_count, _, _ = HEADER.unpack_from(message)
+    offset = HEADER.size
+    name = None
+    for _ in range(questions):
+        name, offset = decode_name(message, offset)
+        offset += 4
+
+    answers = []
+    for _ in range(answer_count):
+        _, offset = decode_name(message, offset)
+        record_type, _, _, length = struct.unpack_from('!HHIH', message, offset)
+        offset += 10
+        rdata = message[offset:offset + length]
+        if record_type == RECORD_TYPES['A'] and length == 4:
+            answers.append(('A', str(ipaddress.IPv4Address(rdata))))
+        elif record_type == RECORD_TYPES['AAAA'] and length == 16:
+            answers.append(('AAAA', str(ipaddress.IPv6Address(rdata))))
+        elif record_type == RECORD_TYPES['CNAME']:
+            answers.append(('CNAME', decode_name(message, offset)[0]))
+        offset += length
+    return query_id, name, flags & 0xF, answers
+
+
+def system_resolver(path=RESOLV_CONF):
+    """First nameserver in resolv.conf, or None"""
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1]
+    except OSError:
+        pass
+    return None
+
+
+def parse_resolver(resolver):
+    """(host, port) from 'host', 'host:port' or '[v6]:port', the system resolver when empty"""
+    resolver = resolver or system_resolver()
+    if not resolver:
+        return None
+    if resolver.startswith('['):
+        host, _, port = resolver[1:].partition(']')
+        return host, int(port.lstrip(':') or 53)
+    if resolver.count(':') == 1:
+        host, port = resolver.split(':')
+        return host, int(port)
+    return resolver, 53
+
+
+def parent_zone(name):
+    """Zone a wildcard covering name would sit in, None at or above the registrable domain"""
+    domain = registrable_domain(name)
+    if domain is None or name == domain:
+        return None
+    return name.split('.', 1)[1]
+
+
+class DnsClient(asyncio.DatagramProtocol):
+    """Many queries in flight over one UDP socket, matched by query id and name"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            query_id, name, rcode, answers = parse_response(data)
+        except (IndexError, ValueError, struct.error):
+            return
+        expected = self.pending.get(query_id)
+        # A late answer to an id reused since then is for another name
+        if expected is not None and expected[0] == name and not expected[1].done():
+            expected[1].set_result((rcode, answers))
+
+    def error_received(self, exc):
+        # ICMP unreachable and friends, the query just times out
+        pass
+
+    def new_id(self):
+        while True:
+            query_id = random.getrandbits(16)
+            if query_id not in self.pending:
+                return query_id
+
+    async def query(self, name, record_type):
+        """(rcode, answers) for one question, None when the resolver never answered"""
+        loop = asyncio.get_running_loop()
+        for _ in range(self.retries + 1):
+            query_id = self.new_id()
+            future = loop.create_future()
+            self.pending[query_id] = (name, future)
+            self.transport.sendto(build_query(query_id, name, record_type))
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                del self.pending[query_id]
+        return None
+
+    async def resolve(self, name):
+        """Addresses and CNAME targets of name, empty if it does not exist, None if unknown"""
+        result = await self.query(name, RECORD_TYPES['A'])
+        if result is not None and result[0] == 0 and not result[1]:
+            # IPv6-only names
+            result = await self.query(name, RECORD_TYPES['AAAA'])
+        if result is None or result[0] not in (0, RCODE_NXDOMAIN):
+            return None
+        return frozenset(value for _, value in result[1])
+
+
+async def resolve_all(names, resolver, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                      retries=DEFAULT_RETRIES):
+    """Return {name: answers} for names, see DnsClient.resolve"""
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(
+        lambda: DnsClient(timeout, retries), remote_addr=resolver
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve_one(name):
+        async with semaphore:
+            return name, await client.resolve(name)
+
+    try:
+        return dict(await asyncio.gather(*(resolve_one(name) for name in names)))
+    finally:
+        transport.close()
+
+
+class WildcardFilter:
+    """Leaves out host records whose answers are all their zone's wildcard answers"""
+
+    def __init__(self, resolver, probes=DEFAULT_PROBES, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE, collapse=False):
+        self.resolver = resolver
+        self.probes = probes
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.collapse = collapse
+        # zone -> wildcard answers, empty when random names under the zone do not resolve
+        self.fingerprints = {}
+        # Zones already represented by a kept host in collapse mode
+        self.collapsed = set()
+
+    @classmethod
+    def from_config(cls, config):
+        """Filter for a wildcard_dns config block, None when no resolver is configured or found"""
+        resolver = parse_resolver(config.get('resolver'))
+        if resolver is None:
+            return None
+        return cls(
+            resolver,
+            probes=config.get('probes', DEFAULT_PROBES),
+            timeout=config.get('timeout', DEFAULT_TIMEOUT),
+            retries=config.get('retries', DEFAULT_RETRIES),
+            concurrency=config.get('concurrency', DEFAULT_CONCURRENCY),
+            batch_size=config.get('batch_size', DEFAULT_BATCH_SIZE),
+            collapse=config.get('mode', 'drop') == 'collapse'
+        )
+
+    def resolve(self, names):
+        return asyncio.run(resolve_all(names, self.resolver, self.concurrency, self.timeout, self.retries))
+
+    def probe_zones(self, zones):
+        """Fingerprint zones not seen before by resolving random labels under them"""
+        probes = {f"{random_label()}.{zone}": zone
+                  for zone in zones if zone not in self.fingerprints for _ in range(self.probes)}
+        if not probes:
+            return
+        fingerprints = {zone: set() for zone in probes.values()}
+        for name, answers in self.resolve(list(probes)).items():
+            fingerprints[probes[name]].update(answers or ())
+        for zone, fingerprint in fingerprints.items():
+            self.fingerprints[zone] = frozenset(fingerprint)
+
+    def filter(self, records, stats=None, zones=None):
+        """Yield records minus suppressed hosts, in batches of batch_size
+
+        stats counts 'hosts' seen, 'resolved' hosts under wildcard zones and
+        'suppressed' hosts; zones counts suppressed hosts per wildcard zone.
+        """
+        stats = Counter() if stats is None else stats
+        zones = Counter() if zones is None else zones
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            yield from self.filter_batch(batch, stats, zones)
+
+    def filter_batch(self, batch, stats, zones):
+        hosts = {}
+        for i, record in enumerate(batch):
+            if record.type == 'host':
+                name = record.name.strip().lower().rstrip('.')
+                zone = parent_zone(name)
+                if zone is not None:
+                    hosts[i] = (name, zone)
+        stats['hosts'] += sum(record.type == 'host' for record in batch)
+
+        self.probe_zones({zone for _, zone in hosts.values()})
+        hosts = {i: host for i, host in hosts.items() if self.fingerprints[host[1]]}
+        answers = self.resolve({name for name, _ in hosts.values()}) if hosts else {}
+        stats['resolved'] += len(answers)
+
+        for i, record in enumerate(batch):
+            if i in hosts:
+                name, zone = hosts[i]
+                found = answers[name]
+                # Unresolvable hosts are kept, only a proven wildcard answer is suppressed
+                if found and found <= self.fingerprints[zone]:
+                    if self.collapse and zone not in self.collapsed:
+                        self.collapsed.add(zone)
+                    else:
+                        stats['suppressed'] += 1
+                        zones[zone] += 1
+                        continue
+            yield record
+
+
+class StubDNSServer(socketserver.ThreadingUDPServer):
+    """Answers A, AAAA and CNAME queries from a fixed table, for running the filter offline
+
+    records maps names, or '*.zone' wildcards, to lists of (type, value).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, records, address=('127.0.0.1', 0)):
+        self.records = records
+        super().__init__(address, StubDNSHandler)
+
+    def lookup(self, name):
+        """Records for name, None for NXDOMAIN"""
+        if name in self.records:
+            return self.records[name]
+        labels = name.split('.')
+        for i in range(1, len(labels)):
+            suffix = '.'.join(labels[i:])
+            if '*.' + suffix in self.records:
+                return self.records['*.' + suffix]
+            # An existing name between the query and a wildcard above it blocks the wildcard
+            if suffix in self.records:
+                return None
+        return None
+
+    def answer(self, message):
+        query_id, _, _, _, _, _ = HEADER.unpack_from(message)
+        name, offset = decode_name(message, HEADER.size)
+        record_type, _ = struct.unpack_from('!HH', message, offset)
+        records = self.lookup(name)
+        answers = [(rtype, value) for rtype, value in records or ()
+                   if RECORD_TYPES[rtype] == record_type or rtype == 'CNAME']
+
+        body = b''
+        for rtype, value in answers:
+            rdata = encode_name(value) if rtype == 'CNAME' else ipaddress.ip_address(value).packed
+            # Owner name is a pointer to the question
+            body += struct.pack('!HHHIH', 0xC00C, RECORD_TYPES[rtype], 1, 60, len(rdata)) + rdata
+        flags = 0x8180 | (RCODE_NXDOMAIN if records is None else 0)
+        return HEADER.pack(query_id, flags, 1, len(answers), 0, 0) + message[HEADER.size:offset + 4] + body
+
+
+class StubDNSHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        message, sock = self.request
+        try:
+            response = self.server.answer(message)
+        except (IndexError, KeyError, ValueError, struct.error):
+            return
+        sock.sendto(response, self.client_address)
+
+
+def parse_record(spec):
+    """('name', [(type, value)]) from 'name=value[,value...]', values are IPs or CNAME targets"""
+    name, _, values = spec.partition('=')
+    records = []
+    for value in filter(None, values.split(',')):
+        try:
+            records.append(('AAAA' if ipaddress.ip_address(value).version == 6 else 'A', value))
+        except ValueError:
+            records.append(('CNAME', value.lower().rstrip('.')))
+    return name.lower().rstrip('.'), records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detect wildcard DNS zones and suppress brute-forced hostnames that hit them",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Wildcard answers of a few zones, through the system resolver
+  %(prog)s probe example.com dev.example.com
+
+  # Filter an amass, dnsrecon or fierce result, keeping the real hosts
+  %(prog)s filter results/amass/amass_example.com.txt -d example.com -o real_hosts.txt
+
+  # Offline: a stub server with a wildcard and one real host, then filter against it
+  %(prog)s stub --listen 127.0.0.1:5353 --record '*.example.com=203.0.113.7' \\
+      --record www.example.com=192.0.2.10 &
+  %(prog)s filter hosts.txt -d example.com -r 127.0.0.1:5353
+"""
+    )
+    parser.add_argument("-r", "--resolver", help="Resolver as host[:port] (default: first resolv.conf nameserver)")
+    parser.add_argument("--probes", type=int, default=DEFAULT_PROBES, help="Random labels resolved per zone")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds to wait per query")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Queries in flight at once")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    probe_parser = subparsers.add_parser("probe", help="Print the wildcard answers of zones")
+    probe_parser.add_argument("zones", nargs='+', help="Zones to probe")
+
+    filter_parser = subparsers.add_parser("filter", help="Suppress wildcard hosts in a result file")
+    filter_parser.add_argument("results", help="amass, subfinder, dnsrecon or fierce output")
+    filter_parser.add_argument("-d", "--domain", required=True, help="Target domain of the results")
+    filter_parser.add_argument("-o", "--output", help="Write kept hostnames here")
+    filter_parser.add_argument("--collapse", action="store_true",
+                               help="Keep one host per wildcard zone instead of none")
+
+    stub_parser = subparsers.add_parser("stub", help="Serve a fixed record table for offline tests")
+    stub_parser.add_argument("--listen", default="127.0.0.1:5353", help="Address to serve on")
+    stub_parser.add_argument("--record", action="append", default=[], metavar="NAME=VALUE[,VALUE]",
+                             help="A/AAAA address or CNAME target, NAME may be *.zone (repeatable)")
+
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        server = StubDNSServer(dict(map(parse_record, args.record)), parse_resolver(args.listen))
+        print(f"[i] Stub DNS server on {args.listen}, {len(server.records)} names")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return
+
+    resolver = parse_resolver(args.resolver)
+    if resolver is None:
+        print("[-] No resolver given and none found in resolv.conf")
+        sys.exit(1)
+    wildcard_filter = WildcardFilter(resolver, probes=args.probes, timeout=args.timeout,
+                                     concurrency=args.concurrency,
+                                     collapse=getattr(args, 'collapse', False))
+
+    if args.command == "probe":
+        wildcard_filter.probe_zones(args.zones)
+        for zone in args.zones:
+            answers = wildcard_filter.fingerprints[zone]
+            print(f"*.{zone}: {', '.join(sorted(answers)) if answers else 'no wildcard'}")
+        return
+
+    # Imported here, the linker imports this module
+    from multi_tool_linker import parse_hostname_list
+    from result_storage import open_result
+
+    stats, zones = Counter(), Counter()
+    try:
+        with open_result(args.results) as f:
+            records = parse_hostname_list(f, args.domain.lower(), 'hostlist')
+            kept = [record.name for record in wildcard_filter.filter(records, stats, zones)]
+    except FileNotFoundError:
+        print(f"[-] {args.results} not found")
+        sys.exit(1)
+
+    print(f"[+] {stats['suppressed']} of {stats['hosts']} hosts suppressed, {len(kept)} kept "
+          f"({stats['resolved']} resolved under wildcard zones)")
+    for zone, count in zones.most_common():
+        print(f"    *.{zone} -> {', '.join(sorted(wildcard_filter.fingerprints[zone]))}: {count}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.writelines(f"{name}\n" for name in kept)
+        print(f"[+] Kept hosts written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()